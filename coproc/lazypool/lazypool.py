@@ -16,8 +16,8 @@ from .staticmapprocess import StaticMapProcess, SliceMessage, MapResultMessage
 from ..workerresourcepool import WorkerResourcePool
 
 class LazyPool(typing.Generic[SendPayloadType, RecvPayloadType]):
-    def __init__(self, n: int, verbose: bool = False):
-        self.pool = WorkerResourcePool.new(n, StaticMapProcess, MultiMessenger)
+    def __init__(self, n: int, verbose: bool = False, messenger_kwargs: typing.Optional[typing.Dict[str, typing.Any]] = None):
+        self.pool = WorkerResourcePool.new(n, StaticMapProcess, MultiMessenger, messenger_kwargs=messenger_kwargs)
         self.start_kwargs = {
             'verbose': verbose,
         }
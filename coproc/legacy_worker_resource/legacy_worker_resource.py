@@ -16,6 +16,7 @@ class LegacyWorkerResource(typing.Generic[SendPayloadType, RecvPayloadType]):
     worker_process_type: typing.Type[BaseWorkerProcess]
     messenger_type: typing.Type[PriorityMessenger] = PriorityMessenger
     method: typing.Optional[typing.Literal['forkserver', 'spawn', 'fork']] = None
+    messenger_kwargs: typing.Dict[str, typing.Any] = dataclasses.field(default_factory=dict) # passed to messenger_type.new_pair
     _proc: typing.Optional[multiprocessing.Process] = None
     _messenger: typing.Optional[PriorityMessenger] = None
     
@@ -48,7 +49,7 @@ class LegacyWorkerResource(typing.Generic[SendPayloadType, RecvPayloadType]):
         return self.proc.start()
     
     def join(self, check_alive=True):
-        '''Request that the process close and then wait for it to die.'''
+        '''Request that the process close, wait for it to die, then close the messenger.'''
         if check_alive and not self.is_alive():
             raise WorkerIsAlreadyDeadError(f'Worker {self.pid} cannot be joined because it is not alive.')
         self.messenger.receive_available() # receive in case errors should be thrown
@@ -56,17 +57,19 @@ class LegacyWorkerResource(typing.Generic[SendPayloadType, RecvPayloadType]):
             self.messenger.send_close_request()
         except (EOFError, BrokenPipeError) as e:
             pass
-        return self.proc.join()
+        self.proc.join()
+        self.messenger.close()
 
     def terminate(self, check_alive=True):
-        '''Send terminate signal to worker.'''
+        '''Send terminate signal to worker and close the messenger.'''
         if check_alive and not self.proc.is_alive():
             raise WorkerIsAlreadyDeadError(f'Worker {self.pid} cannot be terminated because it is not alive.')
         try:
             self.messenger.send_close_request()
         except (EOFError, BrokenPipeError) as e:
             pass
-        return self.proc.terminate()
+        self.proc.terminate()
+        self.messenger.close()
 
     def is_alive(self, *arsg, **kwargs):
         '''Get status of process.'''
@@ -94,7 +97,7 @@ class LegacyWorkerResource(typing.Generic[SendPayloadType, RecvPayloadType]):
     ) -> typing.Tuple[PriorityMessenger, multiprocessing.context.ForkServerContext]:
         '''Get a messenger, process pair. Best to refresh the whole thing.'''
         ctx: multiprocessing.context.ForkServerContext = multiprocessing.get_context(method=self.method)
-        process_messenger, resource_messenger = self.messenger_type.new_pair()
+        process_messenger, resource_messenger = self.messenger_type.new_pair(ctx=ctx, **self.messenger_kwargs)
         target = self.worker_process_type(
             messenger = process_messenger, 
             **worker_kwargs,
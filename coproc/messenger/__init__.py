@@ -2,5 +2,15 @@ from .messages import *
 from .prioritymessenger import PriorityMessenger
 from .queue import *
 from .multimessenger import MultiMessenger
-from .exceptions import ResourceRequestedClose, MessageNotRecognizedError
+from .messengerselector import MessengerSelector
+from .asyncmessenger import AsyncMultiMessenger, AsyncPriorityMessenger
+from .threadsafemessenger import ThreadSafeMultiMessenger, ThreadSafePriorityMessenger
+from .exceptions import ResourceRequestedClose, MessageNotRecognizedError, CodecNotRegisteredError, PeerDeadError
+from .codecs import Codec, StructCodec, CodecRegistry
+from .compression import AdaptiveCompressor, CompressionStats
+from .dedup import DedupStats
+from .requestctr import ChannelMetrics, LatencyStats
+from .replyfuture import ReplyFuture
+from .bytestream import ByteStream
+from .transport import SharedMemoryConnection, new_connection_pair, SocketListener
 
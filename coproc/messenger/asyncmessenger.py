@@ -0,0 +1,252 @@
+from __future__ import annotations
+import asyncio
+import collections
+import dataclasses
+import multiprocessing.connection
+import os
+import struct
+import typing
+import weakref
+
+from .messages import Message, SendPayloadType, RecvPayloadType, DataMessage
+from .queue import ChannelID, PriorityMultiQueue
+from .multimessenger import MultiMessenger
+from .prioritymessenger import PriorityMessenger
+
+
+@dataclasses.dataclass
+class AsyncMultiMessenger(MultiMessenger, typing.Generic[SendPayloadType, RecvPayloadType]):
+    '''MultiMessenger driven by a running asyncio event loop.
+        Receives await readability of the pipe registered with loop.add_reader, and sends
+        made while a loop is running are queued and written as the pipe becomes writable
+        (in parts if the pipe cannot take a whole message), so one loop can serve many
+        messengers. Outside of a running loop (e.g. in the
+        worker process) it behaves like MultiMessenger.
+    '''
+    _outbox: collections.deque[Message] = dataclasses.field(default_factory=collections.deque, repr=False)
+    _wbuf: collections.deque[typing.Union[bytes, memoryview]] = dataclasses.field(default_factory=collections.deque, repr=False) # serialized bytes not yet written, with length headers
+    _readers: typing.List[asyncio.Future] = dataclasses.field(default_factory=list, repr=False)
+    _drainers: typing.List[asyncio.Future] = dataclasses.field(default_factory=list, repr=False)
+    _send_error: typing.Optional[BaseException] = dataclasses.field(default=None, repr=False)
+    _flush_handle: typing.Optional[asyncio.TimerHandle] = dataclasses.field(default=None, repr=False) # flushes coalesced replies from the running loop
+
+    def __getstate__(self) -> dict:
+        '''The loop's timer handle is not sent to the worker process.'''
+        state = super().__getstate__()
+        del state['_flush_handle']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        super().__setstate__(state)
+        self._flush_handle = None
+
+    ############### Receiving ###############
+    async def receive(self, channel_id: ChannelID = None) -> RecvPayloadType:
+        '''Wait for the next payload on this channel without blocking the event loop.'''
+        return (await self.receive_message(channel_id=channel_id)).payload
+
+    async def receive_message(self, channel_id: ChannelID = None) -> DataMessage:
+        '''Wait for the next data message on this channel without blocking the event loop.'''
+        while True:
+            self._receive_and_handle_available()
+            if not self.queue.empty(channel_id=channel_id):
+                return self.pop_from_queue(channel_id=channel_id)
+            if self.heartbeat_interval is None:
+                await self._wait_readable()
+                continue
+            self.check_peer()
+            try:
+                await asyncio.wait_for(self._wait_readable(), self.heartbeat_interval / 2)
+            except asyncio.TimeoutError:
+                pass # wake up to send heartbeats and check on the peer
+
+    async def receive_remaining(self, channel_id: ChannelID = None) -> typing.AsyncGenerator[RecvPayloadType]:
+        '''Receive until the requested number of results have been received.'''
+        async for m in self.receive_remaining_messages(channel_id=channel_id):
+            yield m.payload
+
+    async def receive_remaining_messages(self, channel_id: ChannelID = None) -> typing.AsyncGenerator[DataMessage]:
+        while self.remaining(channel_id) > 0:
+            yield await self.receive_message(channel_id=channel_id)
+
+    async def _wait_readable(self) -> None:
+        '''Wait until the pipe has data. Concurrent waiters share one reader registration.'''
+        self._flush_before_wait()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        if not self._readers:
+            for fd in self._read_filenos():
+                loop.add_reader(fd, self._on_readable, loop)
+        self._readers.append(fut)
+        try:
+            await fut
+        finally:
+            if fut in self._readers:
+                self._readers.remove(fut)
+            if not self._readers:
+                for fd in self._read_filenos():
+                    loop.remove_reader(fd)
+
+    def _on_readable(self, loop: asyncio.AbstractEventLoop) -> None:
+        for fd in self._read_filenos():
+            loop.remove_reader(fd)
+        readers, self._readers = self._readers, list()
+        for fut in readers:
+            if not fut.done():
+                fut.set_result(None)
+
+    ############### Sending ###############
+    def _schedule_flush(self, delay: float) -> None:
+        '''Flush coalesced replies in delay seconds from the running loop, or from a timer thread if none is running.'''
+        loop = self._running_loop()
+        if loop is None:
+            return super()._schedule_flush(delay)
+        self._flush_handle = loop.call_later(delay, AsyncMultiMessenger._flush_on_loop, weakref.ref(self))
+
+    @staticmethod
+    def _flush_on_loop(ref: weakref.ref) -> None:
+        '''Flush the coalesced replies of the messenger, if it is still alive.'''
+        messenger = ref()
+        if messenger is not None:
+            messenger._flush_from_timer()
+
+    def _cancel_flush_timer(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        super()._cancel_flush_timer()
+
+    def _pipe_send(self, msg: Message) -> None:
+        '''Queue message for the event loop to write, or send directly if no loop is running.'''
+        self._raise_send_error()
+        loop = self._running_loop()
+        if loop is None and not self._outbox and not self._wbuf:
+            return super()._pipe_send(msg)
+
+        self._outbox.append(msg)
+        if loop is None:
+            self._write_outbox(block=True)
+        elif len(self._outbox) == 1 and not self._wbuf:
+            loop.add_writer(self._fileno(), self._on_writable, loop)
+
+    async def drain(self) -> None:
+        '''Wait until all queued messages have been written to the pipe.'''
+        self.flush()
+        self._raise_send_error()
+        if not self._outbox and not self._wbuf:
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._drainers.append(fut)
+        await fut
+
+    def outbox_size(self) -> int:
+        '''Number of messages queued but not yet fully written to the pipe.'''
+        return len(self._outbox) + (1 if self._wbuf else 0)
+
+    def _wait(self, deadline: typing.Optional[float]) -> bool:
+        '''Before a blocking wait on the peer (for flow control credit, say), write the queued
+            messages: the peer may need them to answer.
+        '''
+        if self._outbox or self._wbuf:
+            self._write_outbox(block=True)
+        return super()._wait(deadline)
+
+    def _on_writable(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            self._write_outbox(block=False)
+        except BaseException as e:
+            self._send_error = e
+            self._outbox.clear()
+            self._wbuf.clear()
+
+        if not self._outbox and not self._wbuf:
+            loop.remove_writer(self._fileno())
+            drainers, self._drainers = self._drainers, list()
+            for fut in drainers:
+                if fut.done():
+                    continue
+                if self._send_error is not None:
+                    fut.set_exception(self._send_error)
+                else:
+                    fut.set_result(None)
+
+    def _write_outbox(self, block: bool) -> None:
+        '''Write queued messages. Unless block, each message is serialized into the write 
+            buffer and written only as far as the pipe accepts it, so a message larger than 
+            the pipe buffer is written over several callbacks instead of stalling the loop.
+        '''
+        while True:
+            if self._wbuf and not self._write_buffered(block):
+                return
+            if not self._outbox:
+                return
+            if block:
+                super()._pipe_send(self._outbox.popleft())
+            else:
+                rest = self._pipe_write(self._outbox.popleft())
+                self._outbox.extendleft(reversed(rest or ())) # chunks go before anything queued after them
+
+    def _write_frames(self, pipe: multiprocessing.connection.Connection, frames: typing.Sequence[typing.Any]) -> None:
+        '''Inside a running loop, data lane frames are added to the write buffer with the 
+            length header send_bytes would write, to be written by _write_buffered.
+        '''
+        if pipe is not self.pipe or self._running_loop() is None:
+            return super()._write_frames(pipe, frames)
+        for frame in frames:
+            view = memoryview(frame).cast('B')
+            self._wbuf.append(struct.pack('!i', len(view)) if len(view) <= 0x7fffffff else struct.pack('!iQ', -1, len(view)))
+            self._wbuf.append(view)
+
+    def _write_buffered(self, block: bool) -> bool:
+        '''Write the write buffer to the pipe. Unless block, the descriptor is made 
+            non-blocking and writing stops when the pipe is full. Returns whether all was written.
+        '''
+        fd = self._fileno()
+        if not block:
+            os.set_blocking(fd, False)
+        try:
+            while self._wbuf:
+                try:
+                    n = os.write(fd, self._wbuf[0])
+                except BlockingIOError:
+                    return False
+                if n < len(self._wbuf[0]):
+                    self._wbuf[0] = memoryview(self._wbuf[0])[n:]
+                else:
+                    self._wbuf.popleft()
+            return True
+        finally:
+            if not block:
+                os.set_blocking(fd, True)
+
+    def _raise_send_error(self) -> None:
+        if self._send_error is not None:
+            e, self._send_error = self._send_error, None
+            raise e
+
+    ############### Helpers ###############
+    def _read_filenos(self) -> typing.List[int]:
+        '''Descriptors to wait on for reads: the data pipe and the control lane if there is one.'''
+        if self.control_pipe is None:
+            return [self._fileno()]
+        return [self._fileno(), self.control_pipe.fileno()]
+
+    def _fileno(self) -> int:
+        try:
+            return self.pipe.fileno()
+        except AttributeError as e:
+            raise TypeError(f'{type(self).__name__} requires a connection with a file descriptor '
+                f'(e.g. transport="pipe"), not {type(self.pipe).__name__}.') from e
+
+    @staticmethod
+    def _running_loop() -> typing.Optional[asyncio.AbstractEventLoop]:
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+
+@dataclasses.dataclass
+class AsyncPriorityMessenger(AsyncMultiMessenger, PriorityMessenger, typing.Generic[SendPayloadType, RecvPayloadType]):
+    '''PriorityMessenger driven by a running asyncio event loop.'''
+    queue: PriorityMultiQueue[Message] = dataclasses.field(default_factory=PriorityMultiQueue)
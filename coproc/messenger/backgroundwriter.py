@@ -0,0 +1,97 @@
+from __future__ import annotations
+import itertools
+import queue
+import threading
+import traceback
+import typing
+import weakref
+
+from .messages import Message
+
+
+class BackgroundWriter:
+    '''Sends messages from a daemon thread so callers do not wait on pickling or the pipe.
+        Messages are sent in the order they were put, or if prioritize is set, lowest
+        priority first (in put order within a priority). send may return follow-up
+        messages (chunks of a large message); they are sent next in FIFO mode, and in
+        priority mode take the place of the original so more urgent messages put in the
+        meantime go first. The first error raised while sending is re-raised to the caller
+        on the next put or flush, and unsent messages are dropped. send must be a bound 
+        method: the thread only holds a weak reference to its object (the messenger) and 
+        stops once it is garbage collected.
+    '''
+    def __init__(self, send: typing.Callable[[Message], typing.Optional[typing.List[Message]]], prioritize: bool = False):
+        self._send = weakref.WeakMethod(send)
+        self._prioritize = prioritize
+        self._outbox: queue.Queue = queue.PriorityQueue() if prioritize else queue.Queue()
+        self._seq = itertools.count()
+        self._error: typing.Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name='coproc-messenger-writer', daemon=True)
+        self._thread.start()
+        self._finalizer = weakref.finalize(send.__self__, self._put_stop)
+
+    def put(self, msg: Message) -> None:
+        '''Queue message to be sent.'''
+        self.raise_error()
+        if self._prioritize:
+            self._outbox.put((msg.priority, next(self._seq), 0, msg))
+        else:
+            self._outbox.put(msg)
+
+    def flush(self) -> None:
+        '''Wait until all queued messages have been sent.'''
+        self._outbox.join()
+        self.raise_error()
+
+    def close(self) -> None:
+        '''Send the messages already queued, then stop the thread and wait for it to exit.
+            Errors raised while sending are not re-raised.
+        '''
+        if self._finalizer.detach() is not None:
+            self._put_stop()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def pending(self) -> int:
+        '''Number of messages queued but not yet sent.'''
+        return self._outbox.unfinished_tasks
+
+    def raise_error(self) -> None:
+        if self._error is not None:
+            e, self._error = self._error, None
+            raise e
+
+    def _put_stop(self) -> None:
+        '''Queue the entry that stops the thread, after everything queued so far.'''
+        if self._prioritize:
+            self._outbox.put((float('inf'), next(self._seq), 0, None))
+        else:
+            self._outbox.put(None)
+
+    def _run(self) -> None:
+        while True:
+            entry = self._outbox.get()
+            try:
+                if entry is None or (self._prioritize and entry[3] is None):
+                    return
+                if self._error is None:
+                    self._send_entry(entry)
+            except BaseException as e:
+                traceback.clear_frames(e.__traceback__) # the finished frames hold the messenger
+                self._error = e
+            finally:
+                self._outbox.task_done()
+
+    def _send_entry(self, entry: typing.Any) -> None:
+        send = self._send()
+        if send is None:
+            return # the messenger was garbage collected; the stop entry follows
+        if not self._prioritize:
+            rest = send(entry)
+            for msg in rest or ():
+                send(msg)
+            return
+        priority, seq, _, msg = entry
+        rest = send(msg)
+        for i, msg in enumerate(rest or (), start=1):
+            self._outbox.put((priority, seq, i, msg)) # same place in line as the original
@@ -0,0 +1,67 @@
+from __future__ import annotations
+import contextlib
+import threading
+import typing
+import weakref
+
+
+class BusyHeartbeats:
+    '''Calls heartbeat from a daemon thread every half interval while its owner is busy, so
+        a worker running a long task that does not touch the messenger still looks alive to
+        the peer. The thread only calls heartbeat inside busy(), and leaving busy() waits for
+        a call in progress, so the owner never uses the messenger at the same time. One
+        thread serves every busy() block. heartbeat must be a bound method: the thread only
+        holds a weak reference to its object (the messenger) and stops once it is garbage
+        collected. Errors raised by heartbeat stop the thread; the owner sees them itself on
+        its next send.
+    '''
+    def __init__(self, heartbeat: typing.Callable[[], None], interval: float):
+        self._heartbeat = weakref.WeakMethod(heartbeat)
+        self._interval = interval
+        self._cond = threading.Condition()
+        self._busy = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='coproc-messenger-heartbeats', daemon=True)
+        self._thread.start()
+        self._finalizer = weakref.finalize(heartbeat.__self__, self._stop)
+
+    @contextlib.contextmanager
+    def busy(self) -> typing.Iterator[None]:
+        '''Send heartbeats while the block runs.'''
+        with self._cond:
+            self._busy = True
+            self._cond.notify()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._busy = False
+
+    def close(self) -> None:
+        '''Stop the thread and wait for it to exit.'''
+        if self._finalizer.detach() is not None:
+            self._stop()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self) -> None:
+        with self._cond:
+            while not self._stopped:
+                if not self._busy:
+                    self._cond.wait()
+                    continue
+                heartbeat = self._heartbeat()
+                if heartbeat is None:
+                    return # the messenger was garbage collected
+                try:
+                    heartbeat()
+                except BaseException:
+                    return
+                finally:
+                    del heartbeat
+                self._cond.wait(self._interval / 2)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+import collections
+import typing
+
+if typing.TYPE_CHECKING:
+    from .multimessenger import MultiMessenger
+
+
+class ByteStream:
+    '''Payload received for data sent with send_stream. It is queued as soon as the first
+        frame arrives; iterating yields each frame's bytes once as they arrive, receiving
+        from the messenger while waiting, so only a few frames are held at a time.
+    '''
+    def __init__(self, messenger: MultiMessenger, stream_id: int, metadata: typing.Any, size: typing.Optional[int], window: typing.Optional[int]):
+        self.messenger = messenger
+        self.stream_id = stream_id
+        self.metadata = metadata # object sent with the stream, e.g. dtype and shape of an array
+        self.size = size # total bytes if the sender knew it, otherwise None
+        self.window = window # frames the sender sends ahead of acknowledgements, None if it does not wait
+        self.complete = False # whether the last frame has arrived
+        self._frames: collections.deque[bytes] = collections.deque()
+        self._consumed = 0 # bytes already yielded
+
+    def __iter__(self) -> typing.Iterator[bytes]:
+        while True:
+            while not self._frames:
+                if self.complete:
+                    return
+                self.messenger._await_stream(self)
+            frame = self._frames.popleft()
+            self._consumed += len(frame)
+            if self.window is not None:
+                self.messenger._ack_stream(self.stream_id)
+            yield frame
+
+    def read(self) -> typing.Union[bytes, bytearray]:
+        '''Receive the rest of the stream (all of it unless it was partly iterated) and return it joined.'''
+        if self.size is None:
+            return b''.join(self)
+        buf, i = bytearray(self.size - self._consumed), 0
+        for frame in self:
+            buf[i:i+len(frame)] = frame
+            i += len(frame)
+        return buf
+
+    def _put(self, data: bytes, last: bool) -> None:
+        if len(data):
+            self._frames.append(data)
+        self.complete = last
@@ -0,0 +1,156 @@
+from __future__ import annotations
+import dataclasses
+import io
+import marshal
+import pickle
+import struct
+import sys
+import types
+import typing
+import importlib
+
+from .queue import ChannelID
+from .exceptions import CodecNotRegisteredError
+
+@dataclasses.dataclass
+class Codec:
+    '''Named serializer for payloads. Both ends of a messenger must know the codec by name.
+        encode and decode should be module-level functions so messengers can be sent to spawned processes.
+    '''
+    name: str
+    encode: typing.Callable[[typing.Any], bytes]
+    decode: typing.Callable[[bytes], typing.Any]
+
+@dataclasses.dataclass
+class StructCodec(Codec):
+    '''Packs tuples of numbers with a fixed struct format.'''
+    encode: typing.Callable[[typing.Any], bytes] = None
+    decode: typing.Callable[[bytes], typing.Any] = None
+    fmt: str = ''
+
+    def __post_init__(self):
+        s = struct.Struct(self.fmt)
+        self.encode = lambda values: s.pack(*values)
+        self.decode = s.unpack
+
+    def __getstate__(self):
+        return (self.name, self.fmt)
+
+    def __setstate__(self, state):
+        self.name, self.fmt = state
+        self.__post_init__()
+
+############### Pickling lambdas and closures ###############
+
+def _is_importable(func: types.FunctionType) -> bool:
+    '''Whether pickle can find the function by module and qualified name.'''
+    obj = sys.modules.get(func.__module__)
+    for part in func.__qualname__.split('.'):
+        obj = getattr(obj, part, None)
+    return obj is func
+
+def _rebuild_function(code: bytes, module: str, name: str, ncells: typing.Optional[int]) -> types.FunctionType:
+    '''Make the function with empty closure cells; _fill_function sets them.'''
+    mod = sys.modules.get(module) or importlib.import_module(module)
+    closure = tuple(types.CellType() for _ in range(ncells)) if ncells is not None else None
+    return types.FunctionType(marshal.loads(code), mod.__dict__, name, None, closure)
+
+def _fill_function(func: types.FunctionType, state: tuple) -> None:
+    defaults, kwdefaults, closure_values, func_dict = state
+    func.__defaults__ = defaults
+    func.__kwdefaults__ = kwdefaults
+    for cell, value in zip(func.__closure__ or (), closure_values or ()):
+        cell.cell_contents = value
+    func.__dict__.update(func_dict)
+
+class ClosurePickler(pickle.Pickler):
+    '''Pickles functions that cannot be found by reference (lambdas, nested functions)
+        by value: marshaled code, defaults and closure cell contents. The function's
+        globals are taken from its module on the receiving end. The function is created
+        before its closure is pickled, so functions that refer to themselves (recursive
+        nested functions) come back as the same object instead of recursing forever.
+    '''
+    def reducer_override(self, obj: typing.Any):
+        if type(obj) is types.FunctionType and not _is_importable(obj):
+            closure = tuple(c.cell_contents for c in obj.__closure__) if obj.__closure__ is not None else None
+            return (
+                _rebuild_function,
+                (marshal.dumps(obj.__code__), obj.__module__, obj.__name__, len(closure) if closure is not None else None),
+                (obj.__defaults__, obj.__kwdefaults__, closure, obj.__dict__),
+                None, None, _fill_function,
+            )
+        return NotImplemented
+
+def pickle_dumps(obj: typing.Any) -> bytes:
+    return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+def closure_dumps(obj: typing.Any) -> bytes:
+    f = io.BytesIO()
+    ClosurePickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return f.getvalue()
+
+############### Builtin codecs ###############
+
+PICKLE = Codec('pickle', pickle_dumps, pickle.loads)
+MARSHAL = Codec('marshal', marshal.dumps, marshal.loads)
+CLOSURE = Codec('closure', closure_dumps, pickle.loads)
+
+def builtin_codecs() -> typing.Dict[str, Codec]:
+    return {c.name: c for c in (PICKLE, MARSHAL, CLOSURE)}
+
+@dataclasses.dataclass
+class CodecRegistry:
+    '''Chooses the codec for each payload sent by a messenger and decodes received payloads.
+        A codec registered for the payload type (or one of its bases) takes precedence over
+        the codec for the channel. Payloads with neither are pickled along with the message.
+    '''
+    codecs: typing.Dict[str, Codec] = dataclasses.field(default_factory=builtin_codecs)
+    channel_codecs: typing.Dict[ChannelID, str] = dataclasses.field(default_factory=dict)
+    type_codecs: typing.Dict[type, str] = dataclasses.field(default_factory=dict)
+
+    def register(self, codec: Codec) -> None:
+        '''Make codec available by name for encoding and decoding.'''
+        self.codecs[codec.name] = codec
+
+    def set_channel_codec(self, channel_id: ChannelID, codec: typing.Union[str, Codec]) -> None:
+        '''Use codec for payloads sent on this channel.'''
+        self.channel_codecs[channel_id] = self._name(codec)
+
+    def set_type_codec(self, payload_type: type, codec: typing.Union[str, Codec]) -> None:
+        '''Use codec for payloads of this type (or its subclasses).'''
+        self.type_codecs[payload_type] = self._name(codec)
+
+    def codec_for(self, payload: typing.Any, channel_id: ChannelID) -> typing.Optional[Codec]:
+        '''Get codec to use for this payload, or None to pickle with the message.'''
+        if self.type_codecs:
+            for t in type(payload).__mro__:
+                if t in self.type_codecs:
+                    return self[self.type_codecs[t]]
+        if channel_id in self.channel_codecs:
+            return self[self.channel_codecs[channel_id]]
+        return None
+
+    def encode(self, payload: typing.Any, channel_id: ChannelID) -> typing.Tuple[typing.Optional[str], typing.Any]:
+        '''Return (codec name, encoded payload), or (None, payload) if no codec applies.'''
+        codec = self.codec_for(payload, channel_id)
+        if codec is None:
+            return None, payload
+        return codec.name, codec.encode(payload)
+
+    def decode(self, name: str, data: bytes) -> typing.Any:
+        return self[name].decode(data)
+
+    def _name(self, codec: typing.Union[str, Codec]) -> str:
+        if isinstance(codec, Codec):
+            self.register(codec)
+            return codec.name
+        self[codec] # make sure it exists
+        return codec
+
+    def __getitem__(self, name: str) -> Codec:
+        try:
+            return self.codecs[name]
+        except KeyError as e:
+            raise CodecNotRegisteredError(f'Codec "{name}" is not registered. Register it on both messengers.') from e
+
+DEFAULT_CODECS = CodecRegistry()
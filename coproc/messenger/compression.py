@@ -0,0 +1,144 @@
+from __future__ import annotations
+import bz2
+import dataclasses
+import lzma
+import pickle
+import time
+import typing
+import zlib
+
+from .queue import ChannelID
+
+CompressionName = typing.Literal['zlib', 'lzma', 'bz2']
+
+_COMPRESS: typing.Dict[str, typing.Callable[[bytes, int], bytes]] = {
+    'zlib': lambda data, level: zlib.compress(data, level),
+    'lzma': lambda data, level: lzma.compress(data, preset=level),
+    'bz2': lambda data, level: bz2.compress(data, level),
+}
+
+_DECOMPRESS: typing.Dict[str, typing.Callable[[bytes], bytes]] = {
+    'zlib': zlib.decompress,
+    'lzma': lzma.decompress,
+    'bz2': bz2.decompress,
+}
+
+def decompress(name: str, data: bytes) -> bytes:
+    '''Decompress data compressed with the named algorithm.'''
+    return _DECOMPRESS[name](data)
+
+@dataclasses.dataclass
+class CompressionStats:
+    '''Counts for one channel.'''
+    compressed: int = 0 # messages sent compressed
+    rejected: int = 0 # compressed but sent uncompressed because it did not pay off
+    too_small: int = 0 # below min_bytes
+    disabled: int = 0 # skipped because compression was disabled on the channel
+    bytes_in: int = 0 # serialized size of messages that were compressed
+    bytes_out: int = 0 # compressed size of those messages
+    seconds: float = 0.0 # time spent compressing (including rejected attempts)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+    @property
+    def ratio(self) -> float:
+        '''Compressed size over original size of compressed messages.'''
+        return self.bytes_out / self.bytes_in if self.bytes_in else 1.0
+
+    def __add__(self, other: CompressionStats) -> CompressionStats:
+        return CompressionStats(*[getattr(self, f.name) + getattr(other, f.name) for f in dataclasses.fields(self)])
+
+@dataclasses.dataclass
+class _ChannelState:
+    stats: CompressionStats = dataclasses.field(default_factory=CompressionStats)
+    ratio: typing.Optional[float] = None # moving average of compressed/original size
+    seconds_per_byte: float = 0.0 # moving average of compression cost
+    skip: int = 0 # messages left to send uncompressed before probing again
+
+@dataclasses.dataclass
+class AdaptiveCompressor:
+    '''Compresses serialized payloads of at least min_bytes. Compression is disabled on a
+        channel for retry_after messages when the average ratio (compressed/original) is
+        above max_ratio or, if link_bytes_per_second is set, when compressing takes longer
+        than sending the saved bytes would. Local pipes move roughly 1GB/s, so the time
+        check is mostly useful for network transports.
+    '''
+    algorithm: CompressionName = 'zlib'
+    level: int = 1
+    min_bytes: int = 4096
+    max_ratio: float = 0.9
+    link_bytes_per_second: typing.Optional[float] = None
+    retry_after: int = 100
+    smoothing: float = 0.2 # weight of the newest sample in the moving averages
+    _channels: typing.Dict[ChannelID, _ChannelState] = dataclasses.field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        if self.algorithm not in _COMPRESS:
+            raise ValueError(f'Compression algorithm must be one of {list(_COMPRESS)}, not {self.algorithm}.')
+
+    def compress(self, payload: typing.Any, codec: typing.Optional[str], channel_id: ChannelID) -> typing.Tuple[typing.Optional[str], typing.Optional[str], typing.Any]:
+        '''Return (codec, compression, payload) to send. Payloads not yet encoded
+            by a codec are pickled to measure them, and sent with the pickle codec.
+        '''
+        state = self._state(channel_id)
+        if state.skip > 0:
+            state.skip -= 1
+            state.stats.disabled += 1
+            return codec, None, payload
+
+        if codec is None:
+            codec, payload = 'pickle', pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) < self.min_bytes:
+            state.stats.too_small += 1
+            return codec, None, payload
+
+        start = time.perf_counter()
+        compressed = _COMPRESS[self.algorithm](payload, self.level)
+        elapsed = time.perf_counter() - start
+        state.stats.seconds += elapsed
+        self._update(state, len(payload), len(compressed), elapsed)
+
+        if len(compressed) >= len(payload) * self.max_ratio:
+            state.stats.rejected += 1
+            return codec, None, payload
+        state.stats.compressed += 1
+        state.stats.bytes_in += len(payload)
+        state.stats.bytes_out += len(compressed)
+        return codec, self.algorithm, compressed
+
+    def stats(self, channel_id: ChannelID = None) -> CompressionStats:
+        '''Counts for this channel.'''
+        return dataclasses.replace(self._state(channel_id).stats)
+
+    def total_stats(self) -> CompressionStats:
+        '''Counts summed over all channels.'''
+        return sum((s.stats for s in self._channels.values()), CompressionStats())
+
+    def enabled(self, channel_id: ChannelID = None) -> bool:
+        '''Whether the next message on this channel will be considered for compression.'''
+        return self._state(channel_id).skip == 0
+
+    def _update(self, state: _ChannelState, n_in: int, n_out: int, elapsed: float) -> None:
+        '''Update moving averages and disable the channel if compression is a net loss.'''
+        ratio, cost = n_out / n_in, elapsed / n_in
+        if state.ratio is None:
+            state.ratio, state.seconds_per_byte = ratio, cost
+        else:
+            a = self.smoothing
+            state.ratio = a*ratio + (1-a)*state.ratio
+            state.seconds_per_byte = a*cost + (1-a)*state.seconds_per_byte
+
+        too_slow = (self.link_bytes_per_second is not None and
+            state.seconds_per_byte > (1 - state.ratio) / self.link_bytes_per_second)
+        if state.ratio > self.max_ratio or too_slow:
+            state.skip = self.retry_after
+            state.ratio = None # judge fresh samples when probing again
+
+    def _state(self, channel_id: ChannelID) -> _ChannelState:
+        try:
+            return self._channels[channel_id]
+        except KeyError:
+            self._channels[channel_id] = _ChannelState()
+            return self._channels[channel_id]
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import collections
+import dataclasses
+import hashlib
+import pickle
+import typing
+
+from .exceptions import MessageNotRecognizedError
+
+DEDUP_CODEC = 'dedup' # codec name marking a deduplicated payload on the wire
+
+@dataclasses.dataclass
+class DedupStats:
+    '''Counts of payloads sent by one end.'''
+    full: int = 0 # sent whole and cached by the peer
+    references: int = 0 # sent as a digest of a payload the peer holds
+    too_small: int = 0 # below min_bytes, sent without hashing
+    bytes_saved: int = 0
+
+@dataclasses.dataclass
+class DedupCache:
+    '''Content-addressed LRU cache of serialized payloads of at least min_bytes.
+        The sending end tracks the digests the peer holds and decides evictions, which
+        it announces with the next payload sent whole, so the peer's cache mirrors it
+        exactly as long as payloads are handled in the order they were written. One
+        instance per messenger serves both directions.
+    '''
+    min_bytes: int = 65536
+    max_entries: int = 64
+    max_bytes: int = 1 << 28 # total size of payloads the peer holds
+    sent: collections.OrderedDict[bytes, int] = dataclasses.field(default_factory=collections.OrderedDict, repr=False) # digests the peer holds and their sizes, least recently used first
+    sent_bytes: int = 0
+    held: typing.Dict[bytes, bytes] = dataclasses.field(default_factory=dict, repr=False) # payloads the peer sent us, by digest
+    stats: DedupStats = dataclasses.field(default_factory=DedupStats)
+
+    def encode(self, codec: typing.Optional[str], payload: typing.Any) -> typing.Tuple[typing.Optional[str], typing.Any]:
+        '''Return (codec, payload) to send. Payloads not yet encoded by a codec are pickled
+            to hash them, and sent with the pickle codec if too small to deduplicate.
+        '''
+        if codec is None:
+            codec, payload = 'pickle', pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) < self.min_bytes:
+            self.stats.too_small += 1
+            return codec, payload
+
+        digest = hashlib.blake2b(payload, digest_size=16).digest()
+        if digest in self.sent:
+            self.sent.move_to_end(digest)
+            self.stats.references += 1
+            self.stats.bytes_saved += len(payload)
+            return DEDUP_CODEC, (digest, codec, None, ())
+        if len(payload) > self.max_bytes:
+            return codec, payload
+
+        self.sent[digest] = len(payload)
+        self.sent_bytes += len(payload)
+        evicted = list()
+        while len(self.sent) > self.max_entries or self.sent_bytes > self.max_bytes:
+            old, n = self.sent.popitem(last=False)
+            self.sent_bytes -= n
+            evicted.append(old)
+        self.stats.full += 1
+        return DEDUP_CODEC, (digest, codec, payload, evicted)
+
+    def resolve(self, wire: tuple) -> typing.Tuple[str, typing.Any]:
+        '''Return (codec, payload) of a deduplicated payload received from the peer.'''
+        digest, codec, payload, evicted = wire
+        for old in evicted:
+            del self.held[old]
+        if payload is None:
+            try:
+                return codec, self.held[digest]
+            except KeyError as e:
+                raise MessageNotRecognizedError(f'Payload digest {digest.hex()} is not cached. Messages must be handled in the order they were sent.') from e
+        self.held[digest] = payload
+        return codec, payload
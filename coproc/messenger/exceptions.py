@@ -8,3 +8,14 @@ class MessageNotRecognizedError(BaseException):
 class ResourceRequestedClose(BaseException):
     pass
 
+
+
+class CodecNotRegisteredError(BaseException):
+    pass
+
+
+class PeerDeadError(BrokenPipeError):
+    '''The other end stopped sending heartbeats while it owed us replies. Subclasses
+        BrokenPipeError so code handling a closed pipe also handles a dead peer.
+    '''
+    pass
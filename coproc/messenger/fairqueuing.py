@@ -0,0 +1,37 @@
+from __future__ import annotations
+import dataclasses
+import typing
+
+from .queue import ChannelID
+
+
+@dataclasses.dataclass
+class WeightedFairScheduler:
+    '''Self-clocked weighted fair queuing across channels. Serving a message on a channel
+        advances its finish tag by 1/weight and the channel with the smallest next tag is
+        served, so busy channels share receives in proportion to their weights. Tags start
+        no earlier than the tag of the last message served, so an idle channel cannot save 
+        up a burst.
+    '''
+    weights: typing.Dict[ChannelID, float]
+    default_weight: float = 1.0 # weight of channels not in weights
+    finish: typing.Dict[ChannelID, float] = dataclasses.field(default_factory=dict)
+    tags: typing.Dict[ChannelID, float] = dataclasses.field(default_factory=dict) # tags of waiting channels
+    virtual_time: float = 0.0
+
+    def __post_init__(self):
+        if any(w <= 0 for w in self.weights.values()) or self.default_weight <= 0:
+            raise ValueError(f'Channel weights must be positive: {self.weights}.')
+
+    def next_tag(self, channel_id: ChannelID) -> float:
+        '''Finish tag of the next message on this channel.'''
+        try:
+            return self.tags[channel_id]
+        except KeyError:
+            start = max(self.finish.get(channel_id, 0.0), self.virtual_time)
+            self.tags[channel_id] = start + 1 / self.weights.get(channel_id, self.default_weight)
+            return self.tags[channel_id]
+
+    def served(self, channel_id: ChannelID) -> None:
+        self.virtual_time = self.finish[channel_id] = self.next_tag(channel_id)
+        del self.tags[channel_id]
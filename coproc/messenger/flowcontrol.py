@@ -0,0 +1,45 @@
+from __future__ import annotations
+import collections
+import dataclasses
+import typing
+
+from .queue import ChannelID
+
+
+@dataclasses.dataclass
+class FlowControl:
+    '''Credit counts for one end of a messenger. The peer may have at most window
+        unconsumed requests (or norequest messages) per channel in flight to us; we 
+        return credit as they are popped from the queue. Replies need no credit because
+        they are bounded by the requests that asked for them.
+    '''
+    window: int
+    used: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
+    granted: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
+    consumed: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
+
+    def __post_init__(self):
+        if self.window < 1:
+            raise ValueError(f'Flow control window must be at least 1, not {self.window}.')
+
+    ##################### Sending #####################
+    def credits(self, channel_id: ChannelID) -> int:
+        '''Messages we may send on this channel before waiting for the peer.'''
+        return self.window + self.granted[channel_id] - self.used[channel_id]
+
+    def take(self, channel_id: ChannelID, n: int) -> None:
+        self.used[channel_id] += n
+
+    def received_grant(self, channel_id: ChannelID, n: int) -> None:
+        self.granted[channel_id] += n
+
+    ##################### Receiving #####################
+    def consume(self, channel_id: ChannelID) -> int:
+        '''Record that a message was popped. Returns the credit to grant the peer now 
+            (in batches of half the window), or zero.
+        '''
+        self.consumed[channel_id] += 1
+        if self.consumed[channel_id] < max(1, self.window // 2):
+            return 0
+        n, self.consumed[channel_id] = self.consumed[channel_id], 0
+        return n
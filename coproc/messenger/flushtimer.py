@@ -0,0 +1,62 @@
+from __future__ import annotations
+import threading
+import time
+import typing
+import weakref
+
+
+class FlushTimer:
+    '''Calls flush from a daemon thread once the deadline set by schedule passes. One thread
+        serves every reply batch: schedule moves the deadline and cancel clears it. flush is
+        called without holding the timer's lock, so it may take locks held by callers of
+        schedule and cancel. flush must be a bound method: the thread only holds a weak
+        reference to its object (the messenger) and stops once it is garbage collected.
+    '''
+    def __init__(self, flush: typing.Callable[[], None]):
+        self._flush = weakref.WeakMethod(flush)
+        self._cond = threading.Condition()
+        self._deadline: typing.Optional[float] = None # monotonic time to flush at, None if nothing is scheduled
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='coproc-messenger-flush', daemon=True)
+        self._thread.start()
+        self._finalizer = weakref.finalize(flush.__self__, self._stop)
+
+    def schedule(self, delay: float) -> None:
+        '''Call flush in delay seconds, replacing any deadline already set.'''
+        with self._cond:
+            self._deadline = time.monotonic() + delay
+            self._cond.notify()
+
+    def cancel(self) -> None:
+        '''Forget the deadline. The thread keeps waiting for the next one.'''
+        with self._cond:
+            self._deadline = None
+
+    def close(self) -> None:
+        '''Stop the thread and wait for it to exit.'''
+        if self._finalizer.detach() is not None:
+            self._stop()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    timeout = None if self._deadline is None else self._deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                self._deadline = None
+            flush = self._flush()
+            if flush is None:
+                return # the messenger was garbage collected
+            flush()
+            del flush
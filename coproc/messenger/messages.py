@@ -3,6 +3,7 @@ import typing
 import dataclasses
 import enum
 from .queue import ChannelID
+from .exceptions import MessageNotRecognizedError
 
 SendPayloadType = typing.TypeVar('SendPayloadType')
 RecvPayloadType = typing.TypeVar('RecvPayloadType')
@@ -13,6 +14,7 @@ RecvPayloadType = typing.TypeVar('RecvPayloadType')
 
 class Message:
     '''Base class for messages containing priority comparisons.'''
+    __slots__ = ()
     priority: float
     mtype: MessageType
     channel_id: ChannelID
@@ -38,27 +40,73 @@ class Message:
     #    return self.priority != other.priority
 
 ##################### Generic Messages #####################
+# Messages are sent as plain tuples (see to_wire/message_from_wire) whose first 
+#   element is the integer message type, so the pickle carries no class or enum 
+#   references and the receiver does not recompute priorities.
 
-class MessageType(enum.Enum):
+class MessageType(enum.IntEnum):
     DATA_PAYLOAD = enum.auto()
     CLOSE_REQUEST = enum.auto()
     ENCOUNTERED_ERROR = enum.auto()
-    
-@dataclasses.dataclass
+    BATCH_PAYLOAD = enum.auto()
+    CREDIT_GRANT = enum.auto()
+    CHUNK = enum.auto()
+    CANCEL = enum.auto()
+    HEARTBEAT = enum.auto()
+    STREAM = enum.auto()
+    STREAM_ACK = enum.auto()
+
+_DATA_PAYLOAD = MessageType.DATA_PAYLOAD.value
+_CLOSE_REQUEST = MessageType.CLOSE_REQUEST.value
+_ENCOUNTERED_ERROR = MessageType.ENCOUNTERED_ERROR.value
+_BATCH_PAYLOAD = MessageType.BATCH_PAYLOAD.value
+_CREDIT_GRANT = MessageType.CREDIT_GRANT.value
+_CHUNK = MessageType.CHUNK.value
+_CANCEL = MessageType.CANCEL.value
+_HEARTBEAT = MessageType.HEARTBEAT.value
+_STREAM = MessageType.STREAM.value
+_STREAM_ACK = MessageType.STREAM_ACK.value
+_INF = float('inf')
+
+def _slotted_dataclass(cls: type) -> type:
+    '''Same as dataclasses.dataclass(slots=True), which requires Python 3.10: the dataclass
+        is rebuilt with __slots__ for its fields, so messages carry no instance dict.
+    '''
+    cls = dataclasses.dataclass(cls)
+    names = tuple(f.name for f in dataclasses.fields(cls))
+    body = {k: v for k, v in cls.__dict__.items() if k not in names and k not in ('__dict__', '__weakref__')}
+    body['__slots__'] = names
+    return type(cls)(cls.__name__, cls.__bases__, body)
+
+@_slotted_dataclass
 class CloseRequestMessage(Message):
     '''Request that the other end of the pipe close.'''
     priority: float = float('-inf') # lower priority is more important
-    mtype: MessageType = MessageType.CLOSE_REQUEST
+    mtype: typing.ClassVar[MessageType] = MessageType.CLOSE_REQUEST
     #channel_id: ChannelID = ReservedChannels.SYSTEM_CHANNEL
     
-@dataclasses.dataclass
+    def to_wire(self) -> tuple:
+        return (_CLOSE_REQUEST,)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> CloseRequestMessage:
+        return cls()
+    
+@_slotted_dataclass
 class EncounteredErrorMessage(Message):
     exception: BaseException
     priority: float = float('-inf') # lower priority is more important
-    mtype: MessageType = MessageType.ENCOUNTERED_ERROR
+    mtype: typing.ClassVar[MessageType] = MessageType.ENCOUNTERED_ERROR
     #channel_id: ChannelID = ReservedChannels.SYSTEM_CHANNEL
     
-@dataclasses.dataclass
+    def to_wire(self) -> tuple:
+        return (_ENCOUNTERED_ERROR, self.exception)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> EncounteredErrorMessage:
+        return cls(wire[1])
+    
+@_slotted_dataclass
 class DataMessage(Message):
     '''Send generic data to the other end of the pipe, using priority of sent messsage.
     NOTE: this is designed to allow users to access benefits of user-defined queue.
@@ -67,15 +115,185 @@ class DataMessage(Message):
     request_reply: bool # whether to request a reply or not
     is_reply: bool # whether this is a reply to a request
     channel_id: ChannelID # set by the user in this case
-    mtype: MessageType = MessageType.DATA_PAYLOAD
+    priority: typing.Optional[float] = None # payload.priority (or inf) if not provided
+    codec: typing.Optional[str] = None # name of codec that encoded payload, None if pickled with the message
+    compression: typing.Optional[str] = None # algorithm that compressed the encoded payload
+    request_id: typing.Optional[int] = None # id of this request, or of the request this replies to
+    deadline: typing.Optional[float] = None # seconds after arrival it should be handled by. payload.deadline if not provided.
+    queued_at: typing.Optional[float] = None # local time it was put in the receiving queue. not sent.
+    nbytes: int = 0 # size of the frame it was received in. not sent.
+    mtype: typing.ClassVar[MessageType] = MessageType.DATA_PAYLOAD
     
-    @property
-    def priority(self) -> float:
-        try:
-            return self.payload.priority
-        except AttributeError:
-            return float('inf')
+    def __post_init__(self):
+        if self.priority is None:
+            self.priority = getattr(self.payload, 'priority', _INF)
+        if self.deadline is None:
+            self.deadline = getattr(self.payload, 'deadline', None)
+    
+    def to_wire(self) -> tuple:
+        return (_DATA_PAYLOAD, self.payload, self.request_reply, self.is_reply, self.channel_id, 
+            None if self.priority == _INF else self.priority, self.codec, self.compression, self.request_id, self.deadline)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> DataMessage:
+        _, payload, request_reply, is_reply, channel_id, priority, codec, compression, request_id, deadline = wire
+        return cls(payload, request_reply, is_reply, channel_id, _INF if priority is None else priority, codec, compression, request_id, deadline)
+
+@_slotted_dataclass
+class BatchMessage(Message):
+    '''Carries many payloads sharing the same header in a single pipe send.
+        The receiver unpacks it into one DataMessage per payload.
+    '''
+    payloads: typing.List[typing.Union[SendPayloadType, RecvPayloadType]]
+    request_reply: bool
+    is_reply: bool
+    channel_id: ChannelID
+    priority: float = float('inf')
+    codecs: typing.Optional[typing.List[typing.Optional[str]]] = None # codec name per payload, None if none were encoded
+    compression: typing.Optional[str] = None # if set, payloads is the compressed pickle of the payload list
+    request_ids: typing.Optional[typing.List[typing.Optional[int]]] = None # request id per payload
+    nbytes: int = 0 # size of the frame it was received in. not sent.
+    mtype: typing.ClassVar[MessageType] = MessageType.BATCH_PAYLOAD
+    
+    def data_messages(self) -> typing.List[DataMessage]:
+        '''Unpack into individual data messages, which share the received size. Payloads must already be decoded.'''
+        nbytes = self.nbytes // max(len(self.payloads), 1)
+        if self.request_ids is None:
+            return [DataMessage(p, self.request_reply, self.is_reply, self.channel_id, nbytes=nbytes) for p in self.payloads]
+        return [DataMessage(p, self.request_reply, self.is_reply, self.channel_id, request_id=rid, nbytes=nbytes) for p, rid in zip(self.payloads, self.request_ids)]
+    
+    def to_wire(self) -> tuple:
+        return (_BATCH_PAYLOAD, self.payloads, self.request_reply, self.is_reply, self.channel_id, self.codecs, self.compression, self.request_ids)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> BatchMessage:
+        return cls(wire[1], wire[2], wire[3], wire[4], codecs=wire[5], compression=wire[6], request_ids=wire[7])
 
+@_slotted_dataclass
+class CreditGrantMessage(Message):
+    '''Allow the other end to send credits more messages on this channel (flow control).'''
+    channel_id: ChannelID
+    credits: int
+    priority: float = float('-inf')
+    mtype: typing.ClassVar[MessageType] = MessageType.CREDIT_GRANT
+    
+    def to_wire(self) -> tuple:
+        return (_CREDIT_GRANT, self.channel_id, self.credits)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> CreditGrantMessage:
+        return cls(wire[1], wire[2])
+
+@_slotted_dataclass
+class ChunkMessage(Message):
+    '''Piece of a serialized message that was too large to send at once. Chunks of one
+        stream arrive in order but may be interleaved with other messages.
+    '''
+    channel_id: ChannelID # channel of the chunked message, for byte counts
+    stream_id: int
+    data: typing.Union[bytes, memoryview]
+    last: bool
+    priority: float = float('inf') # priority of the chunked message
+    mtype: typing.ClassVar[MessageType] = MessageType.CHUNK
+    
+    def to_wire(self) -> tuple:
+        return (_CHUNK, self.channel_id, self.stream_id, bytes(self.data), self.last)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> ChunkMessage:
+        return cls(wire[1], wire[2], wire[3], wire[4])
+
+@_slotted_dataclass
+class CancelMessage(Message):
+    '''Revoke requests by id. The receiver answers with ack=True listing the ids it
+        will never reply to (removed from its queue or not yet arrived); replies to the 
+        others may still come and are discarded by the requester.
+    '''
+    channel_id: ChannelID
+    request_ids: typing.List[int]
+    ack: bool = False
+    priority: float = float('-inf')
+    mtype: typing.ClassVar[MessageType] = MessageType.CANCEL
+    
+    def to_wire(self) -> tuple:
+        return (_CANCEL, self.channel_id, self.request_ids, self.ack)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> CancelMessage:
+        return cls(wire[1], wire[2], wire[3])
+
+@_slotted_dataclass
+class HeartbeatMessage(Message):
+    '''Tells the other end we are alive when nothing else has been sent for a while.'''
+    priority: float = float('-inf')
+    mtype: typing.ClassVar[MessageType] = MessageType.HEARTBEAT
+    
+    def to_wire(self) -> tuple:
+        return (_HEARTBEAT,)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> HeartbeatMessage:
+        return cls()
+
+@_slotted_dataclass
+class StreamMessage(Message):
+    '''Frame of raw bytes sent with send_stream. The first frame of a stream carries 
+        header (metadata, size, window); frames of one stream arrive in order.
+    '''
+    channel_id: ChannelID
+    stream_id: int
+    data: typing.Union[bytes, memoryview]
+    last: bool
+    header: typing.Optional[typing.Tuple[typing.Any, typing.Optional[int], typing.Optional[int]]] = None
+    priority: float = float('inf') # metadata.priority on the sending side. not sent.
+    mtype: typing.ClassVar[MessageType] = MessageType.STREAM
+    
+    def to_wire(self) -> tuple:
+        return (_STREAM, self.channel_id, self.stream_id, bytes(self.data), self.last, self.header)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> StreamMessage:
+        return cls(wire[1], wire[2], wire[3], wire[4], wire[5])
+
+@_slotted_dataclass
+class StreamAckMessage(Message):
+    '''The receiver consumed this many more frames of a stream, so the sender may send more.'''
+    stream_id: int
+    frames: int
+    priority: float = float('-inf')
+    mtype: typing.ClassVar[MessageType] = MessageType.STREAM_ACK
+    
+    def to_wire(self) -> tuple:
+        return (_STREAM_ACK, self.stream_id, self.frames)
+    
+    @classmethod
+    def from_wire(cls, wire: tuple) -> StreamAckMessage:
+        return cls(wire[1], wire[2])
+
+_FROM_WIRE: typing.Dict[int, typing.Callable[[tuple], Message]] = {
+    _DATA_PAYLOAD: DataMessage.from_wire,
+    _CLOSE_REQUEST: CloseRequestMessage.from_wire,
+    _ENCOUNTERED_ERROR: EncounteredErrorMessage.from_wire,
+    _BATCH_PAYLOAD: BatchMessage.from_wire,
+    _CREDIT_GRANT: CreditGrantMessage.from_wire,
+    _CHUNK: ChunkMessage.from_wire,
+    _CANCEL: CancelMessage.from_wire,
+    _HEARTBEAT: HeartbeatMessage.from_wire,
+    _STREAM: StreamMessage.from_wire,
+    _STREAM_ACK: StreamAckMessage.from_wire,
+}
+
+def message_from_wire(wire: tuple, nbytes: int = 0) -> Message:
+    '''Rebuild a message from the tuple produced by its to_wire method. Data messages
+        record nbytes, the size of the frame they were received in.
+    '''
+    try:
+        msg = _FROM_WIRE[wire[0]](wire)
+    except (KeyError, TypeError, IndexError) as e:
+        raise MessageNotRecognizedError(f'Message {wire!r} not recognized.') from e
+    if nbytes and (wire[0] == _DATA_PAYLOAD or wire[0] == _BATCH_PAYLOAD):
+        msg.nbytes = nbytes
+    return msg
 
 
 
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import dataclasses
+import time
+import typing
+import multiprocessing.connection
+
+from .queue import ChannelID
+from .multimessenger import MultiMessenger
+
+MessengerType = typing.TypeVar('MessengerType', bound=MultiMessenger)
+
+@dataclasses.dataclass
+class MessengerSelector(typing.Generic[MessengerType]):
+    '''Wait on many messengers at once instead of polling each of them.
+        Uses multiprocessing.connection.wait when every connection has a file
+        descriptor, otherwise polls the connections every poll_interval seconds.
+    '''
+    messengers: typing.List[MessengerType]
+    poll_interval: float = 0.001
+
+    def select(self, timeout: typing.Optional[float] = None, channel_id: ChannelID = None) -> typing.List[MessengerType]:
+        '''Return the messengers that have queued messages on channel_id or unread data
+            in their pipe, blocking up to timeout seconds (forever if None). Returns an
+            empty list on timeout.
+        '''
+        ready = [m for m in self.messengers if m.queue_size(channel_id=channel_id) > 0 or m.pipe_poll()]
+        if len(ready) or timeout == 0:
+            return ready
+
+        for m in self.messengers:
+            m.flush(wait=False) # about to block: peers may be waiting on coalesced replies
+
+        by_pipe = {id(p): m for m in self.messengers for p in (m.pipe, m.control_pipe) if p is not None}
+        pipes = [p for m in self.messengers for p in (m.pipe, m.control_pipe) if p is not None]
+        return list({id(by_pipe[id(p)]): by_pipe[id(p)] for p in self._wait_alive(pipes, timeout)}.values())
+
+    def _wait_alive(self, pipes: typing.List[multiprocessing.connection.Connection], timeout: typing.Optional[float]) -> typing.List[multiprocessing.connection.Connection]:
+        '''Wait until at least one pipe is readable. If any messenger has heartbeats, wait in slices 
+            of half the shortest interval, sending heartbeats and checking on peers in between, so 
+            PeerDeadError is raised instead of waiting forever on a dead worker.
+        '''
+        intervals = [m.heartbeat_interval for m in self.messengers if m.heartbeat_interval is not None]
+        if not intervals:
+            return self._wait(pipes, timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for m in self.messengers:
+                m.heartbeat()
+                m.check_peer()
+            wait = min(intervals) / 2
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - time.monotonic()))
+            ready = self._wait(pipes, wait)
+            if len(ready) or (deadline is not None and time.monotonic() >= deadline):
+                return ready
+
+    def _wait(self, pipes: typing.List[multiprocessing.connection.Connection], timeout: typing.Optional[float]) -> typing.List[multiprocessing.connection.Connection]:
+        '''Wait until at least one pipe is readable.'''
+        if all(hasattr(p, 'fileno') for p in pipes):
+            return multiprocessing.connection.wait(pipes, timeout)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            ready = [p for p in pipes if p.poll()]
+            if len(ready) or (deadline is not None and time.monotonic() >= deadline):
+                return ready
+            time.sleep(self.poll_interval)
+
+    def __iter__(self) -> typing.Iterator[MessengerType]:
+        return iter(self.messengers)
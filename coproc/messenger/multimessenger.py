@@ -1,15 +1,33 @@
 from __future__ import annotations
+import contextlib
 import dataclasses
 import typing
 import multiprocessing
 import multiprocessing.connection
+import multiprocessing.context
+import multiprocessing.reduction
+import threading
 import traceback
+import time
+import concurrent.futures
 
 #from .prioritymessenger import PriorityMessenger
-from .queue import MultiQueue, ChannelID
-from .requestctr import RequestCtr
-from .messages import Message, SendPayloadType, RecvPayloadType, CloseRequestMessage, DataMessage, EncounteredErrorMessage, MessageType
-from .exceptions import ResourceRequestedClose, MessageNotRecognizedError
+from .queue import MultiQueue, SpillingMultiQueue, ChannelID, ANY_CHANNEL
+from .requestctr import RequestCtr, ChannelMetrics
+from .messages import Message, SendPayloadType, RecvPayloadType, CloseRequestMessage, DataMessage, EncounteredErrorMessage, BatchMessage, CreditGrantMessage, ChunkMessage, CancelMessage, HeartbeatMessage, StreamMessage, StreamAckMessage, MessageType, message_from_wire
+from .exceptions import ResourceRequestedClose, MessageNotRecognizedError, PeerDeadError
+from .codecs import CodecRegistry, DEFAULT_CODECS
+from .compression import AdaptiveCompressor, CompressionStats, decompress
+from .dedup import DedupCache, DedupStats, DEDUP_CODEC
+from .flowcontrol import FlowControl
+from .fairqueuing import WeightedFairScheduler
+from .backgroundwriter import BackgroundWriter
+from .busyheartbeats import BusyHeartbeats
+from .flushtimer import FlushTimer
+from .replyfuture import ReplyFuture
+from .bytestream import ByteStream
+from .outofband import dumps_out_of_band, recv_frames_out_of_band
+from .transport import new_connection_pair, TransportName, SocketListener, SocketAddress, socket_connect
 
 @dataclasses.dataclass
 class MultiMessenger(typing.Generic[SendPayloadType, RecvPayloadType]):
@@ -17,43 +35,230 @@ class MultiMessenger(typing.Generic[SendPayloadType, RecvPayloadType]):
         Importantly, this precludes the possibility of 
     '''
     pipe: multiprocessing.connection.Connection
+    control_pipe: typing.Optional[multiprocessing.connection.Connection] = None # separate lane for close requests, errors, credit grants and control_channels
+    control_channels: typing.Tuple[ChannelID, ...] = () # data on these channels is sent on control_pipe if there is one
     queue: MultiQueue[Message] = dataclasses.field(default_factory=MultiQueue)
     request_ctr: RequestCtr = dataclasses.field(default_factory=RequestCtr)
+    reply_batch_size: typing.Optional[int] = None # coalesce up to this many replies per send. None disables.
+    reply_batch_latency: float = 0.01 # max seconds a coalesced reply may be held before sending
+    out_of_band: bool = False # send buffers (arrays, bytearrays, large bytes) outside the pickle. must match on both ends.
+    out_of_band_min_bytes: int = 65536 # bytes objects at least this large are sent out-of-band
+    codecs: typing.Optional[CodecRegistry] = None # chooses payload serializer per channel/type. None pickles everything.
+    compression: typing.Optional[AdaptiveCompressor] = None # compresses large payloads. None disables.
+    flow_control_window: typing.Optional[int] = None # max unconsumed requests in flight per channel. must match on both ends. None disables.
+    background_send: bool = False # pickle and send from a writer thread so sends return immediately
+    send_priority: bool = False # send from a writer thread that takes queued messages in priority order. implies background_send.
+    send_chunk_bytes: typing.Optional[int] = None # split messages that pickle larger than this into chunks, so with send_priority urgent messages go out between them. ignored with out_of_band.
+    channel_weights: typing.Optional[typing.Dict[ChannelID, float]] = None # weighted fair queuing across channels for ANY_CHANNEL receives. None takes the best message.
+    drain_max_messages: typing.Optional[int] = None # once the channel has a message, read at most this many more before returning it. 0 returns immediately. None drains the pipe.
+    drain_max_seconds: typing.Optional[float] = None # once the channel has a message, spend at most this long reading more. None drains the pipe.
+    spill_after: typing.Optional[int] = None # keep at most this many received messages in memory and spill the rest to disk. None is unbounded.
+    spill_after_bytes: typing.Optional[int] = None # also spill once the received messages in memory total this many bytes, as received. None is unbounded.
+    spill_dir: typing.Optional[str] = None # directory for the spill file. None uses the default temporary directory.
+    heartbeat_interval: typing.Optional[float] = None # while we owe the peer replies, send a heartbeat if nothing else was sent for this many seconds. None disables.
+    heartbeat_misses: int = 3 # raise PeerDeadError if the peer owes us replies and sent nothing for this many heartbeat intervals
+    stream_chunk_bytes: int = 1 << 20 # frame size for send_stream
+    stream_window: typing.Optional[int] = 4 # max frames of a stream sent but not yet consumed by the peer. None sends without waiting.
+    dedup_min_bytes: typing.Optional[int] = None # send payloads at least this large as a digest if the peer has them cached. must match on both ends. None disables.
+    dedup_max_entries: int = 64 # payloads the peer caches for deduplication
+    dedup_max_bytes: int = 1 << 28 # total bytes the peer caches for deduplication
+    _reply_batch: typing.Dict[ChannelID, typing.List[typing.Tuple[SendPayloadType, typing.Optional[int]]]] = dataclasses.field(default_factory=dict, repr=False)
+    _reply_batch_ct: int = 0
+    _reply_batch_start: typing.Optional[float] = None
+    _flush_timer: typing.Optional[FlushTimer] = dataclasses.field(default=None, repr=False) # flushes coalesced replies once they have waited reply_batch_latency
+    _flush_error: typing.Optional[BaseException] = dataclasses.field(default=None, repr=False) # raised by the next flush
+    _send_lock: threading.RLock = dataclasses.field(default_factory=threading.RLock, repr=False) # serializes sends with the flush timer
+    _flow: typing.Optional[FlowControl] = dataclasses.field(default=None, repr=False)
+    _dedup: typing.Optional[DedupCache] = dataclasses.field(default=None, repr=False)
+    _writer: typing.Optional[BackgroundWriter] = dataclasses.field(default=None, repr=False)
+    _heartbeats: typing.Optional[BusyHeartbeats] = dataclasses.field(default=None, repr=False) # sends heartbeats inside busy()
+    _fair: typing.Optional[WeightedFairScheduler] = dataclasses.field(default=None, repr=False)
+    _next_stream_id: int = 0
+    _chunks: typing.Dict[int, typing.List[bytes]] = dataclasses.field(default_factory=dict, repr=False) # received chunks of incomplete messages by stream id
+    _streams: typing.Dict[int, ByteStream] = dataclasses.field(default_factory=dict, repr=False) # incoming streams whose last frame has not arrived
+    _stream_acks: typing.Dict[int, int] = dataclasses.field(default_factory=dict, repr=False) # frames of our outgoing streams the peer has consumed
+    _next_request_id: int = 0
+    _unanswered: typing.Dict[ChannelID, typing.Dict[int, None]] = dataclasses.field(default_factory=dict, repr=False) # popped requests not yet replied to, oldest first
+    _futures: typing.Dict[int, ReplyFuture] = dataclasses.field(default_factory=dict, repr=False)
+    _cancelled: typing.Set[int] = dataclasses.field(default_factory=set, repr=False) # our cancelled requests whose replies may still arrive
+    _cancel_pending: typing.Set[int] = dataclasses.field(default_factory=set, repr=False) # peer requests cancelled before they arrived
+    _cancel_running: typing.Set[int] = dataclasses.field(default_factory=set, repr=False) # peer requests cancelled after they were popped
+    _arrived_below: int = 1 # every peer request id below this has arrived (ids start at 1)
+    _arrived_above: typing.Set[int] = dataclasses.field(default_factory=set, repr=False) # peer request ids at or above _arrived_below that arrived out of order
+    _last_sent: float = 0.0 # monotonic time of the last write, tracked only with heartbeats
+    _last_received: float = 0.0 # monotonic time of the last read (or of the first outstanding request), tracked only with heartbeats
+
+    def __post_init__(self):
+        if self.dedup_min_bytes is not None and self.send_priority and self.send_chunk_bytes is not None:
+            raise ValueError('dedup_min_bytes cannot be used with send_priority and send_chunk_bytes, which let '
+                'messages overtake the chunks of a larger one, so a digest could arrive before its payload.')
+        if self.spill_after is not None or self.spill_after_bytes is not None:
+            self.queue = SpillingMultiQueue(max_items=self.spill_after, max_bytes=self.spill_after_bytes, spill_dir=self.spill_dir)
+
+    def __getstate__(self) -> dict:
+        '''Locks, timers and threads are not sent to the worker process; it makes its own.'''
+        state = self.__dict__.copy()
+        for name in ('_send_lock', '_flush_timer', '_writer', '_heartbeats'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._send_lock, self._flush_timer, self._writer, self._heartbeats = threading.RLock(), None, None, None
 
     @classmethod
-    def new_pair(cls, **kwargs) -> typing.Tuple[MultiMessenger, MultiMessenger]:
-        '''Return (process, resource) pair of messengers connected by a duplex pipe.'''
-        resource_pipe, process_pipe = multiprocessing.Pipe(duplex=True, **kwargs)
+    def new_pair(cls, 
+        transport: TransportName = 'pipe', 
+        ctx: typing.Optional[multiprocessing.context.BaseContext] = None,
+        transport_kwargs: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        control_lane: bool = False,
+        **kwargs
+    ) -> typing.Tuple[MultiMessenger, MultiMessenger]:
+        '''Return (process, resource) pair of messengers connected by a duplex connection.
+            transport is 'pipe' (multiprocessing.Pipe) or 'shared_memory' (shared memory rings).
+            If control_lane, a second pipe carries control messages so they are never stuck
+            behind large payloads on the data connection.
+        '''
+        resource_pipe, process_pipe = new_connection_pair(transport, ctx=ctx, **(transport_kwargs or {}))
+        resource_control, process_control = multiprocessing.Pipe(duplex=True) if control_lane else (None, None)
         return (
-            cls(pipe=process_pipe, **kwargs),
-            cls(pipe=resource_pipe, **kwargs),
+            cls(pipe=process_pipe, control_pipe=process_control, **kwargs),
+            cls(pipe=resource_pipe, control_pipe=resource_control, **kwargs),
         )
     
+    @classmethod
+    def connect(cls, address: SocketAddress, authkey: typing.Optional[bytes] = None, control_lane: bool = False, **kwargs) -> MultiMessenger:
+        '''Connect to a SocketListener at address, a (host, port) tuple for TCP or a path for a 
+            Unix domain socket, so the peer can be any process or machine. The peer is made by 
+            accept and needs matching options, e.g. flow_control_window.
+        '''
+        pipe, control_pipe = socket_connect(address, authkey=authkey, control_lane=control_lane)
+        return cls(pipe=pipe, control_pipe=control_pipe, **kwargs)
+    
+    @classmethod
+    def accept(cls, listener: SocketListener, **kwargs) -> MultiMessenger:
+        '''Block until a client calls connect on the listener's address and return the messenger 
+            talking to it. The client chooses whether there is a control lane.
+        '''
+        pipe, control_pipe = listener.accept()
+        return cls(pipe=pipe, control_pipe=control_pipe, **kwargs)
+    
     ############### Request/reply interface ###############
-    def send_request_multiple(self, data: typing.Iterable[SendPayloadType], channel_id: ChannelID = None) -> None:
-        '''Blocking send of multiple data to pipe.'''
-        for d in data:
-            self.send_request(d, channel_id=channel_id)
+    def send_request_multiple(self, data: typing.Iterable[SendPayloadType], channel_id: ChannelID = None, batch_size: typing.Optional[int] = None) -> None:
+        '''Blocking send of multiple requests, packed into batch frames of at most batch_size payloads.
+            With flow control, data is consumed lazily one window at a time by default.
+        '''
+        if batch_size is None:
+            batch_size = self.flow_control_window
+        for payloads in self._chunk_payloads(data, batch_size):
+            self.send_data_batch(payloads, request_reply=True, is_reply=False, channel_id=channel_id)
+    
+    def send_reply_multiple(self, data: typing.Iterable[SendPayloadType], channel_id: ChannelID = None, batch_size: typing.Optional[int] = None) -> None:
+        '''Blocking send of multiple replies, packed into batch frames of at most batch_size payloads.'''
+        for payloads in self._chunk_payloads(data, batch_size):
+            self.send_data_batch(payloads, request_reply=False, is_reply=True, channel_id=channel_id)
         
-    def send_request(self, data: SendPayloadType, channel_id: ChannelID = None) -> None:
-        '''Send data that requires a reply.'''
-        self.send_data_message(data, request_reply=True, is_reply=False, channel_id=channel_id)
+    def send_request(self, data: SendPayloadType, channel_id: ChannelID = None) -> int:
+        '''Send data that requires a reply. Returns the request id.'''
+        return self.send_data_message(data, request_reply=True, is_reply=False, channel_id=channel_id)
+    
+    def send_request_future(self, data: SendPayloadType, channel_id: ChannelID = None) -> ReplyFuture:
+        '''Send request and return a future resolved with the payload of its reply.
+            The reply resolves the future instead of being placed in the queue, so 
+            replies may complete in any order.
+        '''
+        request_id = self.send_request(data, channel_id=channel_id)
+        future = ReplyFuture(self, request_id, channel_id)
+        self._futures[request_id] = future
+        return future
         
-    def send_reply(self, data: SendPayloadType, channel_id: ChannelID = None) -> None:
-        '''Send data that acts as a reply to a request.'''
-        self.send_data_message(data, request_reply=False, is_reply=True, channel_id=channel_id)
+    def send_reply(self, data: SendPayloadType, channel_id: ChannelID = None, request_id: typing.Optional[int] = None) -> None:
+        '''Send data that acts as a reply to a request. May be coalesced if reply_batch_size is set.
+            Answers request_id, or the oldest received request on this channel not yet replied to.
+        '''
+        request_id = self._reply_request_id(channel_id, request_id)
+        if self.reply_batch_size is None:
+            self.send_data_message(data, request_reply=False, is_reply=True, channel_id=channel_id, request_id=request_id)
+        else:
+            self._buffer_reply(data, channel_id=channel_id, request_id=request_id)
     
     def send_norequest(self, data: SendPayloadType, channel_id: ChannelID = None) -> None:
         '''Send data that does not requre a reply.'''
         self.send_data_message(data, request_reply=False, is_reply=False, channel_id=channel_id)
     
+    def try_send_request(self, data: SendPayloadType, channel_id: ChannelID = None) -> bool:
+        '''Send request only if it would not wait for flow control credit. Returns whether it was sent.'''
+        if self.would_block(channel_id):
+            return False
+        self.send_request(data, channel_id=channel_id)
+        return True
+    
+    def try_send_norequest(self, data: SendPayloadType, channel_id: ChannelID = None) -> bool:
+        '''Send data without requesting a reply only if it would not wait for flow control credit.'''
+        if self.would_block(channel_id):
+            return False
+        self.send_norequest(data, channel_id=channel_id)
+        return True
+    
     ############### Sending various message types ###############
-    def send_data_message(self, payload: SendPayloadType, request_reply: bool, is_reply: bool, channel_id: ChannelID = None) -> None:
-        '''Send data message.'''
-        if request_reply:
-            self.request_ctr.sent_request(channel_id)
-        self.request_ctr.sent_message(channel_id)
-        self._send_message(DataMessage(payload=payload, request_reply=request_reply, is_reply=is_reply, channel_id=channel_id))
+    def send_data_message(self, payload: SendPayloadType, request_reply: bool, is_reply: bool, channel_id: ChannelID = None, request_id: typing.Optional[int] = None) -> typing.Optional[int]:
+        '''Send data message. Requests are given a new id, which is returned.'''
+        if self.flow_control_window is not None and not is_reply:
+            self._wait_for_credits(channel_id)
+            self._flow.take(channel_id, 1)
+        with self._send_lock:
+            if request_reply:
+                request_id = self._new_request_id()
+                self.request_ctr.sent_request(channel_id, request_id)
+            self.request_ctr.sent_message(channel_id)
+            msg = DataMessage(payload=payload, request_reply=request_reply, is_reply=is_reply, channel_id=channel_id, request_id=request_id)
+            if self.codecs is not None: # priority was taken from the payload before encoding
+                msg.codec, msg.payload = self.codecs.encode(payload, channel_id)
+            if self.compression is not None:
+                msg.codec, msg.compression, msg.payload = self.compression.compress(msg.payload, msg.codec, channel_id)
+            self._send_message(msg)
+            return request_id
+    
+    def send_data_batch(self, payloads: typing.List[SendPayloadType], request_reply: bool, is_reply: bool, channel_id: ChannelID = None, request_ids: typing.Optional[typing.List[typing.Optional[int]]] = None) -> None:
+        '''Send multiple payloads sharing the same header as a single batch frame.
+            With flow control, requests are split into frames as credit becomes available.
+            Replies answer request_ids, or the oldest received requests not yet replied to.
+        '''
+        if self.flow_control_window is not None and not is_reply:
+            i = 0
+            while i < len(payloads):
+                n = min(len(payloads) - i, self._wait_for_credits(channel_id))
+                self._flow.take(channel_id, n)
+                self._send_data_batch(payloads[i:i+n], request_reply, is_reply, channel_id)
+                i += n
+        else:
+            self._send_data_batch(payloads, request_reply, is_reply, channel_id, request_ids)
+    
+    def _send_data_batch(self, payloads: typing.List[SendPayloadType], request_reply: bool, is_reply: bool, channel_id: ChannelID, request_ids: typing.Optional[typing.List[typing.Optional[int]]] = None) -> None:
+        if not len(payloads):
+            return
+        with self._send_lock:
+            if request_reply:
+                request_ids = [self._new_request_id() for _ in payloads]
+                for request_id in request_ids:
+                    self.request_ctr.sent_request(channel_id, request_id)
+            elif is_reply and request_ids is None:
+                request_ids = [self._reply_request_id(channel_id, None) for _ in payloads]
+            for _ in payloads:
+                self.request_ctr.sent_message(channel_id)
+            codecs = None
+            if self.codecs is not None:
+                codecs, payloads = map(list, zip(*[self.codecs.encode(p, channel_id) for p in payloads]))
+                if not any(c is not None for c in codecs):
+                    codecs = None
+            compression = None
+            if self.compression is not None: # compress the payload list as a whole
+                _, compression, compressed = self.compression.compress(payloads, None, channel_id)
+                if compression is not None:
+                    payloads = compressed
+            if request_ids is not None and all(rid is None for rid in request_ids):
+                request_ids = None
+            self._send_message(BatchMessage(payloads=payloads, request_reply=request_reply, is_reply=is_reply, channel_id=channel_id, codecs=codecs, compression=compression, request_ids=request_ids))
         
     def send_close_request(self) -> None:
         '''Blocking send of close message to pipe.'''
@@ -65,7 +270,446 @@ class MultiMessenger(typing.Generic[SendPayloadType, RecvPayloadType]):
         self._send_message(EncounteredErrorMessage(exception))
         
     def _send_message(self, msg: Message) -> None:
-        return self.pipe.send(msg)
+        with self._send_lock:
+            if self.control_pipe is not None and self._is_control(msg):
+                return self._pipe_write(msg, self.control_pipe) # skips anything waiting for the data lane
+            self.flush(wait=False) # preserve ordering with any coalesced replies
+            return self._pipe_send(msg)
+    
+    def _is_control(self, msg: Message) -> bool:
+        '''Whether message belongs on the control lane.'''
+        if msg.mtype is MessageType.DATA_PAYLOAD or msg.mtype is MessageType.BATCH_PAYLOAD:
+            return msg.channel_id in self.control_channels
+        return msg.mtype is not MessageType.CHUNK and msg.mtype is not MessageType.STREAM
+    
+    def _pipe_send(self, msg: Message) -> None:
+        '''Send data to pipe, or queue it for the writer thread if background_send or send_priority is set.'''
+        if self.background_send or self.send_priority:
+            if self._writer is None:
+                self._writer = BackgroundWriter(self._pipe_write, prioritize=self.send_priority)
+            return self._writer.put(msg)
+        for chunk in self._pipe_write(msg) or ():
+            self._pipe_write(chunk)
+    
+    def _pipe_write(self, msg: Message, pipe: typing.Optional[multiprocessing.connection.Connection] = None) -> typing.Optional[typing.List[ChunkMessage]]:
+        '''Serialize message and write it to the pipe (data pipe if None). If it is larger than 
+            send_chunk_bytes, only the first chunk is written and the rest are returned to be 
+            written next. Messages on the control lane are not chunked.
+        '''
+        start = time.perf_counter()
+        if self.dedup_min_bytes is not None and pipe is None and msg.mtype is MessageType.DATA_PAYLOAD:
+            msg.codec, msg.payload = self._dedup_cache().encode(msg.codec, msg.payload) # in the order written to the data lane
+        if self.out_of_band:
+            frames = dumps_out_of_band(msg.to_wire(), min_bytes=self.out_of_band_min_bytes)
+        else:
+            frames = (multiprocessing.reduction.ForkingPickler.dumps(msg.to_wire()),)
+        elapsed = time.perf_counter() - start
+        if (self.send_chunk_bytes is not None and not self.out_of_band and pipe is None and 
+            msg.mtype is not MessageType.CHUNK and len(frames[0]) > self.send_chunk_bytes):
+            self.request_ctr.serialized(getattr(msg, 'channel_id', None), 0, elapsed) # bytes are counted per chunk
+            chunks = self._split_chunks(msg, frames[0])
+            self._pipe_write(chunks[0])
+            return chunks[1:]
+        pipe = self.pipe if pipe is None else pipe
+        if self.heartbeat_interval is not None:
+            self._last_sent = time.monotonic()
+        self._write_frames(pipe, frames)
+        nbytes = sum(len(frame) if type(frame) is bytes else memoryview(frame).nbytes for frame in frames)
+        self.request_ctr.serialized(getattr(msg, 'channel_id', None), nbytes, elapsed)
+    
+    def _write_frames(self, pipe: multiprocessing.connection.Connection, frames: typing.Sequence[typing.Any]) -> None:
+        '''Write the serialized frames of one message to the pipe.'''
+        for frame in frames:
+            pipe.send_bytes(frame)
+    
+    def _split_chunks(self, msg: Message, data: bytes) -> typing.List[ChunkMessage]:
+        '''Split serialized message into chunks of send_chunk_bytes sharing a new stream id.'''
+        stream_id, self._next_stream_id = self._next_stream_id, self._next_stream_id + 1
+        view, n = memoryview(data), self.send_chunk_bytes
+        channel_id = getattr(msg, 'channel_id', None)
+        return [ChunkMessage(channel_id, stream_id, view[i:i+n], i + n >= len(data), msg.priority) for i in range(0, len(data), n)]
+    
+    @staticmethod
+    def _chunk_payloads(data: typing.Iterable[SendPayloadType], batch_size: typing.Optional[int]) -> typing.Generator[typing.List[SendPayloadType]]:
+        '''Split data into lists of at most batch_size elements (all data if None).'''
+        if batch_size is None:
+            yield list(data)
+            return
+        chunk = list()
+        for d in data:
+            chunk.append(d)
+            if len(chunk) >= batch_size:
+                yield chunk
+                chunk = list()
+        if len(chunk):
+            yield chunk
+    
+    ############### Reply coalescing ###############
+    def _buffer_reply(self, data: SendPayloadType, channel_id: ChannelID, request_id: typing.Optional[int]) -> None:
+        '''Hold reply until the batch is full or it has waited reply_batch_latency seconds.
+            A timer sends it then even if the messenger is not used meanwhile.
+        '''
+        with self._send_lock:
+            if self._reply_batch_start is None:
+                self._reply_batch_start = time.monotonic()
+                self._schedule_flush(self.reply_batch_latency)
+            self._reply_batch.setdefault(channel_id, list()).append((data, request_id))
+            self._reply_batch_ct += 1
+            full = self._reply_batch_ct >= self.reply_batch_size
+        if full:
+            self.flush(wait=False)
+        else:
+            self._flush_if_expired()
+    
+    def _schedule_flush(self, delay: float) -> None:
+        '''Flush coalesced replies in delay seconds from the timer thread, started on first use.'''
+        if self._flush_timer is None:
+            self._flush_timer = FlushTimer(self._flush_from_timer)
+        self._flush_timer.schedule(delay)
+    
+    def _flush_from_timer(self) -> None:
+        '''Flush the coalesced replies. Errors are raised by the next flush.'''
+        try:
+            self.flush(wait=False)
+        except BaseException as e:
+            traceback.clear_frames(e.__traceback__) # the finished frames hold the messenger
+            self._flush_error = e
+    
+    def _flush_before_wait(self) -> None:
+        '''Called before blocking on the peer: it may be waiting on coalesced replies.'''
+        if self._reply_batch_ct and not self._poll():
+            self.flush(wait=False)
+    
+    def _flush_if_expired(self) -> None:
+        '''Flush coalesced replies that have been held longer than reply_batch_latency.'''
+        if self._reply_batch_start is not None and time.monotonic() - self._reply_batch_start >= self.reply_batch_latency:
+            self.flush(wait=False)
+    
+    def flush(self, wait: bool = True) -> None:
+        '''Send any coalesced replies now. If wait, also wait until the writer thread has sent
+            all queued messages and raise any error it encountered. Raises any error the flush
+            timer encountered.
+        '''
+        if self._flush_error is not None:
+            error, self._flush_error = self._flush_error, None
+            raise error
+        with self._send_lock:
+            self._send_coalesced()
+        if wait and self._writer is not None:
+            self._writer.flush()
+    
+    def _send_coalesced(self) -> None:
+        if not self._reply_batch_ct:
+            return
+        batch = self._reply_batch
+        self._reply_batch = dict()
+        self._reply_batch_ct = 0
+        self._reply_batch_start = None
+        self._cancel_flush_timer()
+        for channel_id, replies in batch.items():
+            payloads, request_ids = map(list, zip(*replies))
+            self.send_data_batch(payloads, request_reply=False, is_reply=True, channel_id=channel_id, request_ids=request_ids)
+    
+    def _cancel_flush_timer(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+    
+    def pending_replies(self) -> int:
+        '''Number of coalesced replies not yet sent.'''
+        return self._reply_batch_ct
+    
+    def pending_sends(self) -> int:
+        '''Number of messages queued for the writer thread but not yet sent.'''
+        return self._writer.pending() if self._writer is not None else 0
+    
+    ############### Closing ###############
+    def close(self) -> None:
+        '''Send coalesced replies and the messages queued for the writer thread, stop the
+            writer, flush timer and heartbeat threads and close the connections. Errors sending to a peer that has
+            gone away are ignored. Calling it again does nothing.
+        '''
+        try:
+            self.flush(wait=False)
+        except (EOFError, OSError):
+            pass
+        self._cancel_flush_timer()
+        if self._flush_timer is not None:
+            self._flush_timer.close()
+            self._flush_timer = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._heartbeats is not None:
+            self._heartbeats.close()
+            self._heartbeats = None
+        self._close_pipes()
+    
+    def _close_pipes(self) -> None:
+        self.pipe.close()
+        if self.control_pipe is not None:
+            self.control_pipe.close()
+    
+    ############### Streaming large payloads ###############
+    def send_stream(self, data: typing.Union[bytes, bytearray, memoryview, typing.Iterable[typing.Any]], channel_id: ChannelID = None, metadata: typing.Any = None) -> None:
+        '''Send a large payload as frames of at most stream_chunk_bytes instead of one pickle.
+            Objects with the buffer protocol (bytes, bytearray, memoryview, contiguous arrays)
+            are sliced in place; other iterables of such chunks are pulled one at a time. The 
+            peer receives a ByteStream payload carrying metadata (whose priority attribute, if 
+            any, orders it in the queue). With stream_window, waits for the peer to consume 
+            frames so at most that many are in flight; messages arriving meanwhile are queued.
+        '''
+        try:
+            size, chunks = memoryview(data).nbytes, (data,)
+        except TypeError:
+            size, chunks = None, data
+        stream_id, self._next_stream_id = self._next_stream_id, self._next_stream_id + 1
+        header = (metadata, size, self.stream_window)
+        priority = getattr(metadata, 'priority', float('inf'))
+        self.request_ctr.sent_message(channel_id)
+        self._stream_acks[stream_id] = 0
+        try:
+            frames = self._stream_frames(chunks)
+            frame, sent = next(frames, b''), 0
+            while True:
+                following = next(frames, None) # look ahead to mark the last frame
+                while self.stream_window is not None and sent - self._stream_acks[stream_id] >= self.stream_window:
+                    self._wait(None)
+                    self._receive_and_handle()
+                self._send_message(StreamMessage(channel_id, stream_id, frame, following is None, header, priority))
+                header, sent = None, sent + 1
+                if following is None:
+                    return
+                frame = following
+        finally:
+            del self._stream_acks[stream_id]
+    
+    def _stream_frames(self, chunks: typing.Iterable[typing.Any]) -> typing.Generator[memoryview]:
+        '''Slices of at most stream_chunk_bytes of each bytes-like chunk. Empty chunks are skipped.'''
+        n = self.stream_chunk_bytes
+        for chunk in chunks:
+            view = memoryview(chunk).cast('B')
+            for i in range(0, len(view), n):
+                yield view[i:i+n]
+    
+    def _handle_stream(self, msg: StreamMessage) -> None:
+        '''Queue a ByteStream when the first frame of a stream arrives and give it each frame.'''
+        if msg.header is not None:
+            metadata, size, window = msg.header
+            stream = self._streams[msg.stream_id] = ByteStream(self, msg.stream_id, metadata, size, window)
+            self._queue_data(DataMessage(stream, False, False, msg.channel_id, priority=getattr(metadata, 'priority', float('inf')),
+                deadline=getattr(metadata, 'deadline', None)), time.monotonic())
+        stream = self._streams.pop(msg.stream_id) if msg.last else self._streams[msg.stream_id]
+        stream._put(msg.data, msg.last)
+    
+    def _await_stream(self, stream: ByteStream) -> None:
+        '''Receive and handle one message while a ByteStream waits for its next frame.'''
+        self._wait(None)
+        self._receive_and_handle()
+    
+    def _ack_stream(self, stream_id: int) -> None:
+        '''Tell the sender one more frame of its stream was consumed.'''
+        self._send_message(StreamAckMessage(stream_id, 1))
+    
+    ############### Request ids ###############
+    def _new_request_id(self) -> int:
+        if self.heartbeat_interval is not None and not self.request_ctr.awaiting_replies():
+            self._last_received = time.monotonic() # the peer's silence counts from when it first owes us a reply
+        self._next_request_id += 1
+        return self._next_request_id
+    
+    def _reply_request_id(self, channel_id: ChannelID, request_id: typing.Optional[int]) -> typing.Optional[int]:
+        '''Id of the request a reply answers: the given one, or the oldest request 
+            popped on this channel that has not been answered.
+        '''
+        unanswered = self._unanswered.get(channel_id)
+        if not unanswered:
+            return request_id
+        if request_id is None:
+            request_id = next(iter(unanswered))
+        unanswered.pop(request_id, None)
+        if self._cancel_running:
+            self._cancel_running.discard(request_id)
+        return request_id
+    
+    def _await_future(self, future: ReplyFuture, timeout: typing.Optional[float]) -> None:
+        '''Receive and handle messages until the future is resolved.'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not future.done():
+            if not self._wait(deadline):
+                raise TimeoutError(f'No reply to request {future.request_id} within {timeout} seconds.')
+            self._receive_and_handle()
+    
+    def _resolve_future(self, msg: DataMessage) -> None:
+        '''Count reply as received and set the result of the future waiting on it.'''
+        future = self._futures.pop(msg.request_id)
+        self.request_ctr.received_reply(msg.channel_id)
+        self.request_ctr.received_message(msg.channel_id)
+        if not future.cancelled():
+            future.set_result(msg.payload)
+    
+    ############### Cancellation ###############
+    def cancel(self, request_ids: typing.Optional[typing.Iterable[int]] = None, channel_id: ChannelID = None) -> int:
+        '''Cancel requests on this channel whose replies have not been received (all of them
+            if request_ids is None). Their replies are dropped from the queue or discarded on
+            arrival and remaining() stops counting them. The peer removes the requests it has 
+            not started and can check is_cancelled for the one it is running. Returns the 
+            number of requests cancelled.
+        '''
+        waiting = self.request_ctr.request_times.get(channel_id, {})
+        if request_ids is None:
+            queued = self.queue.remove(channel_id, lambda m: m.is_reply)
+            in_flight = list(waiting)
+        else:
+            ids = set(request_ids)
+            queued = self.queue.remove(channel_id, lambda m: m.is_reply and m.request_id in ids)
+            in_flight = [i for i in ids if i in waiting]
+        
+        for request_id in in_flight:
+            future = self._futures.pop(request_id, None)
+            if future is not None:
+                concurrent.futures.Future.cancel(future)
+        self.request_ctr.cancelled_requests(channel_id, [m.request_id for m in queued] + in_flight)
+        if in_flight:
+            self._cancelled.update(in_flight)
+            self._send_message(CancelMessage(channel_id, in_flight))
+        return len(queued) + len(in_flight)
+    
+    def is_cancelled(self, request_id: int) -> bool:
+        '''Whether the peer cancelled this request after it was popped. Long-running handlers
+            can check this to stop early; they should still reply, and the reply is discarded.
+        '''
+        self._receive_and_handle_available()
+        return request_id in self._cancel_running
+    
+    def _handle_cancel(self, msg: CancelMessage) -> None:
+        '''Remove cancelled requests not yet started and acknowledge them, or forget 
+            acknowledged requests of ours that will never be answered.
+        '''
+        if msg.ack:
+            self._cancelled.difference_update(msg.request_ids)
+            return
+        ids = set(msg.request_ids)
+        removed = self.queue.remove(msg.channel_id, lambda m: not m.is_reply and m.request_id in ids)
+        if self.flow_control_window is not None:
+            for m in removed:
+                self._grant_credit(m)
+        unanswered = self._unanswered.get(msg.channel_id, {})
+        self._cancel_running.update(i for i in ids if i in unanswered)
+        unseen = [i for i in ids if not self._arrived(i)]
+        self._cancel_pending.update(unseen)
+        if removed or unseen:
+            self._send_message(CancelMessage(msg.channel_id, [m.request_id for m in removed] + unseen, ack=True))
+    
+    def _arrived(self, request_id: int) -> bool:
+        '''Whether the peer request with this id has arrived. Checked per id because with
+            send_priority the peer's requests can arrive out of id order.
+        '''
+        return request_id < self._arrived_below or request_id in self._arrived_above
+    
+    def _mark_arrived(self, request_id: int) -> None:
+        '''Record arrival of a peer request. Every id the peer allocates is sent, so the ids
+            above _arrived_below are only held until the gaps below them fill in.
+        '''
+        if request_id != self._arrived_below:
+            self._arrived_above.add(request_id)
+            return
+        self._arrived_below += 1
+        while self._arrived_above and self._arrived_below in self._arrived_above:
+            self._arrived_above.remove(self._arrived_below)
+            self._arrived_below += 1
+    
+    ############### Heartbeats ###############
+    def heartbeat(self) -> None:
+        '''Send a heartbeat if heartbeats are on, we owe the peer replies, and nothing was sent 
+            for heartbeat_interval seconds; any other message counts as one. Called while waiting
+            on the pipe; handlers that may run longer than heartbeat_interval * heartbeat_misses 
+            should call it (or is_cancelled) periodically, or run inside busy(), so the peer does
+            not think they hung.
+        '''
+        if self.heartbeat_interval is None or time.monotonic() - self._last_sent < self.heartbeat_interval:
+            return
+        if any(self._unanswered.values()) or self.queue.size(ANY_CHANNEL):
+            self._last_sent = time.monotonic() # in case the writer thread sends it later
+            self._send_message(HeartbeatMessage())
+    
+    def busy(self) -> typing.ContextManager[None]:
+        '''Context in which a background thread sends heartbeats, for a handler that runs a
+            long task without using the messenger. The messenger must not be used inside it.
+            Does nothing if heartbeats are off.
+        '''
+        if self.heartbeat_interval is None:
+            return contextlib.nullcontext()
+        if self._heartbeats is None:
+            self._heartbeats = BusyHeartbeats(self.heartbeat, self.heartbeat_interval)
+        return self._heartbeats.busy()
+    
+    def check_peer(self) -> None:
+        '''Raise PeerDeadError if heartbeats are on, the peer owes us replies, and nothing 
+            arrived from it for heartbeat_interval * heartbeat_misses seconds.
+        '''
+        if self.heartbeat_interval is None:
+            return
+        silent = time.monotonic() - self._last_received
+        if silent > self.heartbeat_interval * self.heartbeat_misses and self.request_ctr.awaiting_replies():
+            raise PeerDeadError(f'Peer sent nothing for {silent:.3f} seconds while {self.request_ctr.awaiting_replies()} '
+                f'replies were outstanding (heartbeat_interval={self.heartbeat_interval}, heartbeat_misses={self.heartbeat_misses}).')
+    
+    def _wait(self, deadline: typing.Optional[float]) -> bool:
+        '''Wait until either lane has data or the monotonic deadline passes (no waiting if None 
+            and heartbeats are off: the following read blocks). With heartbeats, waits in slices
+            of half an interval, sending heartbeats and checking on the peer in between.
+        '''
+        self._flush_before_wait()
+        if self.heartbeat_interval is None:
+            return deadline is None or self._poll(max(0.0, deadline - time.monotonic()))
+        while True:
+            self.heartbeat()
+            self.check_peer()
+            timeout = self.heartbeat_interval / 2
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    return self._poll()
+            if self._poll(timeout):
+                return True
+    
+    ############### Flow control ###############
+    def would_block(self, channel_id: ChannelID = None, n: int = 1) -> bool:
+        '''Whether sending n requests on this channel now would wait for credit from the peer.'''
+        if self.flow_control_window is None:
+            return False
+        self._receive_and_handle_available() # pick up any grants
+        return self._flow_control().credits(channel_id) < n
+    
+    def credits(self, channel_id: ChannelID = None) -> typing.Optional[int]:
+        '''Requests that can be sent on this channel without waiting. None without flow control.'''
+        if self.flow_control_window is None:
+            return None
+        return self._flow_control().credits(channel_id)
+    
+    def _wait_for_credits(self, channel_id: ChannelID) -> int:
+        '''Receive and handle messages until the peer has granted credit on this channel.'''
+        flow = self._flow_control()
+        while flow.credits(channel_id) < 1:
+            self._wait(None)
+            self._receive_and_handle()
+        return flow.credits(channel_id)
+    
+    def _grant_credit(self, msg: DataMessage) -> None:
+        '''Return credit to the peer once enough of its requests have been consumed.'''
+        n = self._flow_control().consume(msg.channel_id)
+        if not n:
+            return
+        with self._send_lock:
+            if self.control_pipe is not None:
+                self._pipe_write(CreditGrantMessage(msg.channel_id, n), self.control_pipe)
+            else:
+                self._pipe_send(CreditGrantMessage(msg.channel_id, n))
+    
+    def _flow_control(self) -> FlowControl:
+        if self._flow is None:
+            self._flow = FlowControl(self.flow_control_window)
+        return self._flow
                 
     #################### Receive all messages we are waiting on ####################
     def receive_remaining(self, channel_id: ChannelID = None) -> typing.Generator[RecvPayloadType]:
@@ -78,9 +722,11 @@ class MultiMessenger(typing.Generic[SendPayloadType, RecvPayloadType]):
             yield self.receive_message_blocking(channel_id=channel_id)
     
     #################### Wait until we receive the next relevant message ####################
-    def receive_blocking(self, channel_id: ChannelID = None) -> RecvPayloadType:
-        '''Blocking receive payload from next data message of this channel.'''
-        return self.receive_message_blocking(channel_id=channel_id).payload
+    def receive_blocking(self, channel_id: ChannelID = None, timeout: typing.Optional[float] = None) -> RecvPayloadType:
+        '''Blocking receive payload from next data message of this channel.
+            Raises TimeoutError if nothing arrives within timeout seconds.
+        '''
+        return self.receive_message_blocking(channel_id=channel_id, timeout=timeout).payload
             
     #################### Asynchronous availability methods ####################
     def receive_available(self, channel_id: ChannelID = None) -> typing.List[RecvPayloadType]:
@@ -94,18 +740,60 @@ class MultiMessenger(typing.Generic[SendPayloadType, RecvPayloadType]):
         return available
     
     def pop_from_queue(self, channel_id: ChannelID = None) -> RecvPayloadType:
-        '''Pop the next item from the queue.'''
+        '''Pop the next item from the queue. ANY_CHANNEL pops from the channel chosen by _select_channel.'''
+        if channel_id is ANY_CHANNEL:
+            channel_id = self._select_channel()
         msg = self.queue.get(channel_id=channel_id)
+        self.request_ctr.popped(msg.channel_id, time.monotonic() - msg.queued_at)
         if msg.is_reply:
             self.request_ctr.received_reply(msg.channel_id)
+        elif msg.request_reply and msg.request_id is not None:
+            self._unanswered.setdefault(msg.channel_id, dict())[msg.request_id] = None
+        if not msg.is_reply and self.flow_control_window is not None:
+            self._grant_credit(msg)
         self.request_ctr.received_message(msg.channel_id)
         return msg
     
+    def _select_channel(self) -> ChannelID:
+        '''Channel to pop from for ANY_CHANNEL: by weighted fair queuing if channel_weights
+            is set, otherwise the channel whose next message comes first by _channel_order_key.
+        '''
+        channels = self.queue.nonempty_channels()
+        if not channels:
+            raise IndexError('Cannot pop from empty queue')
+        if self.channel_weights is None:
+            return min(channels, key=self._channel_order_key)
+        if self._fair is None:
+            self._fair = WeightedFairScheduler(self.channel_weights)
+        channel_id = min(channels, key=lambda c: (self._fair.next_tag(c), self.queue.peek(c).queued_at))
+        self._fair.served(channel_id)
+        return channel_id
+    
+    def _channel_order_key(self, channel_id: ChannelID) -> typing.Any:
+        '''Sort key of the next message on this channel for ANY_CHANNEL receives: arrival time.'''
+        return self.queue.peek(channel_id).queued_at
+    
     #################### Low-level message handling ####################
     
-    def receive_message_blocking(self, channel_id: ChannelID = None) -> DataMessage:
-        '''Receive until receiving a message with the given channel, then return it.'''
-        while self.pipe.poll() or self.queue.empty(channel_id=channel_id):
+    def receive_message_blocking(self, channel_id: ChannelID = None, timeout: typing.Optional[float] = None) -> DataMessage:
+        '''Receive until receiving a message with the given channel, then return it.
+            By default the pipe is drained first so the best queued message is returned; 
+            drain_max_messages and drain_max_seconds bound that to cut latency under a flood.
+            Raises TimeoutError if nothing arrives within timeout seconds.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        drained, drain_until = 0, None
+        while self._poll() or self.queue.empty(channel_id=channel_id):
+            if self.drain_max_messages is not None or self.drain_max_seconds is not None:
+                if not self.queue.empty(channel_id=channel_id): # message ready, only draining backlog
+                    if drain_until is None and self.drain_max_seconds is not None:
+                        drain_until = time.monotonic() + self.drain_max_seconds
+                    if ((self.drain_max_messages is not None and drained >= self.drain_max_messages) or 
+                        (drain_until is not None and time.monotonic() >= drain_until)):
+                        break
+                    drained += 1
+            if not self._wait(deadline):
+                raise TimeoutError(f'No message received on channel {channel_id} within {timeout} seconds.')
             self._receive_and_handle()
         return self.pop_from_queue(channel_id=channel_id)
     
@@ -117,13 +805,17 @@ class MultiMessenger(typing.Generic[SendPayloadType, RecvPayloadType]):
     def await_available(self) -> None:
         '''Wait until at least one message is received on any channel and placed into queue.'''
         blocking = True
-        while self.pipe.poll() or blocking:
+        while self._poll() or blocking:
+            if blocking:
+                self._wait(None)
             self._receive_and_handle()
             blocking = False
     
     def _receive_and_handle_available(self) -> None:
         '''Receive all data from pipe and place into queue.'''
-        while self.pipe.poll():
+        self._flush_if_expired()
+        self.heartbeat()
+        while self._poll():
             self._receive_and_handle()
         
     ############### Handling messages ###############
@@ -135,7 +827,54 @@ class MultiMessenger(typing.Generic[SendPayloadType, RecvPayloadType]):
     def _handle_message(self, msg: Message) -> None:
         '''Take appropriate action for message type. If data, add to queue.'''
         if msg.mtype is MessageType.DATA_PAYLOAD:
-            self._queue_put(msg)
+            if msg.codec == DEDUP_CODEC:
+                msg.codec, msg.payload = self._dedup_cache().resolve(msg.payload)
+                msg.nbytes = max(msg.nbytes, len(msg.payload)) # a reference decodes to the full payload
+            if msg.compression is not None:
+                msg.payload = decompress(msg.compression, msg.payload)
+                msg.compression = None
+            if msg.codec is not None:
+                msg.payload = self._decoder().decode(msg.codec, msg.payload)
+                msg.codec = None
+            self._queue_data(msg, time.monotonic())
+        
+        elif msg.mtype is MessageType.BATCH_PAYLOAD:
+            msg: BatchMessage
+            if msg.compression is not None:
+                msg.payloads = self._decoder().decode('pickle', decompress(msg.compression, msg.payloads))
+                msg.compression = None
+            if msg.codecs is not None:
+                decoder = self._decoder()
+                msg.payloads = [p if c is None else decoder.decode(c, p) for c, p in zip(msg.codecs, msg.payloads)]
+                msg.codecs = None
+            now = time.monotonic()
+            for dmsg in msg.data_messages():
+                self._queue_data(dmsg, now)
+            
+        elif msg.mtype is MessageType.CREDIT_GRANT:
+            msg: CreditGrantMessage
+            self._flow_control().received_grant(msg.channel_id, msg.credits)
+        
+        elif msg.mtype is MessageType.CANCEL:
+            self._handle_cancel(msg)
+        
+        elif msg.mtype is MessageType.STREAM:
+            self._handle_stream(msg)
+        
+        elif msg.mtype is MessageType.STREAM_ACK:
+            msg: StreamAckMessage
+            if msg.stream_id in self._stream_acks:
+                self._stream_acks[msg.stream_id] += msg.frames
+        
+        elif msg.mtype is MessageType.HEARTBEAT:
+            pass # arrival time was recorded by _pipe_recv
+        
+        elif msg.mtype is MessageType.CHUNK:
+            msg: ChunkMessage
+            self._chunks.setdefault(msg.stream_id, list()).append(msg.data)
+            if msg.last:
+                data = b''.join(self._chunks.pop(msg.stream_id))
+                self._handle_message(message_from_wire(multiprocessing.reduction.ForkingPickler.loads(data), len(data)))
             
         elif msg.mtype is MessageType.ENCOUNTERED_ERROR:
             ex = msg.exception
@@ -148,16 +887,62 @@ class MultiMessenger(typing.Generic[SendPayloadType, RecvPayloadType]):
         else:
             raise MessageNotRecognizedError(f'Message of type {msg.mtype} not recognized.')
         
+    def _queue_data(self, msg: DataMessage, now: float) -> None:
+        '''Put data message into queue, or resolve the future waiting on this reply.'''
+        msg.queued_at = now
+        if msg.is_reply:
+            if self._cancelled and msg.request_id in self._cancelled:
+                return self._cancelled.discard(msg.request_id)
+            self.request_ctr.reply_arrived(msg.channel_id, now, msg.request_id)
+            if msg.request_id in self._futures:
+                return self._resolve_future(msg)
+        elif msg.request_id is not None:
+            self._mark_arrived(msg.request_id)
+            if self._cancel_pending and msg.request_id in self._cancel_pending:
+                self._cancel_pending.discard(msg.request_id)
+                if self.flow_control_window is not None:
+                    self._grant_credit(msg)
+                return
+        self._queue_put(msg)
+    
+    def _dedup_cache(self) -> DedupCache:
+        if self._dedup is None:
+            self._dedup = DedupCache(self.dedup_min_bytes, self.dedup_max_entries, self.dedup_max_bytes)
+        return self._dedup
+    
+    def _decoder(self) -> CodecRegistry:
+        '''Registry used to decode received payloads. Builtin codecs if none was given.'''
+        return self.codecs if self.codecs is not None else DEFAULT_CODECS
+        
     def _queue_put(self, msg: Message) -> None:
         '''Put message into queue. Does not include priority.'''
-        self.queue.put(msg, msg.channel_id)
+        if isinstance(self.queue, SpillingMultiQueue):
+            self.queue.put(msg, msg.channel_id, msg.nbytes, spill=not isinstance(msg.payload, ByteStream)) # streams read from the live messenger
+        else:
+            self.queue.put(msg, msg.channel_id)
         
     def _pipe_recv(self) -> Message:
-        '''Receive data from pipe.'''
+        '''Receive data from pipe, taking the control lane first if it has data.'''
+        pipe = self.pipe
+        if self.control_pipe is not None:
+            self._poll(None)
+            if self.control_pipe.poll():
+                pipe = self.control_pipe
         try:
-            return self.pipe.recv()
+            if self.out_of_band:
+                data, buffers = recv_frames_out_of_band(pipe)
+                nbytes = len(data) + sum(len(b) for b in buffers)
+            else:
+                data, buffers = pipe.recv_bytes(), None
+                nbytes = len(data)
         except (EOFError, BrokenPipeError):
             raise BrokenPipeError(f'Tried to receive data when pipe was broken.')
+        if self.heartbeat_interval is not None:
+            self._last_received = time.monotonic()
+        start = time.perf_counter()
+        msg = message_from_wire(multiprocessing.reduction.ForkingPickler.loads(data, buffers=buffers), nbytes)
+        self.request_ctr.deserialized(getattr(msg, 'channel_id', None), nbytes, time.perf_counter() - start)
+        return msg
 
 
     ############### Check on pipe, queue, and send/receive counts ###############    
@@ -177,11 +962,43 @@ class MultiMessenger(typing.Generic[SendPayloadType, RecvPayloadType]):
     def messages_received(self, channel_id: ChannelID = None) -> int:
         return self.request_ctr.messages_received(channel_id)
     
+    def metrics(self) -> typing.Dict[ChannelID, ChannelMetrics]:
+        '''Snapshot of bytes, serialization time, round-trip latency and time-in-queue per channel.'''
+        return self.request_ctr.snapshot()
+    
+    def compression_stats(self, channel_id: ChannelID = None) -> CompressionStats:
+        '''Compression counts for messages sent on this channel.'''
+        if self.compression is None:
+            return CompressionStats()
+        return self.compression.stats(channel_id)
+    
+    def dedup_stats(self) -> DedupStats:
+        '''Counts of payloads sent whole or as digests of payloads the peer had cached.'''
+        if self._dedup is None:
+            return DedupStats()
+        return dataclasses.replace(self._dedup.stats)
+    
     def queue_size(self, channel_id: ChannelID = None) -> int:
         '''Current size of queue.'''
         return self.queue.size(channel_id=channel_id)
     
     def pipe_poll(self) -> bool:
         '''Check if any items are in the pipe.'''
-        return self.pipe.poll()
+        return self._poll()
+    
+    def _poll(self, timeout: typing.Optional[float] = 0.0) -> bool:
+        '''Whether either lane has data, waiting up to timeout seconds (forever if None).'''
+        if self.control_pipe is None:
+            return self.pipe.poll(timeout)
+        if self.control_pipe.poll() or self.pipe.poll():
+            return True
+        if timeout == 0:
+            return False
+        if hasattr(self.pipe, 'fileno'):
+            return len(multiprocessing.connection.wait([self.control_pipe, self.pipe], timeout)) > 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not (self.control_pipe.poll() or self.pipe.poll(0.001)): # shared memory has no file descriptor
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
     
\ No newline at end of file
@@ -0,0 +1,52 @@
+from __future__ import annotations
+import copyreg
+import io
+import pickle
+import struct
+import typing
+import multiprocessing.connection
+import multiprocessing.reduction
+
+# header: number of out-of-band buffers followed by the size of each
+_COUNT = struct.Struct('!I')
+_SIZE = struct.Struct('!Q')
+
+class OutOfBandPickler(pickle.Pickler):
+    '''Protocol 5 pickler that also moves large bytes objects out-of-band.
+        Contiguous numpy arrays, bytearrays and pickle.PickleBuffer objects are
+        already handed to buffer_callback by protocol 5. Uses the same reducers
+        as multiprocessing so connections etc. can still be sent.
+    '''
+    def __init__(self, file: io.BytesIO, buffer_callback: typing.Callable, min_bytes: int):
+        super().__init__(file, protocol=5, buffer_callback=buffer_callback)
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table.update(multiprocessing.reduction.ForkingPickler._extra_reducers)
+        self.min_bytes = min_bytes
+
+    def reducer_override(self, obj: typing.Any):
+        if type(obj) is bytes and len(obj) >= self.min_bytes:
+            return bytes, (pickle.PickleBuffer(obj),)
+        return NotImplemented
+
+def dumps_out_of_band(obj: typing.Any, min_bytes: int) -> typing.List[typing.Any]:
+    '''Pickle object into frames: a header with buffer sizes, the pickle, then each buffer.'''
+    buffers: typing.List[pickle.PickleBuffer] = list()
+    f = io.BytesIO()
+    OutOfBandPickler(f, buffer_callback=buffers.append, min_bytes=min_bytes).dump(obj)
+
+    raws = [b.raw() for b in buffers]
+    header = _COUNT.pack(len(raws)) + b''.join(_SIZE.pack(r.nbytes) for r in raws)
+    return [header, f.getbuffer(), *raws]
+
+def recv_frames_out_of_band(conn: multiprocessing.connection.Connection) -> typing.Tuple[bytes, typing.List[bytearray]]:
+    '''Receive the pickle and its buffers written as the frames of dumps_out_of_band, reading buffers into preallocated memory.'''
+    header = conn.recv_bytes()
+    (n,) = _COUNT.unpack_from(header)
+    data = conn.recv_bytes()
+    buffers = list()
+    for i in range(n):
+        (size,) = _SIZE.unpack_from(header, _COUNT.size + i*_SIZE.size)
+        buf = bytearray(size)
+        conn.recv_bytes_into(buf)
+        buffers.append(buf)
+    return data, buffers
@@ -8,28 +8,41 @@ import traceback
 
 from .messages import SendPayloadType, RecvPayloadType, Message, MessageType, DataMessage, EncounteredErrorMessage, CloseRequestMessage
 from .exceptions import ResourceRequestedClose, MessageNotRecognizedError
-from .queue import PriorityMultiQueue, ChannelID
+from .queue import PriorityMultiQueue, ChannelID, AgingPriorityQueue, DeadlineQueue
 from .multimessenger import MultiMessenger
 
 import collections
+import functools
 
+QueueDiscipline = typing.Literal['priority', 'aging', 'edf']
 
 
 @dataclasses.dataclass
 class PriorityMessenger(MultiMessenger, typing.Generic[SendPayloadType, RecvPayloadType]):
     '''Handles messaging to/from a multiprocessing pipe with prioritization and message channels.'''
     queue: PriorityMultiQueue[Message] = dataclasses.field(default_factory=PriorityMultiQueue)
-        
-    @classmethod
-    def new_pair(cls, **kwargs) -> typing.Tuple[PriorityMessenger, PriorityMessenger]:
-        '''Return (process, resource) pair of messengers connected by a duplex pipe.'''
-        resource_pipe, process_pipe = multiprocessing.Pipe(duplex=True, **kwargs)
-        return (
-            cls(pipe=process_pipe, **kwargs),
-            cls(pipe=resource_pipe, **kwargs),
-        )
+    queue_discipline: QueueDiscipline = 'priority' # 'aging' lets waiting messages gain priority, 'edf' orders by message deadline
+    aging_rate: float = 1.0 # priority units gained per second waiting ('aging')
+    default_deadline: typing.Optional[float] = None # deadline of messages without one ('edf'). None puts them last.
+
+    def __post_init__(self):
+        if self.spill_after is not None or self.spill_after_bytes is not None:
+            raise ValueError('spill_after and spill_after_bytes keep messages in arrival order, so they are only supported by MultiMessenger.')
+        super().__post_init__()
+        if self.queue_discipline == 'aging':
+            self.queue.queue_type = functools.partial(AgingPriorityQueue, aging_rate=self.aging_rate)
+        elif self.queue_discipline == 'edf':
+            self.queue.queue_type = functools.partial(DeadlineQueue, default_deadline=self.default_deadline)
+        elif self.queue_discipline != 'priority':
+            raise ValueError(f'queue_discipline must be one of {typing.get_args(QueueDiscipline)}, not {self.queue_discipline}.')
 
     def _queue_put(self, msg: Message) -> None:
         '''Put message into queue.'''
-        self.queue.put(msg, msg.priority, msg.channel_id)
+        if self.queue_discipline == 'edf':
+            self.queue.put(msg, msg.priority, msg.channel_id, msg.deadline)
+        else:
+            self.queue.put(msg, msg.priority, msg.channel_id)
 
+    def _channel_order_key(self, channel_id: ChannelID) -> typing.Any:
+        '''Sort key of the next message on this channel for ANY_CHANNEL receives: priority (queue key), then arrival.'''
+        return (self.queue.peek_priority(channel_id), self.queue.peek(channel_id).queued_at)
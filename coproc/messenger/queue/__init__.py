@@ -1,5 +1,8 @@
 
-from .multiqueue import MultiQueue, ChannelID
+from .multiqueue import MultiQueue, ChannelID, AnyChannel, ANY_CHANNEL
 from .prioritymultiqueue import PriorityMultiQueue
 from .priorityqueue import PriorityQueue
-
+from .heappriorityqueue import HeapPriorityQueue
+from .agingpriorityqueue import AgingPriorityQueue
+from .deadlinequeue import DeadlineQueue
+from .spillingmultiqueue import SpillingMultiQueue
@@ -0,0 +1,23 @@
+import dataclasses
+import time
+import typing
+
+from .priorityqueue import ItemType
+from .heappriorityqueue import HeapPriorityQueue
+
+@dataclasses.dataclass
+class AgingPriorityQueue(HeapPriorityQueue[ItemType]):
+    '''Priority queue where waiting items improve by aging_rate priority units per second,
+        so a steady stream of high-priority items cannot starve low-priority ones forever.
+        Every item ages at the same rate, so ordering by priority + aging_rate*arrival_time
+        is equivalent and put/get stay O(log P). Infinite (missing) priorities would never
+        age, so they are replaced with default_priority.
+    '''
+    aging_rate: float = 1.0
+    default_priority: float = 0.0
+    clock: typing.Callable[[], float] = dataclasses.field(default=time.monotonic, repr=False)
+    
+    def put(self, item: ItemType, priority: float):
+        if priority == float('inf'):
+            priority = self.default_priority
+        return super().put(item, priority + self.aging_rate * self.clock())
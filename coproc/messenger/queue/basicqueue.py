@@ -17,6 +17,16 @@ class BasicQueue(typing.Generic[ItemType]):
     
     def put(self, item: ItemType):
         self.queue.append(item)
+    
+    def peek(self) -> ItemType:
+        return self.queue[0]
+    
+    def remove(self, predicate: typing.Callable[[ItemType], bool]) -> typing.List[ItemType]:
+        '''Remove and return the items for which predicate is true. O(n).'''
+        removed = [item for item in self.queue if predicate(item)]
+        if removed:
+            self.queue = collections.deque(item for item in self.queue if not predicate(item))
+        return removed
         
     def empty(self) -> bool:
         return len(self.queue) == 0
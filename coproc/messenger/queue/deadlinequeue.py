@@ -0,0 +1,22 @@
+import dataclasses
+import time
+import typing
+
+from .priorityqueue import ItemType
+from .heappriorityqueue import HeapPriorityQueue
+
+@dataclasses.dataclass
+class DeadlineQueue(HeapPriorityQueue[ItemType]):
+    '''Earliest-deadline-first queue. Items are given a deadline in seconds from when they are 
+        put and the one due soonest is returned first, with priority breaking ties. Items 
+        without a deadline get default_deadline, or if that is None come after all items 
+        with deadlines in priority order.
+    '''
+    default_deadline: typing.Optional[float] = None
+    clock: typing.Callable[[], float] = dataclasses.field(default=time.monotonic, repr=False)
+    
+    def put(self, item: ItemType, priority: float, deadline: typing.Optional[float] = None):
+        if deadline is None:
+            deadline = self.default_deadline
+        due = float('inf') if deadline is None else self.clock() + deadline
+        return super().put(item, (due, priority))
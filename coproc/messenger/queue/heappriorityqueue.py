@@ -0,0 +1,68 @@
+import heapq
+import typing
+import dataclasses
+import collections
+
+from .priorityqueue import ItemType
+
+@dataclasses.dataclass
+class HeapPriorityQueue(typing.Generic[ItemType]):
+    '''Priority queue backed by a heap of priority levels, each a FIFO deque.
+        put and get are O(log P) for P distinct priorities currently in the queue, so
+        continuous priorities (floats, timestamps) are cheap. Empty levels are removed.
+    '''
+    levels: typing.Dict[float, collections.deque[ItemType]] = dataclasses.field(default_factory=dict)
+    heap: typing.List[float] = dataclasses.field(default_factory=list)
+    ct: int = 0
+    
+    def put(self, item: ItemType, priority: float):
+        try:
+            self.levels[priority].append(item)
+        except KeyError:
+            self.levels[priority] = collections.deque((item,))
+            heapq.heappush(self.heap, priority)
+        self.ct += 1
+        
+    def get(self) -> ItemType:
+        '''Get next item in queue. Raises IndexError if empty.'''
+        if not self.ct:
+            raise IndexError('Cannot pop from empty queue')
+        priority = self.heap[0]
+        level = self.levels[priority]
+        v = level.popleft()
+        self.ct -= 1
+        if not level:
+            heapq.heappop(self.heap)
+            del self.levels[priority]
+        return v
+    
+    def peek(self) -> ItemType:
+        '''Next item without removing it. Raises IndexError if empty.'''
+        if not self.ct:
+            raise IndexError('Cannot peek into empty queue')
+        return self.levels[self.heap[0]][0]
+    
+    def remove(self, predicate: typing.Callable[[ItemType], bool]) -> typing.List[ItemType]:
+        '''Remove and return the items for which predicate is true, keeping the order of the rest. O(n).'''
+        removed = list()
+        for priority, level in list(self.levels.items()):
+            if any(predicate(item) for item in level):
+                removed += [item for item in level if predicate(item)]
+                self.levels[priority] = collections.deque(item for item in level if not predicate(item))
+                if not self.levels[priority]:
+                    del self.levels[priority]
+        if removed:
+            self.heap = list(self.levels)
+            heapq.heapify(self.heap)
+            self.ct -= len(removed)
+        return removed
+    
+    def peek_priority(self) -> typing.Optional[float]:
+        '''Priority of the next item, or None if empty.'''
+        return self.heap[0] if self.ct else None
+    
+    def empty(self) -> bool:
+        return self.ct == 0
+            
+    def size(self) -> int:
+        return self.ct
@@ -1,5 +1,6 @@
 import dataclasses
 import collections
+import enum
 import typing
 
 from .basicqueue import BasicQueue, ItemType
@@ -7,6 +8,14 @@ from .basicqueue import BasicQueue, ItemType
 class ChannelID(typing.Hashable):
     pass
 
+class AnyChannel(enum.Enum):
+    ANY_CHANNEL = enum.auto()
+    def __repr__(self):
+        return 'ANY_CHANNEL'
+
+ANY_CHANNEL = AnyChannel.ANY_CHANNEL
+'''Pass as channel_id to check or receive from all channels.'''
+
 @dataclasses.dataclass
 class MultiQueue(typing.Generic[ItemType]):
     '''Similar to priority messenger, but does not include priority.'''
@@ -25,16 +34,37 @@ class MultiQueue(typing.Generic[ItemType]):
         self.queues.setdefault(channel_id, BasicQueue())
         return self[channel_id].put(item)
         
+    def peek(self, channel_id: ChannelID) -> ItemType:
+        '''Next item on this channel without removing it. Raises IndexError if empty.'''
+        try:
+            return self[channel_id].peek()
+        except KeyError as e:
+            raise IndexError('Cannot peek into empty queue') from e
+    
+    def remove(self, channel_id: ChannelID, predicate: typing.Callable[[ItemType], bool]) -> typing.List[ItemType]:
+        '''Remove and return items on this channel for which predicate is true.'''
+        if channel_id not in self.queues:
+            return list()
+        return self[channel_id].remove(predicate)
+    
     ############## check size and whether empty ##############
     def empty(self, channel_id: ChannelID) -> bool:
+        if channel_id is ANY_CHANNEL:
+            return all(q.empty() for q in self.queues.values())
         return channel_id not in self.queues or self[channel_id].empty()
     
     def size(self, channel_id: ChannelID) -> int:
+        if channel_id is ANY_CHANNEL:
+            return sum(q.size() for q in self.queues.values())
         try:
             return self[channel_id].size()
         except KeyError as e:
             return 0
     
+    def nonempty_channels(self) -> typing.List[ChannelID]:
+        '''Channels that currently have items.'''
+        return [c for c, q in self.queues.items() if not q.empty()]
+    
     ############## dunder ##############
     def __getitem__(self, channel_id: ChannelID) -> BasicQueue[ItemType]:
         '''Get corresponding piority queue.'''
@@ -3,16 +3,29 @@ import dataclasses
 import collections
 
 from .priorityqueue import PriorityQueue, ItemType
+from .heappriorityqueue import HeapPriorityQueue
 from .multiqueue import MultiQueue, ChannelID
 
 @dataclasses.dataclass
 class PriorityMultiQueue(MultiQueue, typing.Generic[ItemType]):
     '''Wraps multiple queues that each handle separate channels.'''
-    queues: typing.Dict[typing.Hashable, PriorityQueue[ItemType]] = dataclasses.field(default_factory=dict)
+    queues: typing.Dict[typing.Hashable, HeapPriorityQueue[ItemType]] = dataclasses.field(default_factory=dict)
+    queue_type: typing.Callable[[], typing.Union[HeapPriorityQueue[ItemType], PriorityQueue[ItemType]]] = HeapPriorityQueue # AgingPriorityQueue and DeadlineQueue change the discipline
     
     ############## Basic Put/Get ##############    
-    def put(self, item: ItemType, priority: float, channel_id: ChannelID):
-        '''Put a new item on the queue.'''
-        self.queues.setdefault(channel_id, PriorityQueue())
-        return self[channel_id].put(item, priority)
-            
+    def put(self, item: ItemType, priority: float, channel_id: ChannelID, deadline: typing.Optional[float] = None):
+        '''Put a new item on the queue. deadline is only passed to queue types that accept one.'''
+        try:
+            q = self.queues[channel_id]
+        except KeyError:
+            q = self.queues[channel_id] = self.queue_type()
+        if deadline is None:
+            return q.put(item, priority)
+        return q.put(item, priority, deadline)
+    
+    def peek_priority(self, channel_id: ChannelID) -> typing.Optional[float]:
+        '''Priority (queue key) of the next item on this channel, or None if empty.'''
+        try:
+            return self[channel_id].peek_priority()
+        except KeyError:
+            return None
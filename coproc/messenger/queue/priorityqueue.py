@@ -36,6 +36,25 @@ class PriorityQueue(typing.Generic[ItemType]):
         
         return v
     
+    def peek(self) -> ItemType:
+        '''Next item without removing it. Raises IndexError if empty.'''
+        return self.current_queue[-1]
+    
+    def remove(self, predicate: typing.Callable[[ItemType], bool]) -> typing.List[ItemType]:
+        '''Remove and return the items for which predicate is true. O(n).'''
+        removed = list()
+        for priority, q in self.queues.items():
+            removed += [item for item in q if predicate(item)]
+            self.queues[priority] = collections.deque(item for item in q if not predicate(item))
+        if removed:
+            self.ct -= len(removed)
+            self.current_priority = self._get_lowest_priority()
+        return removed
+    
+    def peek_priority(self) -> typing.Optional[float]:
+        '''Priority of the next item, or None if empty.'''
+        return self.current_priority
+    
     @property
     def current_queue(self) -> collections.deque:
         try:
@@ -0,0 +1,150 @@
+import collections
+import dataclasses
+import os
+import pickle
+import tempfile
+import typing
+
+from .basicqueue import BasicQueue, ItemType
+from .multiqueue import MultiQueue, ChannelID, ANY_CHANNEL
+
+@dataclasses.dataclass
+class SpillingMultiQueue(MultiQueue[ItemType]):
+    '''MultiQueue that keeps at most max_items, totalling at most max_bytes, in memory. The
+        size of each item is given to put (the messenger passes the size of the frame it
+        arrived in). Items put beyond that are pickled to an append-only temporary file in
+        spill_dir and read back in order, so a lagging consumer costs disk instead of memory
+        (plus a small index entry per spilled item). Once a channel has spilled items, later
+        items on that channel are spilled too so the channel stays FIFO; items put with
+        spill=False (those that cannot be pickled) wait in that line in memory instead.
+        The file is created on first spill and truncated whenever everything spilled has
+        been read back.
+    '''
+    max_items: typing.Optional[int] = 10000 # None does not limit the count
+    max_bytes: typing.Optional[int] = None # None does not limit the size
+    spill_dir: typing.Optional[str] = None # None uses the default temporary directory
+    spilled: typing.Dict[ChannelID, collections.deque[typing.Tuple[typing.Optional[int], int, int, typing.Optional[ItemType]]]] = dataclasses.field(default_factory=dict, repr=False) # (offset, length, nbytes, None) per spilled item, (None, 0, nbytes, item) per item held in memory behind them
+    spilled_items: int = 0 # items ever spilled
+    spilled_bytes: int = 0 # bytes ever spilled
+    in_memory: int = 0
+    in_memory_bytes: int = 0 # total size of the items in memory, as given to put
+    _file: typing.Optional[typing.BinaryIO] = dataclasses.field(default=None, repr=False)
+    _end: int = 0
+    _on_disk: int = 0
+
+    def __post_init__(self):
+        if self.max_items is not None and self.max_items < 1:
+            raise ValueError(f'max_items must be at least 1, not {self.max_items}.')
+        if self.max_bytes is not None and self.max_bytes < 1:
+            raise ValueError(f'max_bytes must be at least 1, not {self.max_bytes}.')
+
+    ############## Basic Put/Get ##############
+    def put(self, item: ItemType, channel_id: ChannelID, nbytes: int = 0, spill: bool = True):
+        '''Put a new item of nbytes on the queue, spilling it to disk if memory is full.
+            Items put with spill=False are always kept in memory.
+        '''
+        if self.spilled.get(channel_id):
+            if spill:
+                return self._spill(item, channel_id, nbytes)
+            self.spilled[channel_id].append((None, 0, nbytes, item))
+        elif spill and self._full(nbytes):
+            return self._spill(item, channel_id, nbytes)
+        else:
+            self.queues.setdefault(channel_id, BasicQueue())
+            self[channel_id].put((item, nbytes))
+        self.in_memory += 1
+        self.in_memory_bytes += nbytes
+
+    def get(self, channel_id: ChannelID) -> ItemType:
+        '''Get the next item from the queue.'''
+        self._load_if_empty(channel_id)
+        item, nbytes = super().get(channel_id)
+        self.in_memory -= 1
+        self.in_memory_bytes -= nbytes
+        return item
+
+    def peek(self, channel_id: ChannelID) -> ItemType:
+        self._load_if_empty(channel_id)
+        return super().peek(channel_id)[0]
+
+    def remove(self, channel_id: ChannelID, predicate: typing.Callable[[ItemType], bool]) -> typing.List[ItemType]:
+        '''Remove and return items on this channel for which predicate is true. Spilled
+            items are read back to check them; their space is reclaimed when the file is truncated.
+        '''
+        removed = list()
+        for item, nbytes in super().remove(channel_id, lambda entry: predicate(entry[0])):
+            removed.append(item)
+            self.in_memory -= 1
+            self.in_memory_bytes -= nbytes
+        kept = collections.deque()
+        for offset, length, nbytes, item in self.spilled.get(channel_id, ()):
+            held = offset is None
+            if not held:
+                item = pickle.loads(os.pread(self._file.fileno(), length, offset))
+            if predicate(item):
+                removed.append(item)
+                if held:
+                    self.in_memory -= 1
+                    self.in_memory_bytes -= nbytes
+                else:
+                    self._on_disk -= 1
+            else:
+                kept.append((offset, length, nbytes, item if held else None))
+        if channel_id in self.spilled:
+            self.spilled[channel_id] = kept
+        if self._file is not None and not self._on_disk:
+            self._file.truncate(0)
+            self._end = 0
+        return removed
+
+    ############## check size and whether empty ##############
+    def empty(self, channel_id: ChannelID) -> bool:
+        return self.size(channel_id) == 0
+
+    def size(self, channel_id: ChannelID) -> int:
+        if channel_id is ANY_CHANNEL:
+            return self.in_memory + self._on_disk
+        return super().size(channel_id) + len(self.spilled.get(channel_id, ()))
+
+    def nonempty_channels(self) -> typing.List[ChannelID]:
+        return list(dict.fromkeys(super().nonempty_channels() + [c for c, s in self.spilled.items() if s]))
+
+    def spilled_size(self, channel_id: ChannelID = ANY_CHANNEL) -> int:
+        '''Number of items currently on disk.'''
+        if channel_id is ANY_CHANNEL:
+            return self._on_disk
+        return sum(offset is not None for offset, _, _, _ in self.spilled.get(channel_id, ()))
+
+    ############## disk ##############
+    def _full(self, nbytes: int) -> bool:
+        '''Whether an item of nbytes would go over the memory limits.'''
+        return ((self.max_items is not None and self.in_memory >= self.max_items) or
+            (self.max_bytes is not None and self.in_memory_bytes + nbytes > self.max_bytes))
+
+    def _spill(self, item: ItemType, channel_id: ChannelID, nbytes: int) -> None:
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.spill_dir, buffering=0)
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        os.pwrite(self._file.fileno(), data, self._end)
+        self.spilled.setdefault(channel_id, collections.deque()).append((self._end, len(data), nbytes, None))
+        self._end += len(data)
+        self._on_disk += 1
+        self.spilled_items += 1
+        self.spilled_bytes += len(data)
+
+    def _load_if_empty(self, channel_id: ChannelID) -> None:
+        '''Move the next spilled item into memory if none are left in memory for this channel.'''
+        if not super().empty(channel_id) or not self.spilled.get(channel_id):
+            return
+        offset, length, nbytes, item = self.spilled[channel_id].popleft()
+        if offset is not None:
+            item = pickle.loads(os.pread(self._file.fileno(), length, offset))
+            self._on_disk -= 1
+            self.in_memory += 1
+            self.in_memory_bytes += nbytes
+            if not self._on_disk:
+                self._file.truncate(0)
+                self._end = 0
+        self.queues.setdefault(channel_id, BasicQueue())
+        self[channel_id].put((item, nbytes))
+
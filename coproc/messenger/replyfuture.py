@@ -0,0 +1,33 @@
+from __future__ import annotations
+import concurrent.futures
+import typing
+
+if typing.TYPE_CHECKING:
+    from .multimessenger import MultiMessenger
+
+
+class ReplyFuture(concurrent.futures.Future):
+    '''Future resolved with the payload of the reply to one request.
+        result() and exception() receive from the messenger while waiting,
+        so no other thread needs to drive it.
+    '''
+    def __init__(self, messenger: MultiMessenger, request_id: int, channel_id: typing.Hashable = None):
+        super().__init__()
+        self.messenger = messenger
+        self.request_id = request_id
+        self.channel_id = channel_id
+
+    def cancel(self) -> bool:
+        '''Cancel the request if its reply has not arrived. Returns whether it was cancelled.'''
+        if self.done():
+            return self.cancelled()
+        self.messenger.cancel([self.request_id], channel_id=self.channel_id)
+        return self.cancelled()
+
+    def result(self, timeout: typing.Optional[float] = None) -> typing.Any:
+        self.messenger._await_future(self, timeout)
+        return super().result(timeout=0)
+
+    def exception(self, timeout: typing.Optional[float] = None) -> typing.Optional[BaseException]:
+        self.messenger._await_future(self, timeout)
+        return super().exception(timeout=0)
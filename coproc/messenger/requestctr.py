@@ -1,8 +1,91 @@
+from __future__ import annotations
 import collections
 import dataclasses
+import math
+import time
 import typing
 
-from .queue import ChannelID
+from .queue import ChannelID, ANY_CHANNEL
+
+
+@dataclasses.dataclass
+class LatencyStats:
+    '''Summary of a LatencyHistogram (seconds).'''
+    count: int
+    mean: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+@dataclasses.dataclass
+class LatencyHistogram:
+    '''Log-scale histogram of durations with a fixed number of buckets, so adding
+        a sample is O(1) and memory does not grow. Bucket i > 0 covers durations in
+        [min_seconds * 2**((i-1)/resolution), min_seconds * 2**(i/resolution)),
+        so percentiles are within about 2**(1/resolution) of the true value.
+    '''
+    min_seconds: float = 1e-6
+    resolution: int = 8 # buckets per doubling
+    doublings: int = 32 # max duration is min_seconds * 2**doublings (~71 minutes)
+    counts: typing.List[int] = dataclasses.field(default_factory=list)
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * (self.resolution * self.doublings + 1)
+
+    def add(self, seconds: float) -> None:
+        if seconds <= self.min_seconds:
+            i = 0
+        else:
+            i = min(int(math.log2(seconds / self.min_seconds) * self.resolution) + 1, len(self.counts) - 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        '''Approximate q-th percentile (0-100): geometric middle of the bucket it falls in.'''
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            cumulative += c
+            if cumulative >= target and c:
+                break
+        if i == 0:
+            return min(self.min_seconds, self.max)
+        return min(self.min_seconds * 2 ** ((i - 0.5) / self.resolution), self.max)
+
+    def stats(self) -> LatencyStats:
+        return LatencyStats(
+            count = self.count,
+            mean = self.total / self.count if self.count else 0.0,
+            p50 = self.percentile(50),
+            p95 = self.percentile(95),
+            p99 = self.percentile(99),
+            max = self.max,
+        )
+
+@dataclasses.dataclass
+class ChannelMetrics:
+    '''Snapshot of the counters for one channel.'''
+    requests_sent: int
+    replies_received: int
+    requests_cancelled: int
+    messages_sent: int
+    messages_received: int
+    bytes_sent: int
+    bytes_received: int
+    serialize_seconds: float # pickling sent messages
+    deserialize_seconds: float # unpickling received messages
+    round_trip: LatencyStats # request sent -> reply arrived
+    queue_age: LatencyStats # message arrived -> popped from queue
 
 
 @dataclasses.dataclass
@@ -10,39 +93,114 @@ class RequestCtr:
     '''Counter stats for messages.'''
     requests: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
     replies: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
+    cancelled: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter) # requests cancelled before their reply was received
     sent: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
     received: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
-    
+    bytes_sent: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
+    bytes_received: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
+    serialize_seconds: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
+    deserialize_seconds: collections.Counter[ChannelID] = dataclasses.field(default_factory=collections.Counter)
+    round_trip: typing.Dict[ChannelID, LatencyHistogram] = dataclasses.field(default_factory=dict)
+    queue_age: typing.Dict[ChannelID, LatencyHistogram] = dataclasses.field(default_factory=dict)
+    # send times of requests awaiting replies by request id, oldest first
+    request_times: typing.Dict[ChannelID, typing.Dict[typing.Optional[int], float]] = dataclasses.field(default_factory=dict, repr=False)
+
     ##################### Getting values #####################
     def remaining(self, channel_id: ChannelID) -> int:
-        return self.requests[channel_id] - self.replies[channel_id]
-    
+        if channel_id is ANY_CHANNEL:
+            return sum(self.requests.values()) - sum(self.replies.values()) - sum(self.cancelled.values())
+        return self.requests[channel_id] - self.replies[channel_id] - self.cancelled[channel_id]
+
+    def awaiting_replies(self) -> int:
+        '''Number of requests on all channels whose replies have not arrived.'''
+        return sum(len(times) for times in self.request_times.values())
+
     def replies_received(self, channel_id: ChannelID) -> int:
         return self.replies[channel_id]
-    
+
     def requests_sent(self, channel_id: ChannelID) -> int:
         return self.requests[channel_id]
-    
+
     def messages_sent(self, channel_id: ChannelID) -> int:
         return self.sent[channel_id]
-    
+
     def messages_received(self, channel_id: ChannelID) -> int:
         return self.received[channel_id]
-    
+
+    def snapshot(self) -> typing.Dict[ChannelID, ChannelMetrics]:
+        '''Metrics for every channel that has sent or received anything.'''
+        channels = set(self.sent) | set(self.received) | set(self.bytes_sent) | set(self.bytes_received)
+        return {c: self.channel_snapshot(c) for c in channels}
+
+    def channel_snapshot(self, channel_id: ChannelID) -> ChannelMetrics:
+        return ChannelMetrics(
+            requests_sent = self.requests[channel_id],
+            replies_received = self.replies[channel_id],
+            requests_cancelled = self.cancelled[channel_id],
+            messages_sent = self.sent[channel_id],
+            messages_received = self.received[channel_id],
+            bytes_sent = self.bytes_sent[channel_id],
+            bytes_received = self.bytes_received[channel_id],
+            serialize_seconds = self.serialize_seconds[channel_id],
+            deserialize_seconds = self.deserialize_seconds[channel_id],
+            round_trip = self.round_trip.get(channel_id, LatencyHistogram()).stats(),
+            queue_age = self.queue_age.get(channel_id, LatencyHistogram()).stats(),
+        )
+
     ##################### Setting values #####################
-    
-    def sent_request(self, channel_id: ChannelID):
+
+    def sent_request(self, channel_id: ChannelID, request_id: typing.Optional[int] = None):
         self.requests[channel_id] += 1
+        if request_id is not None:
+            try:
+                self.request_times[channel_id][request_id] = time.monotonic()
+            except KeyError:
+                self.request_times[channel_id] = {request_id: time.monotonic()}
         #self.sent_message(channel_id)
-        
+
     def received_reply(self, channel_id: ChannelID):
         self.replies[channel_id] += 1
         #self.received_message(channel_id)
-        
+
+    def cancelled_requests(self, channel_id: ChannelID, request_ids: typing.Iterable[int]):
+        '''Count requests as cancelled. They no longer wait for a reply.'''
+        times = self.request_times.get(channel_id, {})
+        for request_id in request_ids:
+            self.cancelled[channel_id] += 1
+            times.pop(request_id, None)
+
     def sent_message(self, channel_id: ChannelID):
         self.sent[channel_id] += 1
-        
+
     def received_message(self, channel_id: ChannelID):
         self.received[channel_id] += 1
-    
 
+    def reply_arrived(self, channel_id: ChannelID, now: float, request_id: typing.Optional[int] = None):
+        '''Record round trip of the request this replies to (the oldest awaiting a reply if unknown).'''
+        times = self.request_times.get(channel_id)
+        if not times:
+            return
+        if request_id is None:
+            request_id = next(iter(times))
+        sent = times.pop(request_id, None)
+        if sent is not None:
+            self._histogram(self.round_trip, channel_id).add(now - sent)
+
+    def popped(self, channel_id: ChannelID, seconds_in_queue: float):
+        self._histogram(self.queue_age, channel_id).add(seconds_in_queue)
+
+    def serialized(self, channel_id: ChannelID, nbytes: int, seconds: float):
+        self.bytes_sent[channel_id] += nbytes
+        self.serialize_seconds[channel_id] += seconds
+
+    def deserialized(self, channel_id: ChannelID, nbytes: int, seconds: float):
+        self.bytes_received[channel_id] += nbytes
+        self.deserialize_seconds[channel_id] += seconds
+
+    @staticmethod
+    def _histogram(histograms: typing.Dict[ChannelID, LatencyHistogram], channel_id: ChannelID) -> LatencyHistogram:
+        try:
+            return histograms[channel_id]
+        except KeyError:
+            histograms[channel_id] = LatencyHistogram()
+            return histograms[channel_id]
@@ -0,0 +1,308 @@
+from __future__ import annotations
+import dataclasses
+import os
+import socket
+import threading
+import time
+import traceback
+import typing
+import weakref
+
+from .messages import Message, SendPayloadType, RecvPayloadType, DataMessage
+from .queue import ChannelID, ANY_CHANNEL, PriorityMultiQueue
+from .exceptions import ResourceRequestedClose
+from .replyfuture import ReplyFuture
+from .requestctr import ChannelMetrics
+from .multimessenger import MultiMessenger
+from .prioritymessenger import PriorityMessenger
+
+
+@dataclasses.dataclass
+class ThreadSafeMultiMessenger(MultiMessenger, typing.Generic[SendPayloadType, RecvPayloadType]):
+    '''MultiMessenger that many threads can use at once. A reader thread, started on first
+        use, drains the pipe and handles each message under a lock, waking the threads
+        waiting on that message's channel. Sends go through the writer thread
+        (background_send is implied), so no caller writes to the data pipe itself and a
+        full pipe never stalls the reader. Errors raised while handling a received message
+        are raised to the next waiting caller; once the pipe breaks or the peer requests a
+        close, every call raises that error. close stops both threads, as does garbage
+        collection of the messenger. MessengerSelector does not apply: the reader thread
+        owns the pipe.
+    '''
+    _lock: threading.RLock = dataclasses.field(default_factory=threading.RLock, repr=False)
+    _changed: typing.Optional[threading.Condition] = dataclasses.field(default=None, repr=False) # notified after every handled message
+    _channel_conds: typing.Dict[ChannelID, threading.Condition] = dataclasses.field(default_factory=dict, repr=False) # notified when a message is queued on the channel
+    _reader: typing.Optional[threading.Thread] = dataclasses.field(default=None, repr=False)
+    _reader_error: typing.Optional[BaseException] = dataclasses.field(default=None, repr=False)
+    _reader_stopped: bool = False
+
+    def __post_init__(self):
+        super().__post_init__()
+        if not self.send_priority:
+            self.background_send = True
+        self._changed = threading.Condition(self._lock)
+
+    def __getstate__(self) -> dict:
+        '''Locks and threads are not sent to the worker process; it makes its own.'''
+        state = super().__getstate__()
+        for name in ('_lock', '_changed', '_channel_conds', '_reader'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        super().__setstate__(state)
+        self._lock, self._channel_conds, self._reader = threading.RLock(), dict(), None
+        self._changed = threading.Condition(self._lock)
+
+    ############### Reader thread ###############
+    def _start_reader(self) -> None:
+        if self._reader is None:
+            with self._lock:
+                if self._reader is None:
+                    self._reader = threading.Thread(target=ThreadSafeMultiMessenger._read_loop, args=(weakref.ref(self),), 
+                        name='coproc-messenger-reader', daemon=True)
+                    self._reader.start()
+
+    @staticmethod
+    def _read_loop(ref: weakref.ref) -> None:
+        '''Handle messages until the reader stops. The thread holds the messenger only while
+            handling or waiting up to a second for a message, so it also stops once the
+            messenger is garbage collected.
+        '''
+        while True:
+            messenger = ref()
+            if messenger is None:
+                return
+            reading = messenger._read_next(timeout=1.0)
+            if messenger._reader_error is not None:
+                _clear_frames(messenger._reader_error) # the finished frames of this thread hold the messenger
+            del messenger
+            if not reading:
+                return
+
+    def _read_next(self, timeout: float) -> bool:
+        '''Wait up to timeout for a message and handle it. Returns False once the reader has stopped.'''
+        try:
+            if not self._poll(timeout):
+                return True
+            msg = self._pipe_recv()
+        except BaseException as e:
+            self._stop_reader(e)
+            return False
+        with self._lock:
+            try:
+                self._handle_message(msg)
+            except ResourceRequestedClose as e:
+                self._stop_reader(e)
+                return False
+            except BaseException as e:
+                if self._reader_error is None:
+                    self._reader_error = e
+                self._notify_all()
+            else:
+                self._changed.notify_all()
+        return True
+
+    def _stop_reader(self, error: BaseException) -> None:
+        '''Record why the reader stopped and wake every waiting thread to raise it.'''
+        with self._lock:
+            self._reader_error, self._reader_stopped = error, True
+            for future in self._futures.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._notify_all()
+
+    def _close_pipes(self) -> None:
+        '''Stop the reader before closing its connections. A reader blocked on a socket is
+            woken by shutting the socket down for reading; shared memory wakes it on close.
+        '''
+        reader = self._reader
+        if reader is None or reader is threading.current_thread():
+            return super()._close_pipes()
+        if all(_shutdown_reads(p) for p in (self.pipe, self.control_pipe) if p is not None):
+            reader.join()
+        super()._close_pipes()
+        reader.join()
+
+    def _notify_all(self) -> None:
+        self._changed.notify_all()
+        for cond in self._channel_conds.values():
+            cond.notify_all()
+
+    def _raise_reader_error(self) -> None:
+        '''Raise the error the reader encountered: once, or every time if the reader stopped.'''
+        if self._reader_error is not None:
+            e = self._reader_error
+            if not self._reader_stopped:
+                self._reader_error = None
+            raise e
+
+    def _channel_cond(self, channel_id: ChannelID) -> threading.Condition:
+        try:
+            return self._channel_conds[channel_id]
+        except KeyError:
+            cond = self._channel_conds[channel_id] = threading.Condition(self._lock)
+            return cond
+
+    def _queue_put(self, msg: Message) -> None:
+        '''Put message into queue and wake the threads waiting on its channel.'''
+        super()._queue_put(msg)
+        if msg.channel_id in self._channel_conds:
+            self._channel_conds[msg.channel_id].notify_all()
+        if ANY_CHANNEL in self._channel_conds:
+            self._channel_conds[ANY_CHANNEL].notify_all()
+
+    ############### Waiting on the reader instead of the pipe ###############
+    def _poll(self, timeout: typing.Optional[float] = 0.0) -> bool:
+        '''Only the reader thread reads the pipe; other callers see nothing unread.'''
+        if threading.current_thread() is self._reader:
+            return super()._poll(timeout)
+        return False
+
+    def _receive_and_handle(self) -> None:
+        '''The reader thread has already handled whatever the caller waited for.'''
+        self._raise_reader_error()
+
+    def _receive_and_handle_available(self) -> None:
+        self._start_reader()
+        self._flush_if_expired()
+        self.heartbeat()
+        self._raise_reader_error()
+
+    def _wait(self, deadline: typing.Optional[float]) -> bool:
+        '''Wait until the reader handles a message or the monotonic deadline passes.'''
+        return self._wait_on(self._changed, deadline)
+
+    def _wait_on(self, cond: threading.Condition, deadline: typing.Optional[float]) -> bool:
+        '''Wait on condition until notified or the deadline passes (forever if None). With
+            heartbeats, wakes every half interval to send them and check on the peer.
+        '''
+        self._start_reader()
+        with self._lock:
+            self._raise_reader_error()
+            self._flush_before_wait()
+            while True:
+                if self.heartbeat_interval is not None:
+                    self.heartbeat()
+                    self.check_peer()
+                timeout = None if self.heartbeat_interval is None else self.heartbeat_interval / 2
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                if cond.wait(timeout):
+                    return True
+                if self.heartbeat_interval is None:
+                    return False
+
+    def _await_future(self, future: ReplyFuture, timeout: typing.Optional[float]) -> None:
+        '''Wait for the reader thread to resolve the future.'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock: # the reader resolves futures under the lock, so none is missed
+            while not future.done():
+                if not self._wait(deadline):
+                    raise TimeoutError(f'No reply to request {future.request_id} within {timeout} seconds.')
+
+    ############### Serialized public interface ###############
+    def receive_message_blocking(self, channel_id: ChannelID = None, timeout: typing.Optional[float] = None) -> DataMessage:
+        '''Wait until a message is queued on this channel and pop it. Raises TimeoutError if
+            none arrives within timeout seconds. Threads waiting on one channel each get a
+            different message.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._start_reader()
+        with self._lock:
+            cond = self._channel_cond(channel_id)
+            while self.queue.empty(channel_id=channel_id):
+                if not self._wait_on(cond, deadline):
+                    raise TimeoutError(f'No message received on channel {channel_id} within {timeout} seconds.')
+            return self.pop_from_queue(channel_id=channel_id)
+
+    def receive_available_messages(self, channel_id: ChannelID = None) -> typing.List[DataMessage]:
+        with self._lock:
+            return super().receive_available_messages(channel_id=channel_id)
+
+    def available(self, channel_id: ChannelID = None) -> int:
+        with self._lock:
+            return super().available(channel_id=channel_id)
+
+    def pop_from_queue(self, channel_id: ChannelID = None) -> RecvPayloadType:
+        with self._lock:
+            return super().pop_from_queue(channel_id=channel_id)
+
+    def send_data_message(self, *args, **kwargs) -> typing.Optional[int]:
+        self._start_reader()
+        with self._lock:
+            return super().send_data_message(*args, **kwargs)
+
+    def send_data_batch(self, *args, **kwargs) -> None:
+        self._start_reader()
+        with self._lock:
+            return super().send_data_batch(*args, **kwargs)
+
+    def send_request_future(self, data: SendPayloadType, channel_id: ChannelID = None) -> ReplyFuture:
+        with self._lock: # the reply must find the future registered
+            return super().send_request_future(data, channel_id=channel_id)
+
+    def send_reply(self, data: SendPayloadType, channel_id: ChannelID = None, request_id: typing.Optional[int] = None) -> None:
+        with self._lock:
+            return super().send_reply(data, channel_id=channel_id, request_id=request_id)
+
+    def send_stream(self, *args, **kwargs) -> None:
+        self._start_reader()
+        with self._lock:
+            return super().send_stream(*args, **kwargs)
+
+    def _send_message(self, msg: Message) -> None:
+        with self._lock:
+            return super()._send_message(msg)
+
+    def flush(self, wait: bool = True) -> None:
+        with self._lock:
+            super().flush(wait=False)
+        if wait and self._writer is not None:
+            self._writer.flush() # without the lock, so the reader can keep handling messages
+
+    def cancel(self, *args, **kwargs) -> int:
+        with self._lock:
+            cancelled = super().cancel(*args, **kwargs)
+            self._changed.notify_all() # wake threads waiting on the cancelled futures
+            return cancelled
+
+    def metrics(self) -> typing.Dict[ChannelID, ChannelMetrics]:
+        with self._lock:
+            return super().metrics()
+
+
+def _clear_frames(error: BaseException) -> None:
+    '''Clear the locals of the frames in the tracebacks of error and the errors it chains.'''
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        traceback.clear_frames(error.__traceback__)
+        error = error.__cause__ or error.__context__
+
+def _shutdown_reads(conn: typing.Any) -> bool:
+    '''Shut a socket connection down for reading, returning a blocked read. Returns whether it is a socket.'''
+    try:
+        fd = os.dup(conn.fileno())
+    except (AttributeError, OSError):
+        return False
+    try:
+        sock = socket.socket(fileno=fd)
+    except OSError:
+        os.close(fd)
+        return False
+    with sock:
+        try:
+            sock.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass # already disconnected
+    return True
+
+
+@dataclasses.dataclass
+class ThreadSafePriorityMessenger(ThreadSafeMultiMessenger, PriorityMessenger, typing.Generic[SendPayloadType, RecvPayloadType]):
+    '''PriorityMessenger that many threads can use at once.'''
+    queue: PriorityMultiQueue[Message] = dataclasses.field(default_factory=PriorityMultiQueue)
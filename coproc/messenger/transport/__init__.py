@@ -0,0 +1,4 @@
+from .sharedmemoryconnection import SharedMemoryConnection
+from .sharedmemoryring import SharedMemoryRing
+from .connectionpair import new_connection_pair, TransportName
+from .socketconnection import SocketListener, SocketAddress, socket_connect
@@ -0,0 +1,25 @@
+from __future__ import annotations
+import typing
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.context
+
+from .sharedmemoryconnection import SharedMemoryConnection
+
+TransportName = typing.Literal['pipe', 'shared_memory']
+
+def new_connection_pair(
+    transport: TransportName = 'pipe',
+    ctx: typing.Optional[multiprocessing.context.BaseContext] = None,
+    **transport_kwargs,
+) -> typing.Tuple[multiprocessing.connection.Connection, multiprocessing.connection.Connection]:
+    '''Return two connected duplex connections using the given transport.
+        ctx should be the context used to start the worker process because the 
+        shared memory transport creates semaphores with it.
+    '''
+    if transport == 'pipe':
+        return multiprocessing.Pipe(duplex=True)
+    elif transport == 'shared_memory':
+        return SharedMemoryConnection.pair(ctx=ctx, **transport_kwargs)
+    else:
+        raise ValueError(f'Transport {transport} not recognized. Use one of {typing.get_args(TransportName)}.')
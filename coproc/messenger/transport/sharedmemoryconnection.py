@@ -0,0 +1,176 @@
+from __future__ import annotations
+import os
+import struct
+import typing
+import multiprocessing
+import multiprocessing.context
+import multiprocessing.reduction
+import multiprocessing.shared_memory
+import multiprocessing.synchronize
+
+from .sharedmemoryring import SharedMemoryRing
+
+_LEN = struct.Struct('Q')
+_SMALL_MESSAGE = 16384 # messages smaller than this are written with their length in one copy
+
+class SharedMemoryConnection:
+    '''Duplex connection with the same interface as multiprocessing.connection.Connection,
+        backed by two single-producer single-consumer rings in one shared memory segment.
+        Use SharedMemoryConnection.pair() to create connected ends. The first end owns
+        the segment and unlinks it when closed.
+    '''
+    def __init__(self,
+        shm: multiprocessing.shared_memory.SharedMemory,
+        capacity: int,
+        is_first: bool,
+        sems: typing.Tuple[multiprocessing.synchronize.Semaphore, ...],
+        owner_pid: typing.Optional[int],
+    ):
+        self._shm = shm
+        self._capacity = capacity
+        self._is_first = is_first
+        self._sems = sems
+        self._owner_pid = owner_pid
+        self._pid = os.getpid()
+        self._closed = False
+        self._attach()
+
+    @classmethod
+    def pair(cls,
+        capacity: int = 2**20,
+        ctx: typing.Optional[multiprocessing.context.BaseContext] = None,
+    ) -> typing.Tuple[SharedMemoryConnection, SharedMemoryConnection]:
+        '''Return two connected ends, each ring holding capacity bytes.'''
+        ctx = ctx if ctx is not None else multiprocessing.get_context()
+        ring_size = SharedMemoryRing.required_size(capacity)
+        shm = multiprocessing.shared_memory.SharedMemory(create=True, size=2*ring_size)
+        shm.buf[:2*ring_size] = bytes(2*ring_size)
+        sems = tuple(ctx.Semaphore(0) for _ in range(4))
+        return (
+            cls(shm, capacity, is_first=True, sems=sems, owner_pid=os.getpid()),
+            cls(multiprocessing.shared_memory.SharedMemory(name=shm.name), capacity, is_first=False, sems=sems, owner_pid=None),
+        )
+
+    def _attach(self):
+        '''Create ring views: the first end writes to ring 0 and reads from ring 1.'''
+        ring_size = SharedMemoryRing.required_size(self._capacity)
+        rings = [
+            SharedMemoryRing(self._shm.buf[:ring_size], self._sems[0], self._sems[1]),
+            SharedMemoryRing(self._shm.buf[ring_size:2*ring_size], self._sems[2], self._sems[3]),
+        ]
+        self._out, self._in = rings if self._is_first else rings[::-1]
+
+    ############### Pickling (only while spawning a process) ###############
+    def __getstate__(self):
+        return (self._shm.name, self._capacity, self._is_first, self._sems)
+
+    def __setstate__(self, state):
+        name, self._capacity, self._is_first, self._sems = state
+        self._shm = multiprocessing.shared_memory.SharedMemory(name=name)
+        self._owner_pid = None
+        self._pid = os.getpid()
+        self._closed = False
+        self._attach()
+
+    ############### Connection interface ###############
+    def send(self, obj: typing.Any) -> None:
+        '''Send a picklable object.'''
+        self.send_bytes(multiprocessing.reduction.ForkingPickler.dumps(obj))
+
+    def recv(self) -> typing.Any:
+        '''Receive a picklable object.'''
+        return multiprocessing.reduction.ForkingPickler.loads(self._recv_buffer())
+
+    def send_bytes(self, buf: typing.Any, offset: int = 0, size: typing.Optional[int] = None) -> None:
+        '''Send the bytes data from a bytes-like object.'''
+        self._check_closed()
+        m = memoryview(buf).cast('B')
+        end = len(m) if size is None else offset + size
+        m = m[offset:end]
+        if len(m) < _SMALL_MESSAGE:
+            self._out.write(memoryview(_LEN.pack(len(m)) + m))
+        else:
+            self._out.write(memoryview(_LEN.pack(len(m))))
+            self._out.write(m)
+
+    def recv_bytes(self, maxlength: typing.Optional[int] = None) -> bytes:
+        '''Receive bytes data as a bytes object.'''
+        return bytes(self._recv_buffer())
+
+    def recv_bytes_into(self, buf: typing.Any, offset: int = 0) -> int:
+        '''Receive bytes data directly into a writable bytes-like object.'''
+        self._check_closed()
+        n = self._recv_length()
+        with memoryview(buf) as m:
+            m = m.cast('B')
+            if offset + n > len(m):
+                raise multiprocessing.BufferTooShort(self._read(n))
+            self._in.read_into(m[offset:offset+n])
+        return n
+
+    def poll(self, timeout: typing.Optional[float] = 0.0) -> bool:
+        '''Whether there is any data available to be read.'''
+        self._check_closed()
+        if self._in.readable():
+            return True
+        try:
+            return self._in.wait_readable(timeout)
+        except EOFError:
+            return True # recv will raise EOFError like a pipe
+
+    def close(self) -> None:
+        '''Close this end and signal the peer. The owning end also unlinks the shared memory.'''
+        if self._closed:
+            return
+        if self._pid == os.getpid(): # copies inherited by a forked child do not signal the peer
+            self._out.close()
+            self._in.close()
+        self._release()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __del__(self):
+        # garbage collection does not signal the peer: the parent drops its copy 
+        #   of the child's end after starting the process.
+        try:
+            self._release()
+        except Exception:
+            pass
+
+    def __enter__(self) -> SharedMemoryConnection:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    ############### Internal ###############
+    def _release(self) -> None:
+        '''Release shared memory views without signaling the peer.'''
+        if self._closed:
+            return
+        self._closed = True
+        self._out.release()
+        self._in.release()
+        if self._owner_pid == os.getpid():
+            self._shm.unlink()
+        self._shm.close()
+
+    def _check_closed(self) -> None:
+        if self._closed:
+            raise OSError('handle is closed')
+
+    def _recv_length(self) -> int:
+        hdr = bytearray(_LEN.size)
+        self._in.read_into(memoryview(hdr))
+        return _LEN.unpack(hdr)[0]
+
+    def _read(self, n: int) -> bytearray:
+        buf = bytearray(n)
+        self._in.read_into(memoryview(buf))
+        return buf
+
+    def _recv_buffer(self) -> bytearray:
+        self._check_closed()
+        return self._read(self._recv_length())
@@ -0,0 +1,152 @@
+from __future__ import annotations
+import struct
+import time
+import typing
+import multiprocessing.synchronize
+
+_U64 = struct.Struct('Q')
+
+# header layout: each field is a u64 so the ring data starts on a cache line
+_READ_POS = 0 # total bytes ever read
+_WRITE_POS = 8 # total bytes ever written
+_READER_WAITING = 16 # reader is (about to be) blocked on data_ready
+_WRITER_WAITING = 24 # writer is (about to be) blocked on space_ready
+_CLOSED = 32 # either end was closed
+HEADER_SIZE = 64
+
+class SharedMemoryRing:
+    '''Single-producer single-consumer byte ring stored in a shared memory buffer.
+        Positions are monotonic byte counts kept in the header. Semaphores are only
+        released when the other side has flagged that it is waiting, and waits wake
+        up every wake_interval seconds to recheck so a missed signal cannot stall.
+    '''
+    wake_interval: float = 0.05
+
+    def __init__(self,
+        buf: memoryview,
+        data_ready: multiprocessing.synchronize.Semaphore,
+        space_ready: multiprocessing.synchronize.Semaphore,
+    ):
+        self.header = buf[:HEADER_SIZE]
+        self.data = buf[HEADER_SIZE:]
+        self.capacity = len(self.data)
+        self.data_ready = data_ready
+        self.space_ready = space_ready
+
+    @staticmethod
+    def required_size(capacity: int) -> int:
+        '''Bytes of shared memory needed for a ring with this data capacity.'''
+        return HEADER_SIZE + capacity
+
+    def release(self) -> None:
+        '''Release views of the shared memory buffer.'''
+        self.header.release()
+        self.data.release()
+
+    ############### Header fields ###############
+    def _get(self, offset: int) -> int:
+        return _U64.unpack_from(self.header, offset)[0]
+
+    def _set(self, offset: int, value: int) -> None:
+        _U64.pack_into(self.header, offset, value)
+
+    def readable(self) -> int:
+        '''Number of bytes written but not yet read.'''
+        return self._get(_WRITE_POS) - self._get(_READ_POS)
+
+    def writable(self) -> int:
+        '''Number of bytes that can be written without blocking.'''
+        return self.capacity - self.readable()
+
+    def closed(self) -> bool:
+        return bool(self._get(_CLOSED))
+
+    def close(self) -> None:
+        '''Mark the ring closed and wake both sides.'''
+        self._set(_CLOSED, 1)
+        self.data_ready.release()
+        self.space_ready.release()
+
+    ############### Reading and writing ###############
+    def write(self, data: memoryview) -> None:
+        '''Write all bytes, blocking while the ring is full.
+            Raises BrokenPipeError if the ring was closed.
+        '''
+        i, n = 0, len(data)
+        while i < n:
+            if self.closed():
+                raise BrokenPipeError('Shared memory ring was closed.')
+            free = self.writable()
+            if free == 0:
+                self._wait(_WRITER_WAITING, self.space_ready, self.writable, None)
+                continue
+
+            k = min(free, n - i)
+            w = self._get(_WRITE_POS)
+            pos = w % self.capacity
+            first = min(k, self.capacity - pos)
+            self.data[pos:pos+first] = data[i:i+first]
+            if first < k:
+                self.data[:k-first] = data[i+first:i+k]
+            self._set(_WRITE_POS, w + k)
+            self._notify(_READER_WAITING, self.data_ready)
+            i += k
+
+    def read_into(self, view: memoryview) -> None:
+        '''Fill view with the next bytes, blocking until they are written.
+            Raises EOFError if the writer closed before enough bytes arrived.
+        '''
+        i, n = 0, len(view)
+        while i < n:
+            avail = self.readable()
+            if avail == 0:
+                self.wait_readable(None)
+                continue
+
+            k = min(avail, n - i)
+            r = self._get(_READ_POS)
+            pos = r % self.capacity
+            first = min(k, self.capacity - pos)
+            view[i:i+first] = self.data[pos:pos+first]
+            if first < k:
+                view[i+first:i+k] = self.data[:k-first]
+            self._set(_READ_POS, r + k)
+            self._notify(_WRITER_WAITING, self.space_ready)
+            i += k
+
+    def wait_readable(self, timeout: typing.Optional[float]) -> bool:
+        '''Wait until there is data to read. Raises EOFError if the writer closed.'''
+        if self._wait(_READER_WAITING, self.data_ready, self.readable, timeout):
+            return True
+        if self.closed():
+            raise EOFError('Shared memory ring was closed.')
+        return False
+
+    ############### Signaling ###############
+    def _wait(self,
+        flag: int,
+        sem: multiprocessing.synchronize.Semaphore,
+        ready: typing.Callable[[], int],
+        timeout: typing.Optional[float],
+    ) -> bool:
+        '''Block on sem until ready() is nonzero or timeout elapses.'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not ready():
+            if self.closed():
+                return False
+            self._set(flag, 1)
+            if ready(): # written between the check and setting the flag
+                break
+            wait = self.wake_interval if deadline is None else min(self.wake_interval, deadline - time.monotonic())
+            if wait <= 0:
+                self._set(flag, 0)
+                return False
+            sem.acquire(timeout=wait)
+        self._set(flag, 0)
+        return True
+
+    def _notify(self, flag: int, sem: multiprocessing.synchronize.Semaphore) -> None:
+        '''Wake the other side if it is waiting.'''
+        if self._get(flag):
+            self._set(flag, 0)
+            sem.release()
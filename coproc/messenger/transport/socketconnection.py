@@ -0,0 +1,74 @@
+from __future__ import annotations
+import os
+import typing
+import multiprocessing
+import multiprocessing.connection
+
+SocketAddress = typing.Union[typing.Tuple[str, int], str] # (host, port) for TCP, a path for a Unix domain socket
+ConnectionLanes = typing.Tuple[multiprocessing.connection.Connection, typing.Optional[multiprocessing.connection.Connection]]
+
+def _check_authkey(address: SocketAddress, authkey: typing.Optional[bytes]) -> None:
+    '''Messages are unpickled on arrival, so anyone able to connect can run code: TCP needs an authkey.'''
+    if authkey is None and isinstance(address, tuple):
+        raise ValueError(f'An authkey is required for TCP address {address}. Only Unix domain sockets may omit it.')
+
+def socket_connect(address: SocketAddress, authkey: typing.Optional[bytes] = None, control_lane: bool = False) -> ConnectionLanes:
+    '''Connect to a SocketListener and return (data, control) connections. The control
+        connection is None unless control_lane. Each connection sends a random token so the
+        listener can pair the lanes of one client.
+    '''
+    _check_authkey(address, authkey)
+    token = os.urandom(16)
+    lanes = ('data', 'control') if control_lane else ('data',)
+    conns = list()
+    for lane in lanes:
+        conn = multiprocessing.connection.Client(address, authkey=authkey)
+        conn.send((token, len(lanes), lane))
+        conns.append(conn)
+    return conns[0], (conns[1] if control_lane else None)
+
+
+class SocketListener:
+    '''Accepts connections from independent processes or machines over TCP (address is
+        (host, port); port 0 picks a free one) or a Unix domain socket (address is a path).
+        Clients authenticate with authkey (HMAC challenge), which TCP requires.
+    '''
+    def __init__(self, address: SocketAddress, authkey: typing.Optional[bytes] = None, backlog: int = 16):
+        _check_authkey(address, authkey)
+        self._listener = multiprocessing.connection.Listener(address, backlog=backlog, authkey=authkey)
+        self._pending: typing.Dict[bytes, typing.Dict[str, multiprocessing.connection.Connection]] = dict()
+
+    @property
+    def address(self) -> SocketAddress:
+        '''Address clients connect to (with the port filled in for TCP port 0).'''
+        return self._listener.address
+
+    def accept(self) -> ConnectionLanes:
+        '''Block until a client has opened all its lanes and return (data, control) connections.
+            Lanes of other clients that arrive in between are held for later calls, and clients
+            that fail authentication are skipped.
+        '''
+        while True:
+            try:
+                conn = self._listener.accept()
+                token, n_lanes, lane = conn.recv()
+            except (multiprocessing.AuthenticationError, EOFError, ConnectionError):
+                continue # a client that failed authentication or hung up
+            lanes = self._pending.setdefault(token, dict())
+            lanes[lane] = conn
+            if len(lanes) == n_lanes:
+                del self._pending[token]
+                return lanes['data'], lanes.get('control')
+
+    def close(self) -> None:
+        for lanes in self._pending.values():
+            for conn in lanes.values():
+                conn.close()
+        self._pending.clear()
+        self._listener.close()
+
+    def __enter__(self) -> SocketListener:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -58,7 +58,8 @@ class DynamicMapProcess(BaseWorkerProcess, typing.Generic[SendPayloadType, RecvP
                     self.messenger.send_error(ex)
                     
                 try:
-                    result = self.worker_target(msg.payload)
+                    with self.messenger.busy(): # heartbeats however long the task runs
+                        result = self.worker_target(msg.payload)
                     dm = MapDataMessage(result, order=msg.order, priority=msg.priority)
                     self.messenger.send_reply(dm)
                     if self.verbose: print(f'{pid} -->> {result}')
@@ -9,18 +9,24 @@ import multiprocessing.context
 #from .baseworkerprocess import BaseWorkerProcess
 #from .messenger import PriorityMessenger
 #from .messenger import ResourceRequestedClose, DataMessage, SendPayloadType, RecvPayloadType, PriorityMessenger
-from ..messenger import MultiMessenger
+from ..messenger import MultiMessenger, MessengerSelector
 from ..legacy_worker_resource import LegacyWorkerResource # replace with wrpool
 #from .mapworker import MapWorkerProcess, MapDataMessage, UpdateUserFuncMessage, SendPayloadType, RecvPayloadType
 from .dynamicmapprocess import DynamicMapProcess, MapDataMessage, UpdateUserFuncMessage, SendPayloadType, RecvPayloadType
 
 class Pool:
-    def __init__(self, n: int, verbose: bool = False, messenger_type: typing.Type[MultiMessenger] = MultiMessenger):
+    def __init__(self, 
+        n: int, 
+        verbose: bool = False, 
+        messenger_type: typing.Type[MultiMessenger] = MultiMessenger, 
+        messenger_kwargs: typing.Optional[typing.Dict[str, typing.Any]] = None,
+    ):
         self.workers = list()
         for _ in range(n):
             w = LegacyWorkerResource(
                 worker_process_type = DynamicMapProcess,
                 messenger_type=messenger_type,
+                messenger_kwargs=dict(messenger_kwargs or {}),
             )
             self.workers.append(w)
         
@@ -55,37 +61,43 @@ class Pool:
         data_iter = enumerate(datas)
         remaining_to_send = 0
         
-        # send initial data to get process started
-        #print('send initial')
-        for w in self.workers:
-            i, d = next(data_iter)
-            #print('initial_sending:', d)
-            w.messenger.send_request(MapDataMessage(d, i))
-        
-        # keep feeding until there is no more data to feed
-        #print('feeder loop')
-        finished = False
-        while not finished:
+        try:
+            # send initial data to get process started
+            #print('send initial')
             for w in self.workers:
-                for m in w.messenger.receive_available():
-                    try:
-                        i, d = next(data_iter)
-                        w.messenger.send_request(MapDataMessage(d, i))
-                        #print('subsequent_sending:', d)
-                        yield m
-                    except StopIteration:
-                        finished = True
-                        yield m
-                        break
+                i, d = next(data_iter)
+                #print('initial_sending:', d)
+                w.messenger.send_request(MapDataMessage(d, i))
+        
+            # keep feeding until there is no more data to feed
+            #print('feeder loop')
+            selector = MessengerSelector([w.messenger for w in self.workers])
+            finished = False
+            while not finished:
+                for messenger in selector.select():
+                    for m in messenger.receive_available():
+                        try:
+                            i, d = next(data_iter)
+                            messenger.send_request(MapDataMessage(d, i))
+                            #print('subsequent_sending:', d)
+                            yield m
+                        except StopIteration:
+                            finished = True
+                            yield m
+                            break
                 
-                if finished:
-                    break
+                    if finished:
+                        break
                             
-        # receive all remaining messages
-        #print('wait on remaining')
-        for w in self:
-            for m in w.messenger.receive_remaining():
-                yield m
+            # receive all remaining messages
+            #print('wait on remaining')
+            for w in self:
+                for m in w.messenger.receive_remaining():
+                    yield m
+        except GeneratorExit:
+            # consumer stopped early: revoke requests still in flight
+            self._apply_to_workers(lambda w: w.messenger.cancel())
+            raise
     
     def update_user_func(self, target: typing.Callable[[SendPayloadType], RecvPayloadType]):
         '''Update the user function that is called on each data message.'''
@@ -3,7 +3,7 @@ import typing
 import dataclasses
 
 from .legacy_worker_resource import LegacyWorkerResource, BaseWorkerProcess
-from .messenger import PriorityMessenger, SendPayloadType, RecvPayloadType, ChannelID
+from .messenger import PriorityMessenger, MessengerSelector, SendPayloadType, RecvPayloadType, ChannelID
 
 
 @dataclasses.dataclass
@@ -16,6 +16,7 @@ class WorkerResourcePool:
         n: int, 
         worker_process_type: typing.Type[BaseWorkerProcess], 
         messenger_type: typing.Type[PriorityMessenger], 
+        messenger_kwargs: typing.Optional[typing.Dict[str, typing.Any]] = None,
         **start_kwargs: typing.Dict[str, typing.Any]
     ) -> WorkerResourcePool:
         '''Create new workerResources and track start kwargs.'''
@@ -24,6 +25,7 @@ class WorkerResourcePool:
             workers.append(LegacyWorkerResource(
                 worker_process_type = worker_process_type,
                 messenger_type = messenger_type,
+                messenger_kwargs = dict(messenger_kwargs or {}),
             ))
         return cls(workers, start_kwargs)
     
@@ -72,30 +74,37 @@ class WorkerResourcePool:
         data_iter: typing.Iterable[SendPayloadType],
         channel_id: ChannelID = None,
     ) -> typing.Generator[RecvPayloadType]:
-        '''Feed data_iter to workers and receive results as soon as they are done.'''
-        # send initial data to get process started
-        #print('send initial')
-        for w in self.workers:
-            w.messenger.send_request(next(data_iter), channel_id=channel_id)
-        
-        # keep feeding until there is no more data to feed
-        #print('feeder loop')
-        finished = False
-        while not finished:
+        '''Feed data_iter to workers and receive results as soon as they are done.
+            Closing the generator early cancels the requests still in flight.
+        '''
+        try:
+            # send initial data to get process started
+            #print('send initial')
             for w in self.workers:
-                for m in w.messenger.receive_available(channel_id=channel_id):
-                    try:
-                        w.messenger.send_request(next(data_iter), channel_id=channel_id)
-                        yield m
-                    except StopIteration:
-                        yield m
-                        finished = True
-                        break
+                w.messenger.send_request(next(data_iter), channel_id=channel_id)
+        
+            # keep feeding until there is no more data to feed
+            #print('feeder loop')
+            selector = MessengerSelector([w.messenger for w in self.workers])
+            finished = False
+            while not finished:
+                for messenger in selector.select(channel_id=channel_id):
+                    for m in messenger.receive_available(channel_id=channel_id):
+                        try:
+                            messenger.send_request(next(data_iter), channel_id=channel_id)
+                            yield m
+                        except StopIteration:
+                            yield m
+                            finished = True
+                            break
                 
-                if finished:
-                    break
+                    if finished:
+                        break
                             
-        # receive all remaining messages
-        for w in self.workers:
-            for m in w.messenger.receive_remaining(channel_id=channel_id):
-                yield m
+            # receive all remaining messages
+            for w in self.workers:
+                for m in w.messenger.receive_remaining(channel_id=channel_id):
+                    yield m
+        except GeneratorExit:
+            self.apply_to_workers(lambda w: w.messenger.cancel(channel_id=channel_id))
+            raise
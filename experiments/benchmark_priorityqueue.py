@@ -0,0 +1,34 @@
+'''Compare PriorityQueue and HeapPriorityQueue put/get throughput for a few
+    discrete priority levels and for continuous (float) priorities.
+'''
+import random
+import time
+
+import sys
+sys.path.append('..')
+import coproc
+
+
+def run(queue_type, priorities, backlog: int = 100):
+    '''Keep backlog items in the queue while putting and getting len(priorities) items.'''
+    q = queue_type()
+    for p in priorities[:backlog]:
+        q.put(p, p)
+    start = time.perf_counter()
+    for p in priorities[backlog:]:
+        q.put(p, p)
+        q.get()
+    return (len(priorities) - backlog) / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    n = 20000
+    cases = {
+        'levels=3': [random.choice((0, 1, 2)) for _ in range(n)],
+        'levels=100': [random.randrange(100) for _ in range(n)],
+        'continuous': [random.random() for _ in range(n)],
+    }
+    for name, priorities in cases.items():
+        for queue_type in (coproc.PriorityQueue, coproc.HeapPriorityQueue):
+            if queue_type is coproc.PriorityQueue and name == 'continuous':
+                priorities = priorities[:2000] # PriorityQueue re-sorts its levels on every new priority
+            print(f'{name:>12} {queue_type.__name__:>18}: {run(queue_type, priorities):,.0f} put+get/s')
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+import time
+import typing
+import os
+
+import sys
+sys.path.append('..')
+import coproc
+
+
+def echo_process(messenger: coproc.AsyncPriorityMessenger):
+    '''Process that sends back the same data it receives after a short delay.'''
+    while True:
+        data_msg = messenger.receive_message_blocking()
+        time.sleep(0.01)
+        messenger.send_reply((os.getpid(), data_msg.payload))
+
+def test_async_messenger_pair():
+    pm, rm = coproc.AsyncPriorityMessenger.new_pair()
+
+    async def main():
+        # receive waits on the event loop until data arrives
+        task = asyncio.create_task(rm.receive())
+        await asyncio.sleep(0.01)
+        assert(not task.done())
+        pm.send_norequest('hello')
+        assert(await task == 'hello')
+
+        # sends inside the loop are queued and written as the pipe becomes writable, 
+        #   so sending more than the pipe buffer holds does not block the loop
+        vs = list(range(1000))
+        for v in vs:
+            rm.send_request(v, channel_id='a')
+        assert(rm.outbox_size() > 0)
+        async def receive_all():
+            return [await pm.receive(channel_id='a') for _ in vs]
+        _, received = await asyncio.gather(rm.drain(), receive_all())
+        assert(rm.outbox_size() == 0)
+        assert(received == vs)
+        pm.send_reply_multiple(vs, channel_id='a')
+        assert([v async for v in rm.receive_remaining(channel_id='a')] == vs)
+        assert(rm.remaining(channel_id='a') == 0)
+
+        # errors are raised to the awaiting task
+        pm.send_error(ValueError('async error'))
+        try:
+            await rm.receive()
+            raise Exception('should not have gotten here')
+        except ValueError:
+            pass
+
+    asyncio.run(main())
+
+def test_async_control_lane():
+    pm, rm = coproc.AsyncPriorityMessenger.new_pair(control_lane=True, control_channels=('ctl',))
+
+    async def main():
+        # waiting receives wake up for data on either lane
+        task = asyncio.create_task(rm.receive(channel_id='ctl'))
+        await asyncio.sleep(0.01)
+        pm.send_norequest('control', channel_id='ctl')
+        assert(await task == 'control')
+        task = asyncio.create_task(rm.receive())
+        await asyncio.sleep(0.01)
+        pm.send_norequest('data')
+        assert(await task == 'data')
+
+    asyncio.run(main())
+
+def test_async_heartbeats():
+    pm, rm = coproc.AsyncMultiMessenger.new_pair(heartbeat_interval=0.05)
+    rm.send_request('unanswered')
+    try:
+        asyncio.run(asyncio.wait_for(rm.receive(), 10))
+        raise Exception('should not have gotten here')
+    except coproc.PeerDeadError:
+        pass
+
+def test_async_large_send():
+    pm, rm = coproc.AsyncMultiMessenger.new_pair()
+    payload = b'x' * 10_000_000
+
+    # the peer only starts reading after a second
+    received = list()
+    reader = threading.Thread(target=lambda: (time.sleep(1), received.append(pm.receive_blocking())))
+    reader.start()
+
+    async def main():
+        ticks = 0
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        ticker = asyncio.create_task(tick())
+
+        # a message much larger than the pipe buffer is written in parts without stalling the loop
+        rm.send_norequest(payload)
+        start = time.monotonic()
+        await asyncio.sleep(0.5)
+        assert(time.monotonic() - start < 0.75)
+        assert(ticks >= 20)
+        assert(rm.outbox_size() == 1)
+        await rm.drain()
+        assert(rm.outbox_size() == 0)
+        ticker.cancel()
+
+    asyncio.run(main())
+    reader.join()
+    assert(received == [payload])
+
+def test_async_flow_control():
+    pm, rm = coproc.AsyncMultiMessenger.new_pair(flow_control_window=1)
+
+    # the peer consumes requests in a thread; waiting for credit writes the queued requests first
+    received = list()
+    reader = threading.Thread(target=lambda: received.extend(pm.receive_blocking() for _ in range(5)))
+    reader.start()
+
+    async def main():
+        for v in range(5):
+            rm.send_request(v)
+        await rm.drain()
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+    reader.join(10)
+    assert(received == list(range(5)))
+
+def test_async_stream():
+    pm, rm = coproc.AsyncMultiMessenger.new_pair(stream_chunk_bytes=1000, stream_window=4)
+    data = os.urandom(100_000)
+
+    # the peer reads in a thread; waiting for acks writes the queued frames first
+    received = list()
+    reader = threading.Thread(target=lambda: received.append(pm.receive_blocking().read()))
+    reader.start()
+
+    async def main():
+        rm.send_stream(data)
+        await rm.drain()
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+    reader.join(10)
+    assert(received == [data])
+
+def test_async_messenger_workers():
+    n = 4
+    workers = [coproc.WorkerResource(echo_process, messenger_type=coproc.AsyncPriorityMessenger) for _ in range(n)]
+    for w in workers:
+        w.start()
+
+    async def run_worker(w: coproc.WorkerResource, vs: typing.List[int]):
+        for v in vs:
+            w.messenger.send_request(v)
+        return [v async for _, v in w.messenger.receive_remaining()]
+
+    async def main():
+        vs = list(range(10))
+        return await asyncio.gather(*[run_worker(w, vs) for w in workers])
+
+    try:
+        results = asyncio.run(main())
+        assert(results == [list(range(10))]*n)
+    finally:
+        for w in workers:
+            w.terminate()
+
+if __name__ == '__main__':
+    test_async_messenger_pair()
+    test_async_control_lane()
+    test_async_heartbeats()
+    test_async_large_send()
+    test_async_flow_control()
+    test_async_stream()
+    test_async_messenger_workers()
@@ -0,0 +1,112 @@
+import dataclasses
+import marshal
+
+import sys
+sys.path.append('..')
+import coproc
+from coproc.messenger.codecs import closure_dumps, CLOSURE
+
+
+@dataclasses.dataclass
+class Point:
+    x: float
+    y: float
+    priority: float = 0
+
+def make_adder(n):
+    def add(x):
+        return x + n
+    return add
+
+def test_closure_codec():
+    add3 = make_adder(3)
+    assert(CLOSURE.decode(closure_dumps(add3))(1) == 4)
+
+    f = CLOSURE.decode(closure_dumps(lambda x, y=2: x * y))
+    assert(f(3) == 6)
+
+    # closures over closures and importable functions
+    g = CLOSURE.decode(closure_dumps(lambda v: make_adder(1)(add3(v))))
+    assert(g(0) == 4)
+    assert(CLOSURE.decode(closure_dumps(make_adder)) is make_adder)
+
+    # recursive nested functions hold themselves in their closure
+    def countdown(n):
+        return countdown(n - 1) if n else 0
+    def fact(n, step=lambda k: k - 1):
+        return n * fact(step(n)) if n else 1
+    assert(CLOSURE.decode(closure_dumps(countdown))(5) == 0)
+    assert(CLOSURE.decode(closure_dumps(fact))(5) == 120)
+
+def test_codec_registry():
+    reg = coproc.CodecRegistry()
+    reg.set_channel_codec('nums', 'marshal')
+    reg.register(coproc.StructCodec('point', fmt='dd'))
+    reg.set_type_codec(tuple, 'point')
+
+    assert(reg.encode({'a': 1}, 'other') == (None, {'a': 1}))
+    name, data = reg.encode({'a': 1}, 'nums')
+    assert(name == 'marshal' and marshal.loads(data) == {'a': 1})
+    name, data = reg.encode((1.0, 2.0), 'nums') # type takes precedence over channel
+    assert(name == 'point' and len(data) == 16)
+    assert(reg.decode(name, data) == (1.0, 2.0))
+
+    try:
+        reg.set_channel_codec('x', 'nonexistent')
+        raise Exception('should not have gotten here')
+    except coproc.CodecNotRegisteredError:
+        pass
+
+def test_codec_messenger():
+    reg = coproc.CodecRegistry()
+    reg.set_channel_codec('nums', 'marshal')
+    reg.set_channel_codec('funcs', 'closure')
+    pm, rm = coproc.PriorityMessenger.new_pair(codecs=reg)
+
+    rm.send_request({'a': 1.5, 'b': [1, 2]}, channel_id='nums')
+    rm.send_request(make_adder(10), channel_id='funcs')
+    assert(pm.receive_blocking(channel_id='nums') == {'a': 1.5, 'b': [1, 2]})
+    assert(pm.receive_blocking(channel_id='funcs')(1) == 11)
+
+    # priority is taken from the payload before encoding
+    rm.send_request(Point(1, 2, priority=5), channel_id='funcs')
+    rm.send_request(Point(1, 2, priority=-1), channel_id='funcs')
+    assert(pm.receive_blocking(channel_id='funcs') == Point(1, 2, priority=-1))
+    assert(pm.receive_blocking(channel_id='funcs') == Point(1, 2, priority=5))
+
+    # batches mix encoded and plain payloads
+    reg.set_type_codec(Point, 'pickle')
+    rm.send_request_multiple([Point(0, 0), 1, 2], channel_id=None)
+    assert(pm.receive_available() == [Point(0, 0), 1, 2])
+
+    # receiver without a registry decodes builtin codecs
+    pm, rm = coproc.MultiMessenger.new_pair()
+    rm.codecs = reg
+    rm.send_request_multiple([(1, 2), (3, 4)], channel_id='nums')
+    assert(list(pm.receive_available(channel_id='nums')) == [(1, 2), (3, 4)])
+
+def echo_process(messenger: coproc.PriorityMessenger):
+    '''Process that sends back the same data it receives.'''
+    while True:
+        data_msg = messenger.receive_message_blocking()
+        messenger.send_reply(data_msg.payload)
+
+def test_codec_workers():
+    pair_codecs = coproc.CodecRegistry()
+    pair_codecs.register(coproc.StructCodec('pair', fmt='ii'))
+    pair_codecs.set_channel_codec(None, 'pair')
+    closure_codecs = coproc.CodecRegistry()
+    closure_codecs.set_channel_codec(None, 'closure')
+    for method in ('fork', 'spawn'):
+        with coproc.WorkerResource(echo_process, method=method, messenger_kwargs=dict(codecs=pair_codecs)) as w:
+            w.messenger.send_request((1, 2))
+            assert(w.messenger.receive_blocking() == (1, 2))
+        with coproc.WorkerResource(echo_process, method=method, messenger_kwargs=dict(codecs=closure_codecs)) as w:
+            w.messenger.send_request(make_adder(5))
+            assert(w.messenger.receive_blocking()(1) == 6)
+
+if __name__ == '__main__':
+    test_closure_codec()
+    test_codec_registry()
+    test_codec_messenger()
+    test_codec_workers()
@@ -0,0 +1,63 @@
+import json
+import os
+
+import sys
+sys.path.append('..')
+import coproc
+
+
+def text_blob(n: int) -> str:
+    return json.dumps([{'name': f'item{i}', 'value': i*1.5, 'tags': ['a', 'b']} for i in range(n)])
+
+def test_compression_messenger():
+    for algorithm in ('zlib', 'lzma', 'bz2'):
+        pm, rm = coproc.MultiMessenger.new_pair()
+        rm.compression = coproc.AdaptiveCompressor(algorithm=algorithm, min_bytes=1000)
+        blob = text_blob(1000)
+        rm.send_request(blob)
+        rm.send_request('small')
+        assert(pm.receive_blocking() == blob)
+        assert(pm.receive_blocking() == 'small')
+
+        stats = rm.compression_stats()
+        assert(stats.compressed == 1 and stats.too_small == 1)
+        assert(stats.bytes_in > len(blob) and stats.bytes_saved > 0.8 * stats.bytes_in)
+
+    # batches are compressed as a whole
+    rm.send_request_multiple([text_blob(10) for _ in range(100)], channel_id='batch')
+    assert(pm.receive_available(channel_id='batch') == [text_blob(10) for _ in range(100)])
+    assert(rm.compression_stats('batch').compressed == 1)
+    assert(rm.compression.total_stats().compressed == 2)
+
+    # works with codecs: compressed bytes are decoded after decompression
+    rm.codecs = coproc.CodecRegistry(channel_codecs={'m': 'marshal'})
+    rm.send_request({'a': [1.0]*5000}, channel_id='m')
+    assert(pm.receive_blocking(channel_id='m') == {'a': [1.0]*5000})
+    assert(rm.compression_stats('m').compressed == 1)
+
+def test_compression_disables_itself():
+    pm, rm = coproc.MultiMessenger.new_pair()
+    rm.compression = coproc.AdaptiveCompressor(min_bytes=100, retry_after=5)
+    noise = [os.urandom(1000) for _ in range(7)]
+    for n in noise:
+        rm.send_request(n, channel_id='noise')
+        rm.send_request(text_blob(100), channel_id='text')
+        assert(pm.receive_blocking(channel_id='noise') == n)
+    stats = rm.compression_stats('noise')
+    assert(stats.rejected == 2 and stats.disabled == 5 and stats.compressed == 0)
+    assert(rm.compression.enabled('text') and rm.compression_stats('text').compressed == 7)
+
+    # cost check: an infinitely fast link never pays for compression
+    rm.compression = coproc.AdaptiveCompressor(min_bytes=100, link_bytes_per_second=float('inf'))
+    rm.send_request(text_blob(100))
+    assert(not rm.compression.enabled())
+
+    try:
+        coproc.AdaptiveCompressor(algorithm='gzip')
+        raise Exception('should not have gotten here')
+    except ValueError:
+        pass
+
+if __name__ == '__main__':
+    test_compression_messenger()
+    test_compression_disables_itself()
@@ -2,6 +2,11 @@ import time
 import multiprocessing
 import pathlib
 import json
+import threading
+import os
+import signal
+import hashlib
+import gc
 
 import sys
 sys.path.append('..')
@@ -188,8 +193,716 @@ def test_priority_messenger():
         pass
     
 
+@dataclasses.dataclass
+class Job:
+    name: str
+    priority: float = float('inf')
+    deadline: float = None
+
+def test_queue_disciplines():
+    # edf: deadlines are taken from the payload or default_deadline
+    pm, rm = coproc.PriorityMessenger.new_pair(queue_discipline='edf', default_deadline=60)
+    rm.send_norequest(Job('batch', priority=0))
+    rm.send_norequest(Job('slow', deadline=10))
+    rm.send_norequest(Job('fast', priority=1, deadline=0.01))
+    assert([j.name for j in pm.receive_available()] == ['fast', 'slow', 'batch'])
+    
+    # aging: low priority message overtakes newer high priority ones after waiting
+    pm, rm = coproc.PriorityMessenger.new_pair(queue_discipline='aging', aging_rate=100)
+    rm.send_norequest(Job('batch', priority=1))
+    pm.available()
+    time.sleep(0.05)
+    rm.send_norequest(Job('urgent', priority=0))
+    assert([j.name for j in pm.receive_available()] == ['batch', 'urgent'])
+    
+    pm, rm = coproc.PriorityMessenger.new_pair()
+    rm.send_norequest(Job('batch', priority=1))
+    pm.available()
+    rm.send_norequest(Job('urgent', priority=0))
+    assert([j.name for j in pm.receive_available()] == ['urgent', 'batch'])
+    
+    try:
+        coproc.PriorityMessenger.new_pair(queue_discipline='lifo')
+        raise Exception('should not have gotten here')
+    except ValueError:
+        pass
+
+def test_any_channel():
+    # best message across channels: priority, then arrival
+    pm, rm = coproc.PriorityMessenger.new_pair()
+    rm.send_request(Job('a1', priority=1), channel_id='a')
+    rm.send_request(Job('b1', priority=1), channel_id='b')
+    rm.send_request(Job('b0', priority=0), channel_id='b')
+    rm.send_request(Job('none'))
+    assert(pm.available(coproc.ANY_CHANNEL) == 4 and pm.available() == 1)
+    assert([j.name for j in pm.receive_available(coproc.ANY_CHANNEL)] == ['b0', 'a1', 'b1', 'none'])
+    
+    # replies from any channel block on the pipe rather than polling channels
+    rm.send_request(Job('late'), channel_id='c')
+    threading.Timer(0.05, lambda: pm.send_reply('c', channel_id='c')).start()
+    assert(rm.receive_message_blocking(coproc.ANY_CHANNEL, timeout=5).channel_id == 'c')
+    
+    # MultiMessenger has no priority: arrival order
+    pm, rm = coproc.MultiMessenger.new_pair()
+    for c in ('x', 'y', 'x', None):
+        rm.send_request(c, channel_id=c)
+        pm.available()
+    assert(pm.receive_available(coproc.ANY_CHANNEL) == ['x', 'y', 'x', None])
+    for c in ('x', 'y', 'x', None):
+        pm.send_reply(c, channel_id=c)
+    assert(rm.remaining(coproc.ANY_CHANNEL) == 4)
+    assert(list(rm.receive_remaining(coproc.ANY_CHANNEL)) == ['x', 'y', 'x', None])
+    
+    # weighted fair queuing: channels share receives in proportion to weights
+    pm, rm = coproc.PriorityMessenger.new_pair(channel_weights={'heavy': 3, 'light': 1})
+    for i in range(20):
+        rm.send_norequest(Job('light', priority=0), channel_id='light')
+        rm.send_norequest(Job('heavy', priority=1), channel_id='heavy')
+    pm.available()
+    names = [pm.receive_message_blocking(coproc.ANY_CHANNEL).channel_id for _ in range(16)]
+    assert(names.count('heavy') == 12 and names.count('light') == 4)
+
+def test_spill():
+    pm, rm = coproc.MultiMessenger.new_pair(spill_after=10)
+    for i in range(5):
+        rm.send_request_multiple(list(range(i*20, (i+1)*20)), channel_id=i % 2)
+        pm.available(coproc.ANY_CHANNEL)
+    assert(pm.queue.in_memory == 10 and pm.queue.spilled_size() == 90)
+    assert(pm.receive_available(coproc.ANY_CHANNEL) == list(range(100)))
+    assert(pm.requests_sent(0) == 0 and pm.messages_received(0) == 60)
+    
+    # a byte budget keeps a few large messages in memory, however many small ones fit
+    pm, rm = coproc.MultiMessenger.new_pair(spill_after_bytes=35_000)
+    for i in range(10):
+        rm.send_norequest(bytes(10_000), channel_id='large')
+    rm.send_request_multiple(list(range(100)), channel_id='small')
+    pm.available(coproc.ANY_CHANNEL)
+    assert(pm.queue.in_memory == 3 + 100 and pm.queue.spilled_size() == 7)
+    assert(10_000 * 3 < pm.queue.in_memory_bytes <= 35_000)
+    assert(pm.receive_available('large') == [bytes(10_000)] * 10 and pm.receive_available('small') == list(range(100)))
+    assert(pm.queue.in_memory_bytes == 0)
+    
+    # streams are held in memory in their place behind spilled messages
+    pm, rm = coproc.MultiMessenger.new_pair(spill_after=1)
+    rm.send_norequest('x')
+    rm.send_norequest('y')
+    rm.send_stream(b'z' * 10)
+    rm.send_norequest('w')
+    pm.available()
+    assert(pm.queue.in_memory == 2 and pm.queue.spilled_size() == 2)
+    assert(pm.receive_blocking() == 'x' and pm.receive_blocking() == 'y')
+    assert(pm.receive_blocking().read() == b'z' * 10 and pm.receive_blocking() == 'w')
+    assert(pm.queue.empty(coproc.ANY_CHANNEL) and pm.queue.in_memory == 0)
+    
+    try:
+        coproc.PriorityMessenger.new_pair(spill_after=10)
+        raise Exception('should not have gotten here')
+    except ValueError:
+        pass
+
+def test_drain_policy():
+    for kwargs, queued in ((dict(), 30), (dict(drain_max_messages=0), 0), (dict(drain_max_messages=5), 5), (dict(drain_max_seconds=60), 30)):
+        pm, rm = coproc.MultiMessenger.new_pair(**kwargs)
+        rm.send_norequest('hi', channel_id='interactive')
+        for i in range(30):
+            rm.send_norequest(i, channel_id='bulk')
+        assert(pm.receive_blocking(channel_id='interactive') == 'hi')
+        assert(pm.queue_size('bulk') == queued)
+        assert(pm.receive_available('bulk') == list(range(30)))
+
+def test_send_priority():
+    # chunked writes without a writer thread reassemble in order
+    pm, rm = coproc.MultiMessenger.new_pair(send_chunk_bytes=16384)
+    rm.send_request(b'x' * 60000)
+    rm.send_request('small')
+    assert(pm.receive_blocking() == b'x' * 60000 and pm.receive_blocking() == 'small')
+    assert(pm.metrics()[None].bytes_received > 60000)
+    
+    # urgent messages overtake a large message already being sent
+    pm, rm = coproc.PriorityMessenger.new_pair(send_priority=True, send_chunk_bytes=65536, drain_max_messages=0)
+    bulk = Job('x' * 20_000_000)
+    rm.send_norequest(bulk, channel_id='bulk')
+    rm.send_norequest(Job('urgent', priority=-1), channel_id='urgent')
+    assert(pm.receive_blocking(channel_id='urgent', timeout=10).name == 'urgent')
+    assert(pm.queue_size('bulk') == 0) # without send_priority the whole bulk message arrives first
+    assert(pm.receive_blocking(channel_id='bulk', timeout=10) == bulk)
+    rm.flush()
+    
+    # close requests overtake bulk traffic too
+    rm.send_norequest(bulk, channel_id='bulk')
+    rm.send_close_request()
+    try:
+        pm.receive_blocking(channel_id='bulk', timeout=10)
+        raise Exception('should not have gotten here')
+    except coproc.ResourceRequestedClose:
+        pass
+    assert(pm.queue_size('bulk') == 0)
+    assert(pm.receive_blocking(channel_id='bulk', timeout=10) == bulk)
+    rm.flush()
+
+def channel_echo_process(messenger: coproc.PriorityMessenger):
+    '''Replies to every request on the channel it arrived on.'''
+    while True:
+        msg = messenger.receive_message_blocking(coproc.ANY_CHANNEL)
+        messenger.send_reply(msg.payload, channel_id=msg.channel_id, request_id=msg.request_id)
+
+def test_control_lane():
+    pm, rm = coproc.PriorityMessenger.new_pair(control_lane=True, control_channels=('ctl',), background_send=True, drain_max_messages=0)
+    bulk = Job('x' * 20_000_000)
+    rm.send_norequest(bulk, channel_id='bulk')
+    rm.send_request('ping', channel_id='ctl')
+    assert(pm.receive_blocking(channel_id='ctl', timeout=10) == 'ping')
+    pm.send_reply('pong', channel_id='ctl')
+    assert(rm.receive_blocking(channel_id='ctl', timeout=10) == 'pong')
+    
+    # close requests are not stuck behind bulk data
+    rm.send_close_request()
+    try:
+        pm.receive_blocking(channel_id='bulk', timeout=10)
+        raise Exception('should not have gotten here')
+    except coproc.ResourceRequestedClose:
+        pass
+    assert(pm.queue_size('bulk') == 0)
+    assert(pm.receive_blocking(channel_id='bulk', timeout=10) == bulk)
+    rm.flush()
+    
+    # works across processes and with the selector
+    for method in ('fork', 'spawn'):
+        with coproc.WorkerResource(channel_echo_process, method=method, messenger_kwargs=dict(control_lane=True, control_channels=('ctl',))) as w:
+            w.messenger.send_request('hello', channel_id='ctl')
+            assert(coproc.MessengerSelector([w.messenger]).select(timeout=10) == [w.messenger])
+            assert(w.messenger.receive_blocking(channel_id='ctl', timeout=10) == 'hello')
+
+def test_cancel():
+    pm, rm = coproc.PriorityMessenger.new_pair()
+    ids = [rm.send_request(i) for i in range(5)]
+    running = pm.receive_message_blocking()
+    assert(rm.cancel(ids[1:3]) == 2 and rm.remaining() == 3)
+    assert(pm.available() == 2) # not yet started requests are removed
+    rm.available() # acknowledged: no replies will come for them
+    assert(not rm._cancelled)
+    
+    # cancelling the running request lets the handler stop early; its reply is discarded
+    assert(rm.cancel() == 3 and rm.remaining() == 0)
+    assert(pm.is_cancelled(running.request_id) and pm.available() == 0)
+    pm.send_reply(running.payload)
+    assert(rm.receive_available() == [] and rm.remaining() == 0 and not rm._cancelled)
+    assert(not pm.is_cancelled(running.request_id))
+    
+    # replies already received are dropped, futures are cancelled
+    rm.send_request('done')
+    pm.send_reply(pm.receive_blocking())
+    assert(rm.available() == 1 and rm.cancel() == 1 and rm.available() == 0)
+    future = rm.send_request_future('future')
+    assert(future.cancel() and future.cancelled() and rm.remaining() == 0)
+    assert(rm.metrics()[None].requests_cancelled == 7)
+    assert(pm.available() == 0 and rm.available() == 0 and not rm._cancelled)
+    
+    # a cancel that overtakes its request on the control lane drops it on arrival
+    pm, rm = coproc.PriorityMessenger.new_pair(control_lane=True, flow_control_window=2)
+    rid = rm.send_request('late', channel_id='c')
+    assert(rm.cancel([rid], channel_id='c') == 1)
+    assert(pm.available('c') == 0 and not pm._cancel_pending)
+    rm.available('c')
+    assert(not rm._cancelled and rm.credits('c') == 2)
+    
+    # requests can arrive out of id order (with send_priority); a cancel still drops one not yet arrived
+    pm, rm = coproc.PriorityMessenger.new_pair()
+    first, second = rm.send_request('first'), rm.send_request('second')
+    frames = [pm.pipe.recv_bytes() for _ in range(2)]
+    rm.pipe.send_bytes(frames[1]) # the second request overtakes the first
+    assert(pm.receive_blocking() == 'second')
+    assert(rm.cancel([first]) == 1)
+    rm.pipe.send_bytes(frames[0])
+    assert(pm.available() == 0 and not pm._cancel_pending)
+    rm.available()
+    assert(not rm._cancelled)
+
+def heartbeat_process(messenger: coproc.PriorityMessenger):
+    '''Hangs, dies, or works slowly while sending heartbeats, depending on the request.'''
+    while True:
+        msg = messenger.receive_message_blocking()
+        if msg.payload == 'hang':
+            time.sleep(1000)
+        elif msg.payload == 'die':
+            os.kill(os.getpid(), signal.SIGKILL)
+        elif msg.payload == 'slow':
+            for _ in range(10):
+                time.sleep(0.05)
+                messenger.heartbeat()
+        messenger.send_reply(msg.payload)
+
+def test_heartbeats():
+    pm, rm = coproc.PriorityMessenger.new_pair(heartbeat_interval=0.05, heartbeat_misses=3)
+    try: # peer owes us nothing: a plain timeout
+        rm.receive_blocking(timeout=0.3)
+        raise Exception('should not have gotten here')
+    except TimeoutError as e:
+        assert(not isinstance(e, coproc.PeerDeadError))
+    
+    rm.send_request('unanswered')
+    start = time.monotonic()
+    try:
+        rm.receive_blocking(timeout=10)
+        raise Exception('should not have gotten here')
+    except coproc.PeerDeadError:
+        assert(time.monotonic() - start < 1)
+    
+    kwargs = dict(heartbeat_interval=0.05, heartbeat_misses=3)
+    with coproc.WorkerResource(heartbeat_process, method='fork', messenger_kwargs=kwargs) as w:
+        w.messenger.send_request('slow') # outlives the miss threshold but sends heartbeats
+        assert(w.messenger.receive_blocking(timeout=10) == 'slow')
+        
+        w.messenger.send_request('hang')
+        try:
+            coproc.MessengerSelector([w.messenger]).select(timeout=10)
+            raise Exception('should not have gotten here')
+        except coproc.PeerDeadError:
+            pass
+    
+    with coproc.WorkerResource(heartbeat_process, method='fork', messenger_kwargs=kwargs) as w:
+        w.messenger.send_request('die')
+        try:
+            w.messenger.receive_blocking(timeout=10)
+            raise Exception('should not have gotten here')
+        except BrokenPipeError: # PeerDeadError, or EOF if the pipe closed first
+            pass
+
+def stream_digest_process(messenger: coproc.PriorityMessenger):
+    '''Replies with the size and sha256 of each stream, reading it frame by frame.'''
+    while True:
+        stream = messenger.receive_blocking()
+        h, n = hashlib.sha256(), 0
+        for frame in stream:
+            h.update(frame)
+            n += len(frame)
+        messenger.send_reply((stream.metadata, n, h.hexdigest()))
+
+def test_streams():
+    pm, rm = coproc.PriorityMessenger.new_pair(stream_chunk_bytes=1000, stream_window=None)
+    data = os.urandom(10_500)
+    rm.send_stream(data, metadata=Job('first', priority=2))
+    rm.send_norequest(Job('urgent', priority=1))
+    rm.send_stream(iter([b'ab', b'', b'cd' * 600]), channel_id='c')
+    rm.send_stream(b'', channel_id='c')
+    assert(pm.receive_blocking().name == 'urgent') # streams are queued by metadata priority
+    stream = pm.receive_blocking()
+    assert(isinstance(stream, coproc.ByteStream) and stream.metadata.name == 'first' and stream.size == len(data))
+    assert(stream.read() == data)
+    stream = pm.receive_blocking('c')
+    assert(stream.size is None and [len(f) for f in stream] == [2, 1000, 200])
+    assert(pm.receive_blocking('c').read() == b'')
+    
+    # read returns what iteration has not consumed
+    rm.send_stream(data)
+    stream = pm.receive_blocking()
+    frames = iter(stream)
+    first = next(frames) + next(frames)
+    assert(stream.read() == data[len(first):] and first == data[:len(first)])
+    assert(stream.read() == b'')
+    
+    # with a window the sender waits for frames to be consumed, so few are buffered
+    pm, rm = coproc.PriorityMessenger.new_pair(stream_chunk_bytes=1000, stream_window=2)
+    data = os.urandom(200_000)
+    t = threading.Thread(target=lambda: (rm.send_stream(data), rm.send_norequest('after')))
+    t.start()
+    stream, buffered, received = pm.receive_blocking(), list(), bytearray()
+    for frame in stream:
+        buffered.append(len(stream._frames))
+        received += frame
+    t.join()
+    assert(received == data and max(buffered) <= 2 and not rm._stream_acks)
+    assert(pm.receive_blocking() == 'after')
+    
+    with coproc.WorkerResource(stream_digest_process, method='fork', messenger_kwargs=dict(stream_chunk_bytes=1 << 16)) as w:
+        data = os.urandom(5_000_000)
+        w.messenger.send_stream(memoryview(data), metadata='big')
+        w.messenger.send_stream((data[i:i+300_000] for i in range(0, len(data), 300_000)), metadata='chunks')
+        for name in ('big', 'chunks'):
+            assert(w.messenger.receive_blocking(timeout=10) == (name, len(data), hashlib.sha256(data).hexdigest()))
+
+def test_dedup():
+    pm, rm = coproc.MultiMessenger.new_pair(dedup_min_bytes=1000, dedup_max_entries=2)
+    table = {i: str(i) for i in range(5000)}
+    for _ in range(3):
+        rm.send_norequest(table)
+    rm.send_norequest('small')
+    received = [pm.receive_blocking() for _ in range(4)]
+    assert(received == [table] * 3 + ['small'])
+    assert(received[0] is not received[1]) # each reference is unpickled again
+    stats = rm.dedup_stats()
+    assert(stats.full == 1 and stats.references == 2 and stats.too_small == 1)
+    sent = rm.metrics()[None].bytes_sent
+    assert(stats.bytes_saved > sent) # two copies saved, one sent
+    
+    # least recently used payloads are evicted on both ends and sent whole again
+    tables = [{i: str(i + k) for i in range(500)} for k in range(3)]
+    for t in (tables[0], tables[1], tables[0], tables[2], tables[1], tables[0]):
+        rm.send_norequest(t, channel_id='c')
+    assert(pm.receive_available('c') == [tables[0], tables[1], tables[0], tables[2], tables[1], tables[0]])
+    assert(rm.dedup_stats().full == 6 and rm.dedup_stats().references == 3)
+    assert(set(pm._dedup.held) == set(rm._dedup.sent) and len(pm._dedup.held) == 2)
+    
+    # works with compression, in both directions and across processes
+    pm, rm = coproc.PriorityMessenger.new_pair(dedup_min_bytes=1000, compression=coproc.AdaptiveCompressor(min_bytes=100), background_send=True)
+    text = os.urandom(20_000).hex() # still large once compressed
+    for _ in range(2):
+        rm.send_request(text)
+        pm.send_reply(pm.receive_blocking())
+    assert(list(rm.receive_remaining()) == [text] * 2 and rm.compression_stats().compressed > 0)
+    assert(pm.dedup_stats().references == 1 and rm.dedup_stats().references == 1)
+    with coproc.WorkerResource(channel_echo_process, method='fork', messenger_kwargs=dict(dedup_min_bytes=1000)) as w:
+        for _ in range(3):
+            w.messenger.send_request(table)
+        assert(list(w.messenger.receive_remaining()) == [table] * 3)
+        assert(w.messenger.dedup_stats().references == 2)
+    
+    try:
+        coproc.PriorityMessenger.new_pair(dedup_min_bytes=1000, send_priority=True, send_chunk_bytes=1000)
+        raise Exception('should not have gotten here')
+    except ValueError:
+        pass
+
+def test_batch_messages():
+    pm, rm = coproc.PriorityMessenger.new_pair()
+    
+    # many requests travel in a single frame
+    vs = list(range(10))
+    rm.send_request_multiple(vs)
+    assert(rm.remaining() == len(vs))
+    assert(rm.messages_sent() == len(vs))
+    pm._receive_and_handle()
+    assert(not pm.pipe_poll())
+    assert(pm.queue_size() == len(vs))
+    assert(pm.receive_available() == vs)
+    assert(pm.messages_received() == len(vs))
+    
+    # chunked into multiple frames
+    rm.send_request_multiple(vs, batch_size=3)
+    assert(pm.receive_available() == vs)
+    
+    pm.send_reply_multiple(vs + vs)
+    assert(list(rm.receive_remaining()) == vs + vs)
+    assert(rm.remaining() == 0)
+    
+    # replies are coalesced until the batch is full
+    pm.reply_batch_size = 3
+    pm.reply_batch_latency = 1000
+    rm.send_request_multiple(vs[:4])
+    pm.send_reply(0)
+    pm.send_reply(1)
+    assert(pm.pending_replies() == 2)
+    assert(rm.available() == 0)
+    pm.send_reply(2)
+    assert(pm.pending_replies() == 0)
+    assert(rm.available() == 3)
+    
+    # held replies are sent before other messages and before blocking
+    pm.send_reply(3)
+    pm.send_norequest('after', channel_id='other')
+    assert(rm.receive_available() == [0, 1, 2, 3])
+    assert(rm.remaining() == 0)
+    assert(rm.receive_blocking(channel_id='other') == 'after')
+    
+    # latency bound
+    pm.reply_batch_latency = 0.0
+    rm.send_request(5)
+    pm.send_reply(5)
+    assert(rm.receive_blocking() == 5)
+    assert(rm.remaining() == 0)
+    
+    # the bound holds while the replier is busy with the next task
+    pm, rm = coproc.PriorityMessenger.new_pair(reply_batch_size=3, reply_batch_latency=0.01)
+    def work():
+        for _ in range(3):
+            pm.send_reply(pm.receive_blocking() + 1)
+            time.sleep(0.3) # next task
+    rm.send_request_multiple([6, 7, 8])
+    start = time.monotonic()
+    t = threading.Thread(target=work)
+    t.start()
+    assert(rm.receive_blocking() == 7 and time.monotonic() - start < 0.2)
+    t.join()
+    assert(list(rm.receive_remaining()) == [8, 9])
+    
+    # one timer thread serves every batch and stops on close
+    threads = threading.active_count()
+    for v in range(5):
+        rm.send_request(v)
+        pm.send_reply(pm.receive_blocking())
+        assert(rm.receive_blocking() == v)
+    assert(threading.active_count() == threads)
+    pm.close()
+    assert(threading.active_count() == threads - 1)
+
+
+def test_out_of_band():
+    import numpy as np
+    pm, rm = coproc.PriorityMessenger.new_pair(out_of_band=True, out_of_band_min_bytes=1024)
+    
+    arr = np.arange(1000, dtype=np.float64).reshape(10, 100)
+    rm.send_request(arr)
+    assert(pm.available() == 1)
+    recv = pm.receive_blocking()
+    assert(isinstance(recv, np.ndarray))
+    assert((recv == arr).all())
+    recv[0,0] = -1 # receiver owns writable memory
+    
+    # large bytes go out-of-band, small ones in the pickle
+    payloads = [bytes(range(256))*20, b'small', bytearray(b'x'*5000), [arr, b'y'*2000]]
+    pm.send_reply(payloads[0])
+    pm.send_norequest(payloads[1])
+    pm.send_norequest(payloads[2])
+    pm.send_norequest(payloads[3])
+    recvd = rm.receive_available()
+    assert(recvd[:3] == payloads[:3])
+    assert((recvd[3][0] == arr).all() and recvd[3][1] == payloads[3][1])
+    assert(rm.remaining() == 0)
+    
+    rm.send_close_request()
+    try:
+        pm.receive_blocking()
+        raise Exception('should not have gotten here')
+    except coproc.ResourceRequestedClose:
+        pass
+
+
+def test_messenger_selector():
+    pairs = [coproc.PriorityMessenger.new_pair() for _ in range(3)]
+    selector = coproc.MessengerSelector([rm for pm, rm in pairs])
+    
+    start = time.time()
+    assert(selector.select(timeout=0.05) == [])
+    assert(time.time() - start >= 0.05)
+    
+    pairs[1][0].send_norequest('a')
+    pairs[2][0].send_norequest('b', channel_id='other')
+    ready = selector.select(timeout=1)
+    assert(ready == [pairs[1][1], pairs[2][1]])
+    assert(ready[0].receive_blocking() == 'a')
+    
+    # queued messages count as ready only on their channel
+    ready[1].available(channel_id='other')
+    assert(selector.select(timeout=0) == [])
+    assert(selector.select(timeout=0, channel_id='other') == [pairs[2][1]])
+    
+    # timeout on a single messenger
+    pm, rm = pairs[0]
+    try:
+        rm.receive_blocking(timeout=0.01)
+        raise Exception('should not have gotten here')
+    except TimeoutError:
+        pass
+    pm.send_norequest('c')
+    assert(rm.receive_blocking(timeout=1) == 'c')
+    
+    # shared memory connections are polled
+    pm, rm = coproc.PriorityMessenger.new_pair(transport='shared_memory')
+    selector = coproc.MessengerSelector([rm])
+    assert(selector.select(timeout=0.01) == [])
+    pm.send_norequest('d')
+    assert(selector.select(timeout=1) == [rm])
+    try:
+        rm.receive_blocking(timeout=0.01, channel_id='other')
+        raise Exception('should not have gotten here')
+    except TimeoutError:
+        pass
+
+def test_flow_control():
+    pm, rm = coproc.PriorityMessenger.new_pair(flow_control_window=4)
+    assert(rm.credits() == 4 and not rm.would_block())
+    for i in range(4):
+        assert(rm.try_send_request(i))
+    assert(rm.would_block() and not rm.try_send_request(4))
+    assert(not rm.would_block(channel_id='other')) # credits are per channel
+    
+    # credit is returned in half windows as the peer consumes requests
+    assert(pm.receive_blocking() == 0)
+    assert(rm.would_block())
+    assert(pm.receive_blocking() == 1)
+    assert(rm.credits() == 0 and not rm.would_block() and rm.credits() == 2)
+    
+    # replies do not need credit
+    pm.send_reply_multiple(list(range(10)))
+    assert(pm.credits() == 4)
+    assert(len(rm.receive_available()) == 10)
+    
+    # blocking sends wait for credit while the peer consumes
+    pm, rm = coproc.PriorityMessenger.new_pair(flow_control_window=4)
+    thread = threading.Thread(target=lambda: [pm.receive_blocking() for _ in range(100)])
+    thread.start()
+    rm.send_request_multiple(range(50))
+    [rm.send_request(i) for i in range(50)]
+    thread.join()
+    assert(rm.requests_sent() == 100)
+    
+    with coproc.Pool(2, messenger_kwargs=dict(flow_control_window=2)) as p:
+        assert(p.map(square, range(50)) == [v**2 for v in range(50)])
+    
+    try:
+        coproc.PriorityMessenger.new_pair(flow_control_window=0)[0].send_request(1)
+        raise Exception('should not have gotten here')
+    except ValueError:
+        pass
+
+def square(x):
+    return x**2
+
+def test_background_send():
+    pm, rm = coproc.PriorityMessenger.new_pair(background_send=True)
+    big = b'x' * 10_000_000
+    rm.send_request(big) # returns before the peer reads it
+    rm.send_request_multiple(range(100))
+    assert(rm.pending_sends() > 0)
+    assert(pm.receive_blocking() == big)
+    assert(list(pm.receive_available()) == list(range(100)))
+    rm.flush()
+    assert(rm.pending_sends() == 0)
+    
+    # errors from the writer thread are raised on the next send or flush
+    pm.pipe.close()
+    rm.send_request(big)
+    try:
+        rm.flush()
+        raise Exception('should not have gotten here')
+    except BrokenPipeError:
+        pass
+    
+    with coproc.Pool(2, messenger_kwargs=dict(background_send=True)) as p:
+        assert(p.map(square, range(50)) == [v**2 for v in range(50)])
+    
+    # close sends what is queued and stops the writer thread; dropped messengers stop theirs
+    threads = threading.active_count()
+    for kwargs in (dict(background_send=True), dict(send_priority=True)):
+        pm, rm = coproc.PriorityMessenger.new_pair(drain_max_messages=0, **kwargs)
+        rm.send_request_multiple(range(100))
+        rm.close()
+        rm.close()
+        assert([pm.receive_blocking() for _ in range(100)] == list(range(100)))
+        for _ in range(50):
+            pm, rm = coproc.PriorityMessenger.new_pair(**kwargs)
+            rm.send_norequest(0)
+    del pm, rm
+    gc.collect() # messengers in reference cycles are freed by the collector
+    deadline = time.monotonic() + 5
+    while threading.active_count() > threads and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert(threading.active_count() <= threads)
+
+def test_metrics():
+    pm, rm = coproc.PriorityMessenger.new_pair()
+    rm.send_request_multiple(range(10), channel_id='a')
+    rm.send_norequest(b'x' * 1000, channel_id='b')
+    assert(pm.available(channel_id='a') == 10) # read into queue
+    time.sleep(0.01)
+    assert(pm.receive_available(channel_id='a') == list(range(10)))
+    pm.send_reply_multiple(range(10), channel_id='a')
+    list(rm.receive_remaining(channel_id='a'))
+    
+    sent, received = rm.metrics(), pm.metrics()
+    assert(set(sent) == {'a', 'b'} and set(received) == {'a', 'b'})
+    assert(sent['b'].bytes_sent > 1000 and sent['b'].bytes_sent == received['b'].bytes_received)
+    assert(sent['a'].requests_sent == 10 and sent['a'].replies_received == 10)
+    assert(sent['a'].serialize_seconds > 0 and received['a'].deserialize_seconds > 0)
+    assert(sent['a'].round_trip.count == 10 and sent['a'].round_trip.p50 >= 0.01)
+    assert(received['a'].queue_age.count == 10 and received['a'].queue_age.p99 >= 0.01)
+    assert(received['b'].queue_age.count == 0) # not popped yet
+    
+    hist = coproc.messenger.requestctr.LatencyHistogram()
+    for ms in range(1, 101):
+        hist.add(ms / 1000)
+    stats = hist.stats()
+    assert(stats.count == 100 and abs(stats.mean - 0.0505) < 1e-9 and stats.max == 0.1)
+    for q, p in ((50, stats.p50), (95, stats.p95), (99, stats.p99)):
+        assert(abs(p - q / 1000) / (q / 1000) < 0.1)
+
+def test_request_futures():
+    pm, rm = coproc.PriorityMessenger.new_pair()
+    futures = [rm.send_request_future(i) for i in range(5)]
+    assert(len({f.request_id for f in futures}) == 5)
+    requests = pm.receive_available_messages()
+    for m in reversed(requests): # reply out of order
+        pm.send_reply(m.payload * 10, request_id=m.request_id)
+    assert([f.result() for f in futures] == [i * 10 for i in range(5)])
+    assert(rm.remaining() == 0 and rm.queue_size() == 0)
+    
+    # replies without explicit ids answer the oldest received request
+    futures = [rm.send_request_future(i, channel_id='c') for i in range(3)]
+    pm.reply_batch_size, pm.reply_batch_latency = 10, 60
+    for m in pm.receive_available_messages(channel_id='c'):
+        pm.send_reply(m.payload + 1, channel_id='c')
+    try:
+        futures[0].result(timeout=0.01) # coalesced replies have not been sent
+        raise Exception('should not have gotten here')
+    except TimeoutError:
+        pass
+    pm.flush()
+    assert([f.result(timeout=1) for f in futures] == [1, 2, 3])
+    
+    # replies to plain requests are still queued
+    pm.reply_batch_size = None
+    rid = rm.send_request('plain')
+    pm.send_reply(pm.receive_blocking())
+    msg = rm.receive_message_blocking()
+    assert(msg.payload == 'plain' and msg.request_id == rid)
+    
+    with coproc.WorkerResource(reverse_echo_process) as w:
+        futures = [w.messenger.send_request_future(i) for i in range(20)]
+        assert([f.result() for f in reversed(futures)] == list(reversed(range(20))))
+
+def reverse_echo_process(messenger: coproc.PriorityMessenger):
+    '''Replies to every waiting request, newest first.'''
+    while True:
+        msgs = [messenger.receive_message_blocking()] + messenger.receive_available_messages()
+        for m in reversed(msgs):
+            messenger.send_reply(m.payload, request_id=m.request_id)
+
+
+def test_wire_messages():
+    from coproc.messenger.messages import message_from_wire
+    msgs = [
+        coproc.DataMessage(payload=TestClassLesser('a'), request_reply=True, is_reply=False, channel_id='c'),
+        coproc.DataMessage(payload=[1, 2], request_reply=False, is_reply=True, channel_id=None),
+        coproc.DataMessage(payload=Job('a', deadline=1.5), request_reply=False, is_reply=False, channel_id=None),
+        coproc.CloseRequestMessage(),
+        coproc.BatchMessage(payloads=[1, 2, 3], request_reply=True, is_reply=False, channel_id=0),
+    ]
+    for m in msgs:
+        assert(message_from_wire(m.to_wire()) == m)
+        assert(not hasattr(m, '__dict__'))
+    assert(msgs[0].priority == float('inf'))
+    assert(coproc.DataMessage(payload=coproc.CloseRequestMessage(), request_reply=False, is_reply=False, channel_id=None).priority == float('-inf'))
+    
+    err = message_from_wire(coproc.EncounteredErrorMessage(ValueError('x')).to_wire())
+    assert(isinstance(err.exception, ValueError))
+    
+    try:
+        message_from_wire((100,))
+        raise Exception('should not have gotten here')
+    except coproc.MessageNotRecognizedError:
+        pass
+
+
 if __name__ == '__main__':
     test_messenger()
     test_priority_messenger()
+    test_queue_disciplines()
+    test_any_channel()
+    test_spill()
+    test_drain_policy()
+    test_send_priority()
+    test_control_lane()
+    test_cancel()
+    test_heartbeats()
+    test_streams()
+    test_dedup()
+    test_batch_messages()
+    test_out_of_band()
+    test_messenger_selector()
+    test_flow_control()
+    test_background_send()
+    test_metrics()
+    test_request_futures()
+    test_wire_messages()
     
     
\ No newline at end of file
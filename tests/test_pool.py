@@ -34,8 +34,32 @@ def test_lazy_pool():
     results = set(p.map_unordered(wait_square, vs))
     assert(vsq == results)
 
+def test_pool_cancel():
+    vs = list(range(20))
+    with coproc.Pool(2) as p:
+        results = p.map_unordered(wait_square, vs)
+        next(results)
+        results.close()
+        del results # closing the generator cancels the requests still in flight
+        for w in p:
+            assert(w.messenger.remaining() == 0)
+        assert(p.map(square, vs) == [v**2 for v in vs])
+
+def slow_square(x):
+    time.sleep(0.5)
+    return x**2
+
+def test_pool_heartbeats():
+    '''Workers keep sending heartbeats while running tasks longer than the peer waits.'''
+    vs = list(range(4))
+    with coproc.Pool(2, messenger_kwargs=dict(heartbeat_interval=0.05, heartbeat_misses=3)) as p:
+        assert(p.map(slow_square, vs) == [v**2 for v in vs])
+        assert(p.map(square, vs) == [v**2 for v in vs])
+
 if __name__ == '__main__':
     test_lazy_pool()
+    test_pool_cancel()
+    test_pool_heartbeats()
 
 
 
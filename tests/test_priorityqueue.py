@@ -2,6 +2,8 @@
 import typing
 import queue
 import dataclasses
+import random
+import time
 
 import sys
 sys.path.append('..')
@@ -11,8 +13,8 @@ import coproc
 class Item:
     priority: int = 0
 
-def assert_devin(items: typing.List[Item]):
-    q = coproc.PriorityQueue()
+def assert_devin(items: typing.List[Item], queue_type: typing.Type = coproc.PriorityQueue):
+    q = queue_type()
     for i in items:
         q.put(i, i.priority)
     assert([q.get() for _ in range(q.size())] == list(sorted(items)))
@@ -25,7 +27,67 @@ def test_priorityqueue():
 
     # MAKE SURE DEVIN IS WORKING WELL!!
     assert_devin(all_tests)
+    assert_devin(all_tests, coproc.HeapPriorityQueue)
 
+def test_heappriorityqueue():
+    # continuous priorities, FIFO within a level
+    items = [Item(random.random()) for _ in range(1000)] + [Item(0.5) for _ in range(100)]
+    random.shuffle(items)
+    assert_devin(items, coproc.HeapPriorityQueue)
+    
+    q = coproc.HeapPriorityQueue()
+    same = [Item(1) for _ in range(10)]
+    for i in same:
+        q.put(i, 1)
+    q.put('first', float('-inf'))
+    assert(q.peek_priority() == float('-inf') and q.get() == 'first')
+    assert(all(q.get() is i for i in same))
+    
+    # empty levels are removed
+    for t in range(1000):
+        q.put(t, time.monotonic())
+        q.get()
+    assert(q.empty() and len(q.levels) == 0 and len(q.heap) == 0 and q.peek_priority() is None)
+    try:
+        q.get()
+        raise Exception('should not have gotten here')
+    except IndexError:
+        pass
+
+@dataclasses.dataclass
+class FakeClock:
+    t: float = 0.0
+    def __call__(self) -> float:
+        return self.t
+
+def test_queue_disciplines():
+    # aging: an old low-priority item eventually beats new high-priority ones
+    clock = FakeClock()
+    q = coproc.AgingPriorityQueue(aging_rate=1.0, clock=clock)
+    q.put('batch', 10)
+    q.put('unprioritized', float('inf')) # ages from default_priority
+    for t in range(20):
+        clock.t = t
+        q.put(f'urgent{t}', 0)
+    assert([q.get() for _ in range(3)] == ['unprioritized', 'urgent0', 'urgent1'])
+    assert(q.get() == 'urgent2' and 'batch' in [q.get() for _ in range(10)])
+    
+    # edf: soonest deadline first, priority breaks ties, no deadline goes last
+    clock = FakeClock()
+    q = coproc.DeadlineQueue(clock=clock)
+    q.put('none', 0)
+    q.put('late', 5, deadline=10)
+    clock.t = 5
+    q.put('early', 5, deadline=1)
+    q.put('tie_low', 1, deadline=5)
+    q.put('tie_high', 0, deadline=5)
+    assert([q.get() for _ in range(5)] == ['early', 'tie_high', 'tie_low', 'late', 'none'])
+    
+    q = coproc.DeadlineQueue(default_deadline=1, clock=clock)
+    q.put('default', 0)
+    q.put('later', 0, deadline=2)
+    assert(q.get() == 'default')
+    
 def test_multi():
     test1 = [Item(1) for _ in range(100)]
     test2 = [Item(i) for i in range(100)]
@@ -49,8 +111,53 @@ def test_multi():
             assert(mpq.get(chan) == t)
             
 
+def test_spilling_multiqueue():
+    q = coproc.SpillingMultiQueue(max_items=5)
+    for i in range(20):
+        q.put(('a', i), 'a')
+        q.put(('b', i), 'b')
+    assert(q.in_memory == 5 and q.spilled_size() == 35 and q.spilled_items == 35)
+    assert(q.size('a') == 20 and q.size(coproc.ANY_CHANNEL) == 40)
+    
+    # channels stay FIFO across memory and disk, and puts keep order after draining
+    assert([q.get('a') for _ in range(10)] == [('a', i) for i in range(10)])
+    q.put(('a', 20), 'a')
+    assert(q.peek('b') == ('b', 0))
+    assert([q.get('a') for _ in range(11)] == [('a', i) for i in range(10, 21)])
+    assert(q.empty('a') and q.nonempty_channels() == ['b'])
+    assert([q.get('b') for _ in range(20)] == [('b', i) for i in range(20)])
+    
+    # spill file is reused once drained
+    assert(q.empty(coproc.ANY_CHANNEL) and q.spilled_size() == 0 and q._end == 0)
+    try:
+        q.get('b')
+        raise Exception('should not have gotten here')
+    except IndexError:
+        pass
+    
+    # items that cannot be spilled wait in memory in their place in line
+    for i in range(10):
+        q.put(('c', i), 'c', spill=i % 3 != 0)
+    assert(q.in_memory == 7 and q.spilled_size('c') == 3 and q.size('c') == 10)
+    assert(q.remove('c', lambda item: item[1] in (6, 7)) == [('c', 6), ('c', 7)])
+    assert(q.in_memory == 6 and q.spilled_size('c') == 2)
+    assert([q.get('c') for _ in range(8)] == [('c', i) for i in (0, 1, 2, 3, 4, 5, 8, 9)])
+    assert(q.in_memory == 0 and q.spilled_size() == 0)
+    
+    # a byte budget spills by the sizes given to put
+    q = coproc.SpillingMultiQueue(max_items=None, max_bytes=1000)
+    for i in range(10):
+        q.put(i, 'a', nbytes=300)
+    q.put('small', 'b', nbytes=100)
+    q.put('large', 'c', nbytes=2000)
+    assert(q.in_memory == 4 and q.in_memory_bytes == 1000 and q.spilled_size() == 8)
+    assert([q.get('a') for _ in range(10)] == list(range(10)) and q.get('b') == 'small' and q.get('c') == 'large')
+    assert(q.in_memory == 0 and q.in_memory_bytes == 0 and q.spilled_size() == 0)
 
 if __name__ == '__main__':
     test_priorityqueue()
+    test_heappriorityqueue()
+    test_queue_disciplines()
     test_multi()
+    test_spilling_multiqueue()
 
@@ -0,0 +1,115 @@
+import threading
+import gc
+import time
+import typing
+import os
+
+import sys
+sys.path.append('..')
+import coproc
+
+
+def channel_echo_process(messenger: coproc.ThreadSafePriorityMessenger):
+    '''Replies to every request on the channel it arrived on.'''
+    while True:
+        msg = messenger.receive_message_blocking(coproc.ANY_CHANNEL)
+        messenger.send_reply((os.getpid(), msg.payload), channel_id=msg.channel_id, request_id=msg.request_id)
+
+def run_threads(n: int, target: typing.Callable[[int], None]) -> None:
+    '''Run target(i) in n threads and re-raise the first error.'''
+    errors = list()
+    def run(i):
+        try:
+            target(i)
+        except BaseException as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    if len(errors):
+        raise errors[0]
+
+def test_threadsafe_messenger_pair():
+    pm, rm = coproc.ThreadSafePriorityMessenger.new_pair(flow_control_window=8)
+
+    # threads sharing a channel each get different messages
+    received = list()
+    def consume(i):
+        for _ in range(100):
+            received.append(pm.receive_blocking(timeout=10))
+    consumers = threading.Thread(target=lambda: run_threads(4, consume))
+    consumers.start()
+    run_threads(4, lambda i: [rm.send_norequest((i, k)) for k in range(100)])
+    consumers.join()
+    assert(sorted(received) == sorted((i, k) for i in range(4) for k in range(100)))
+
+    # threads waiting on their own channel are woken only by its messages
+    def request(i):
+        for k in range(50):
+            rm.send_request(k, channel_id=i)
+            assert(rm.receive_blocking(channel_id=i, timeout=10) == -k)
+    def reply(i):
+        for _ in range(50):
+            msg = pm.receive_message_blocking(channel_id=i, timeout=10)
+            pm.send_reply(-msg.payload, channel_id=i, request_id=msg.request_id)
+    run_threads(8, lambda i: request(i) if i < 4 else reply(i - 4))
+    assert(rm.remaining(coproc.ANY_CHANNEL) == 0 and pm.queue_size(coproc.ANY_CHANNEL) == 0)
+
+    try:
+        rm.receive_blocking(timeout=0.05)
+        raise Exception('should not have gotten here')
+    except TimeoutError:
+        pass
+
+    # a close request wakes every waiting thread and is raised by every later call
+    closed = list()
+    def wait_closed(i):
+        try:
+            pm.receive_blocking(channel_id=i)
+        except coproc.ResourceRequestedClose:
+            closed.append(i)
+    waiting = threading.Thread(target=lambda: run_threads(3, wait_closed))
+    waiting.start()
+    time.sleep(0.05)
+    rm.send_close_request()
+    waiting.join(10)
+    assert(sorted(closed) == [0, 1, 2])
+    try:
+        pm.available()
+        raise Exception('should not have gotten here')
+    except coproc.ResourceRequestedClose:
+        pass
+
+    # close stops the reader and writer threads, and so does dropping the messengers
+    threads = threading.active_count()
+    for close in (True, False):
+        pm, rm = coproc.ThreadSafePriorityMessenger.new_pair()
+        rm.send_request('x')
+        assert(pm.receive_blocking(timeout=10) == 'x')
+        if close:
+            pm.close()
+            rm.close()
+            assert(threading.active_count() <= threads)
+    del pm, rm
+    gc.collect() # messengers in reference cycles are freed by the collector
+    deadline = time.monotonic() + 5
+    while threading.active_count() > threads and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert(threading.active_count() <= threads)
+
+def test_threadsafe_messenger_worker():
+    for method in ('fork', 'spawn'):
+        with coproc.WorkerResource(channel_echo_process, method=method, messenger_type=coproc.ThreadSafePriorityMessenger) as w:
+            def request(i):
+                for k in range(20):
+                    if k % 2:
+                        assert(w.messenger.send_request_future((i, k)).result(timeout=10)[1] == (i, k))
+                    else:
+                        w.messenger.send_request((i, k), channel_id=i)
+                        assert(w.messenger.receive_blocking(channel_id=i, timeout=10)[1] == (i, k))
+            run_threads(8, request)
+            assert(w.messenger.remaining(coproc.ANY_CHANNEL) == 0)
+
+if __name__ == '__main__':
+    test_threadsafe_messenger_pair()
+    test_threadsafe_messenger_worker()
@@ -0,0 +1,175 @@
+import threading
+import time
+import typing
+import os
+import dataclasses
+import tempfile
+import multiprocessing
+
+import sys
+sys.path.append('..')
+import coproc
+from coproc.messenger.transport import SharedMemoryConnection
+
+
+def test_shared_memory_connection():
+    a, b = SharedMemoryConnection.pair(capacity=1024)
+    assert(not a.poll())
+    assert(not b.poll(0.01))
+
+    a.send('hello')
+    assert(b.poll())
+    assert(b.recv() == 'hello')
+    b.send_bytes(b'0123456789', 2, 5)
+    assert(a.recv_bytes() == b'23456')
+
+    # messages much larger than the ring wrap around while the reader drains
+    big = os.urandom(100_000)
+    t = threading.Thread(target=lambda: a.send_bytes(big))
+    t.start()
+    buf = bytearray(len(big) + 10)
+    assert(b.recv_bytes_into(buf, 10) == len(big))
+    t.join()
+    assert(bytes(buf[10:]) == big)
+
+    # many small messages
+    for i in range(500):
+        a.send(i)
+        assert(b.recv() == i)
+
+    # closing one end gives EOF on the other after remaining data
+    a.send('last')
+    a.close()
+    assert(b.recv() == 'last')
+    try:
+        b.recv()
+        raise Exception('should not have gotten here')
+    except EOFError:
+        pass
+    try:
+        b.send('x')
+        raise Exception('should not have gotten here')
+    except BrokenPipeError:
+        pass
+    b.close()
+
+def test_shared_memory_messenger():
+    pm, rm = coproc.PriorityMessenger.new_pair(transport='shared_memory')
+    vs = list(range(10))
+    rm.send_request_multiple(vs)
+    assert(pm.available() == len(vs))
+    assert(pm.receive_available() == vs)
+    [pm.send_reply(v) for v in vs]
+    assert(list(rm.receive_remaining()) == vs)
+
+    rm.send_close_request()
+    try:
+        pm.receive_blocking()
+        raise Exception('should not have gotten here')
+    except coproc.ResourceRequestedClose:
+        pass
+
+def echo_process(messenger: coproc.PriorityMessenger):
+    '''Process that sends back the same data it receives.'''
+    while True:
+        data_msg = messenger.receive_message_blocking()
+        messenger.send_reply(data_msg.payload)
+
+def square(x):
+    return x**2
+
+def test_shared_memory_workers():
+    for method in ('fork', 'spawn'):
+        w = coproc.WorkerResource(echo_process, method=method, messenger_kwargs=dict(transport='shared_memory'))
+        with w:
+            vs = list(range(100))
+            w.messenger.send_request_multiple(vs)
+            assert(list(w.messenger.receive_remaining()) == vs)
+            w.messenger.send_request(b'x'*3_000_000)
+            assert(w.messenger.receive_blocking() == b'x'*3_000_000)
+
+    vs = list(range(50))
+    with coproc.Pool(3, messenger_kwargs=dict(transport='shared_memory')) as p:
+        assert(p.map(square, vs) == [v**2 for v in vs])
+
+    p = coproc.LazyPool(3, messenger_kwargs=dict(transport='shared_memory'))
+    assert(p.map(square, vs, chunksize=4) == [v**2 for v in vs])
+
+@dataclasses.dataclass
+class Task:
+    name: str
+    priority: float = float('inf')
+
+def socket_echo_process(address, authkey):
+    '''Independent process that connects to the host and echoes requests until asked to close.'''
+    messenger = coproc.PriorityMessenger.connect(address, authkey=authkey, control_lane=True)
+    try:
+        while True:
+            msg = messenger.receive_message_blocking(coproc.ANY_CHANNEL)
+            messenger.send_reply((os.getpid(), msg.payload), channel_id=msg.channel_id)
+    except coproc.ResourceRequestedClose:
+        pass
+
+def test_socket_messenger():
+    try: # pickles would run code from anyone who can reach the port
+        coproc.SocketListener(('127.0.0.1', 0))
+        raise Exception('should not have gotten here')
+    except ValueError:
+        pass
+    
+    # tcp on loopback: same priority and channel semantics as a pipe
+    with coproc.SocketListener(('127.0.0.1', 0), authkey=b'secret') as listener:
+        connected = list()
+        t = threading.Thread(target=lambda: connected.append(coproc.PriorityMessenger.connect(listener.address, authkey=b'secret')))
+        t.start()
+        host = coproc.PriorityMessenger.accept(listener)
+        t.join()
+        client = connected[0]
+        
+        tasks = [Task('low', 3), Task('high', 1), Task('mid', 2)]
+        client.send_request_multiple(tasks)
+        client.send_norequest('other', channel_id='b')
+        assert(host.available() == 3 and host.available('b') == 1)
+        assert([t.name for t in host.receive_available()] == ['high', 'mid', 'low'])
+        assert(host.receive_blocking('b') == 'other')
+        host.send_reply_multiple(['a', 'b', 'c'])
+        assert(list(client.receive_remaining()) == ['a', 'b', 'c'])
+    
+    # a wrong authkey is refused and the listener keeps accepting
+    with coproc.SocketListener(('127.0.0.1', 0), authkey=b'secret') as listener:
+        accepted = list()
+        t = threading.Thread(target=lambda: accepted.append(coproc.PriorityMessenger.accept(listener)))
+        t.start()
+        try:
+            coproc.PriorityMessenger.connect(listener.address, authkey=b'wrong')
+            raise Exception('should not have gotten here')
+        except multiprocessing.AuthenticationError:
+            pass
+        client = coproc.PriorityMessenger.connect(listener.address, authkey=b'secret')
+        t.join()
+        client.send_norequest('hi')
+        assert(accepted[0].receive_blocking() == 'hi')
+    
+    # unix domain socket to independent processes, each with a control lane
+    with tempfile.TemporaryDirectory() as tmp:
+        with coproc.SocketListener(os.path.join(tmp, 'host.sock')) as listener:
+            ctx = multiprocessing.get_context('spawn')
+            procs = [ctx.Process(target=socket_echo_process, args=(listener.address, None)) for _ in range(2)]
+            [p.start() for p in procs]
+            workers = [coproc.PriorityMessenger.accept(listener) for _ in procs]
+            for m in workers:
+                assert(m.control_pipe is not None)
+                m.send_request_multiple(range(5))
+                m.send_request('ping', channel_id='ctl')
+            assert(sorted(w.receive_blocking('ctl')[0] for w in workers) == sorted(p.pid for p in procs))
+            assert(sorted(v for w in workers for _, v in w.receive_remaining()) == sorted(list(range(5)) * 2))
+            for m in workers:
+                m.send_close_request()
+            [p.join(10) for p in procs]
+            assert(all(p.exitcode == 0 for p in procs))
+
+if __name__ == '__main__':
+    test_shared_memory_connection()
+    test_shared_memory_messenger()
+    test_shared_memory_workers()
+    test_socket_messenger()